@@ -0,0 +1,6 @@
+"""
+热点路径微基准：标签生成、用户偏好更新/衰减、偏好排序、搜索、协同过滤构建
+
+    python -m benchmarks --sizes 200,1000,5000 --output bench.json
+    python -m benchmarks --compare bench.json
+"""
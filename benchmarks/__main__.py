@@ -0,0 +1,150 @@
+# benchmarks/__main__.py
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks',
+                                     description='Time tagging, preference and ranking hot paths on SQLite')
+    parser.add_argument('--sizes', default='200,1000,5000',
+                        help='Comma-separated product counts to generate (users = products / 5)')
+    parser.add_argument('--repeat', type=int, default=5, help='Timed runs per case (median is reported)')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the synthetic data generator')
+    parser.add_argument('--only', default=None, help='Run only cases whose name contains this substring')
+    parser.add_argument('--output', default=None, help='Write results as JSON to this path')
+    parser.add_argument('--compare', default=None, help='Baseline JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='Relative slowdown of the median that counts as a regression')
+    args = parser.parse_args(argv)
+    try:
+        args.sizes = [int(size) for size in args.sizes.split(',') if size]
+    except ValueError:
+        parser.error('--sizes must be comma-separated integers')
+    if not args.sizes or min(args.sizes) < 1 or args.repeat < 1:
+        parser.error('--sizes and --repeat must be positive')
+    return args
+
+
+def setup_django():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+    import django
+    django.setup()
+
+    import jieba
+    import logging
+    jieba.setLogLevel(logging.WARNING)
+
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0, interactive=False)
+
+
+def measure(func, repeat):
+    func()  # 预热：jieba词典、查询编译、缓存
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def run(args):
+    from django.core.management import call_command
+    from benchmarks import cases, data
+
+    results = []
+    for size in args.sizes:
+        call_command('flush', verbosity=0, interactive=False)
+        started = time.perf_counter()
+        dataset = data.generate(size, args.seed)
+        print(f'size={size}: generated in {time.perf_counter() - started:.1f}s', file=sys.stderr)
+
+        for name, factory in cases.CASES.items():
+            if args.only and args.only not in name:
+                continue
+            func, ops = factory(dataset)
+            timings = measure(func, args.repeat)
+            median = statistics.median(timings)
+            results.append({
+                'name': name,
+                'size': size,
+                'ops': ops,
+                'repeat': args.repeat,
+                'median_s': median,
+                'min_s': min(timings),
+                'per_op_ms': median / ops * 1000,
+            })
+            print(f'  {name:<34} {median / ops * 1000:10.3f} ms/op  ({ops} ops, median of {args.repeat})',
+                  file=sys.stderr)
+    return results
+
+
+def environment():
+    import django
+    import sqlite3
+    return {
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'machine': platform.machine(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+
+def compare(results, baseline, threshold):
+    """
+    与基线按 (用例, 规模) 对比每次操作的中位耗时
+    :return: 变慢超过阈值的条目列表
+    """
+    previous = {(row['name'], row['size']): row for row in baseline['results']}
+    regressions = []
+    print(f"\n{'case':<34} {'size':>6} {'baseline':>10} {'current':>10} {'change':>8}")
+    for row in results:
+        base = previous.get((row['name'], row['size']))
+        if base is None:
+            print(f"{row['name']:<34} {row['size']:>6} {'-':>10} {row['per_op_ms']:10.3f}      new")
+            continue
+        ratio = row['per_op_ms'] / base['per_op_ms'] if base['per_op_ms'] else 1.0
+        flag = ''
+        if ratio > 1 + threshold:
+            flag = '  REGRESSION'
+            regressions.append(row)
+        elif ratio < 1 - threshold:
+            flag = '  faster'
+        print(f"{row['name']:<34} {row['size']:>6} {base['per_op_ms']:10.3f} {row['per_op_ms']:10.3f} "
+              f"{(ratio - 1) * 100:+7.1f}%{flag}")
+    return regressions
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    setup_django()
+    results = run(args)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'environment': environment(), 'seed': args.seed, 'results': results},
+                      f, ensure_ascii=False, indent=2)
+        print(f'Results written to {args.output}', file=sys.stderr)
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f'\n{len(regressions)} case(s) slower than baseline by more than {args.threshold:.0%}')
+            return 1
+        print('\nNo regressions')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,178 @@
+# benchmarks/cases.py
+"""
+基准用例：每个用例接收生成的数据集，返回 (待计时的无参函数, 每次调用包含的操作数)
+计时结果按每次操作的耗时报告，便于不同规模之间对比
+"""
+from django.core.cache import cache
+from django.db.models import Case, F, FilteredRelation, FloatField, Q, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from product_management.models import Product, UserPreference
+from product_management.services import item_cf, search_index
+from product_management.services.ranking import recommend_page
+from product_management.services.scoring_engine import scoring_engine
+from product_management.services.tag_service import tag_service
+
+SAMPLE = 100  # 逐条操作的用例每轮执行的次数
+PAGE_SIZE = 20
+
+CASES = {}
+
+
+def case(name):
+    def register(func):
+        CASES[name] = func
+        return func
+    return register
+
+
+def _sample(items, n=SAMPLE):
+    step = max(len(items) // n, 1)
+    return items[::step][:n]
+
+
+@case('tagging.generate_tags')
+def generate_tags(data):
+    descriptions = _sample(data['descriptions'])
+
+    def run():
+        for text in descriptions:
+            tag_service.generate_tags(text)
+    return run, len(descriptions)
+
+
+@case('tagging.generate_tags_many')
+def generate_tags_many(data):
+    descriptions = data['descriptions']
+
+    def run():
+        tag_service.generate_tags_many(descriptions)
+    return run, len(descriptions)
+
+
+@case('preference.update_preferences')
+def update_preferences(data):
+    prefs = list(UserPreference.objects.filter(user__in=_sample(data['users'])))
+    tags = [product.tags for product in _sample(data['products'], len(prefs))]
+
+    def run():
+        for pref, product_tags in zip(prefs, tags):
+            pref.update_preferences(product_tags)
+    return run, len(prefs)
+
+
+@case('preference.decay_and_limit')
+def decay_and_limit(data):
+    prefs = list(UserPreference.objects.filter(user__in=_sample(data['users'])))
+    now = timezone.now()
+
+    def run():
+        for pref in prefs:
+            pref._apply_decay(now)
+            pref._limit_tags(now)
+    return run, len(prefs)
+
+
+@case('preference.top_preferences')
+def top_preferences(data):
+    prefs = list(UserPreference.objects.filter(user__in=_sample(data['users'])))
+
+    def run():
+        for pref in prefs:
+            pref.get_top_preferences()
+    return run, len(prefs)
+
+
+def _rank_by_preferences(products, tag_weights):
+    """
+    按用户偏好标签在数据库中为商品打分并排序（评分引擎之前的实现，作为 ranking.rank_first_page 的对照基线）
+    只连接命中偏好标签的 ProductTag 行（走 (product, tag) 索引），
+    得分 = SUM(商品标签权重 × 用户偏好权重)，未命中的商品得0分
+    :param products: 商品查询集
+    :param tag_weights: [(标签, 偏好权重), ...]
+    """
+    tag_weights = list(tag_weights)
+    if not tag_weights:
+        return products.annotate(match_score=Value(0.0, output_field=FloatField())).order_by('-id')
+
+    preference = Case(
+        *[When(matched_tags__tag=tag, then=Value(float(weight))) for tag, weight in tag_weights],
+        default=Value(0.0),
+        output_field=FloatField(),
+    )
+    return products.annotate(
+        matched_tags=FilteredRelation(
+            'tag_links', condition=Q(tag_links__tag__in=[tag for tag, _ in tag_weights])
+        ),
+    ).annotate(
+        match_score=Coalesce(
+            Sum(F('matched_tags__weight') * preference, output_field=FloatField()),
+            Value(0.0),
+            output_field=FloatField(),
+        ),
+    ).order_by('-match_score', '-id')
+
+
+@case('ranking.rank_first_page')
+def rank_first_page(data):
+    prefs = list(UserPreference.objects.filter(user__in=_sample(data['users'], 20)))
+    weights = [pref.get_top_preferences() for pref in prefs]
+
+    def run():
+        for tag_weights in weights:
+            list(_rank_by_preferences(Product.objects.all(), tag_weights)[:PAGE_SIZE])
+    return run, len(weights)
+
+
+@case('ranking.scoring_engine_rank')
+def scoring_engine_rank(data):
+    prefs = list(UserPreference.objects.filter(user__in=_sample(data['users'], 20)))
+    weights = [pref.get_top_preferences(n=None) for pref in prefs]
+    scoring_engine.reset()
+    scoring_engine.rank([], PAGE_SIZE)  # 构建矩阵不计入耗时
+
+    def run():
+        for tag_weights in weights:
+            scoring_engine.rank(tag_weights, PAGE_SIZE)
+    return run, len(weights)
+
+
+@case('ranking.recommend_page_cold')
+def recommend_page_cold(data):
+    users = _sample(data['users'], 20)
+
+    def run():
+        cache.clear()
+        for user in users:
+            recommend_page(user, PAGE_SIZE)
+    return run, len(users)
+
+
+@case('ranking.recommend_page_cached')
+def recommend_page_cached(data):
+    users = _sample(data['users'], 20)
+    for user in users:
+        recommend_page(user, PAGE_SIZE)
+
+    def run():
+        for user in users:
+            recommend_page(user, PAGE_SIZE)
+    return run, len(users)
+
+
+@case('search.bm25_first_page')
+def bm25_first_page(data):
+    queries = data['queries']
+
+    def run():
+        for query in queries:
+            list(search_index.search(query).order_by('-relevance', '-id')[:PAGE_SIZE])
+    return run, len(queries)
+
+
+@case('item_cf.build')
+def item_cf_build(data):
+    def run():
+        item_cf.build()
+    return run, 1
@@ -0,0 +1,85 @@
+# benchmarks/data.py
+"""确定性的合成数据：同样的 seed 和规模总是生成同样的商品、用户、偏好和订单"""
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.utils import timezone
+
+from product_management.models import Order, OrderItem, Product, ProductTag, UserPreference
+from product_management.services import popularity, search_index
+from product_management.services.tag_service import tag_service
+
+CATEGORIES = {
+    '服装': ['纯棉', 'T恤', '衬衫', '连衣裙', '牛仔裤', '夏季', '透气', '修身', '男装', '女装', '宽松', '休闲'],
+    '数码': ['手机', '智能手机', '耳机', '蓝牙', '充电器', '平板', '高清', '摄像头', '续航', '快充', '5G', '屏幕'],
+    '家居': ['沙发', '床垫', '枕头', '收纳', '实木', '北欧', '简约', '卧室', '客厅', '防滑', '地毯', '台灯'],
+    '食品': ['零食', '坚果', '巧克力', '咖啡', '茶叶', '有机', '进口', '低糖', '礼盒', '饼干', '牛奶', '新鲜'],
+    '运动': ['跑步', '瑜伽', '健身', '篮球', '足球', '运动鞋', '速干', '护膝', '哑铃', '户外', '登山', '骑行'],
+}
+COMMON = ['高品质', '舒适', '时尚', '耐用', '轻便', '正品', '热销', '经典', '新款', '环保']
+FILLERS = ['的', '采用', '适合', '非常', '设计', '日常', '使用', '体验']
+
+
+def description(rng, category):
+    words = rng.sample(CATEGORIES[category], 5) + rng.sample(COMMON, 2) + rng.sample(FILLERS, 2)
+    rng.shuffle(words)
+    return '，'.join(' '.join(words[i:i + 3]) for i in range(0, len(words), 3)) + '。'
+
+
+def generate(size, seed=0):
+    """
+    生成 size 个商品、size // 5 个用户（带偏好）以及每个用户若干已支付订单
+    写入后重建 ProductTag 与搜索索引，和线上数据的读路径一致
+    :return: {'products': [...], 'users': [...], 'descriptions': [...], 'queries': [...]}
+    """
+    rng = random.Random(seed)
+    now = timezone.now()
+    categories = list(CATEGORIES)
+
+    rows = []
+    for i in range(size):
+        category = rng.choice(categories)
+        rows.append((f'{category}{rng.choice(CATEGORIES[category])}{i:05d}', description(rng, category)))
+    descriptions = [desc for _, desc in rows]
+
+    tag_service.init_model(descriptions)
+    tags = tag_service.generate_tags_many(descriptions)
+    products = Product.objects.bulk_create([
+        Product(sku=f'B{i:07d}', name=name, stock=1000, price=Decimal(rng.randint(100, 99900)) / 100,
+                description=desc, tags=tag_list)
+        for i, ((name, desc), tag_list) in enumerate(zip(rows, tags))
+    ], batch_size=1000)
+    ProductTag.rebuild([product.id for product in products])
+
+    all_tags = sorted({tag for tag_list in tags for tag in tag_list})
+    users = User.objects.bulk_create([User(username=f'bench{i:06d}') for i in range(max(size // 5, 1))])
+    UserPreference.objects.bulk_create([
+        UserPreference(user=user, preferred_tags={
+            tag: {'weight': round(rng.uniform(0.2, 5.0), 3),
+                  'last_updated': (now - timedelta(days=rng.uniform(0, 90))).isoformat()}
+            for tag in rng.sample(all_tags, min(len(all_tags), UserPreference.MAX_TAGS))
+        })
+        for user in users
+    ], batch_size=1000)
+
+    orders, lines = [], []
+    for user in users:
+        for _ in range(rng.randint(1, 4)):
+            orders.append(Order(
+                user=user, order_number=f'B{len(orders):010d}', status='paid',
+                total_amount=Decimal('0'), payment_method='alipay',
+                receiver_name='基准', receiver_phone='13800000000', receiver_address='基准地址',
+            ))
+    Order.objects.bulk_create(orders, batch_size=1000)
+    for order in orders:
+        for product in rng.sample(products, rng.randint(1, 5)):
+            lines.append(OrderItem(order=order, product=product, quantity=rng.randint(1, 3), price=product.price))
+    OrderItem.objects.bulk_create(lines, batch_size=1000)
+
+    popularity.rebuild()
+    search_index.rebuild()
+
+    queries = [' '.join(rng.sample(CATEGORIES[rng.choice(categories)] + COMMON, 2)) for _ in range(20)]
+    return {'products': products, 'users': users, 'descriptions': descriptions, 'queries': queries}
@@ -0,0 +1,25 @@
+# benchmarks/settings.py
+# 基准测试专用配置：SQLite（默认内存库）+ 本地内存缓存，不依赖MySQL
+import os
+import tempfile
+
+from test_shop.settings import *  # noqa: F401,F403
+
+DEBUG = False
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ.get('BENCHMARK_DB', ':memory:'),
+    }
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'benchmarks',
+    }
+}
+REQUIRE_SHARED_CACHE = False  # 单进程运行，进程内缓存即可
+
+TAG_MODEL_DIR = os.path.join(tempfile.gettempdir(), 'benchmark_tag_models')
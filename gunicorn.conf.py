@@ -0,0 +1,13 @@
+# gunicorn.conf.py
+# gunicorn test_shop.wsgi -c gunicorn.conf.py
+import os
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'test_shop.settings')
+
+workers = 4
+
+
+def child_exit(server, worker):
+    """worker 退出（正常重启或崩溃）后，把它的指标快照并入 METRICS_DIR/archive.json 并删除快照文件"""
+    from product_management.services import metrics
+    metrics.mark_process_dead(worker.pid)
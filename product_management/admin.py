@@ -1,7 +1,20 @@
 from django.contrib import admin
-from .models import Product, Sale, Restock
+from .models import Product, Sale, Restock, TagKeyword, TagSynonym
 
 # 注册模型
 admin.site.register(Product)
 admin.site.register(Sale)
 admin.site.register(Restock)
+
+
+@admin.register(TagKeyword)
+class TagKeywordAdmin(admin.ModelAdmin):
+    list_display = ('keyword', 'category', 'updated_at')
+    list_filter = ('category',)
+    search_fields = ('keyword',)
+
+
+@admin.register(TagSynonym)
+class TagSynonymAdmin(admin.ModelAdmin):
+    list_display = ('variant', 'canonical', 'updated_at')
+    search_fields = ('variant', 'canonical')
@@ -0,0 +1,124 @@
+# product_management/api_views.py
+"""
+只读JSON接口（移动端与边缘缓存使用）：商品列表、搜索、个性化推荐
+- 只返回卡片字段，查询使用 .values()，不构造模型对象
+- ETag 由缓存中的版本计数和数据库中的变化标记（商品/热度表 MAX(updated_at) 只读索引一端，删除标记按主键读取）算出：
+  缓存丢失或各进程计数不一致时，数据库标记仍保证数据变化后 ETag 随之改变；
+  If-None-Match 命中时返回304，只执行这几条索引查询，不扫描商品表、不读取分页数据
+- 游标分页：响应中的 next_cursor 原样作为下一页的 ?cursor= 参数
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Max
+from django.http import JsonResponse
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition, require_GET
+
+from .models import ChangeMarker, Product, ProductPopularity, UserPreference
+from .services import behavior_events, popularity, recommendation_cache, search_index
+from .services.pagination import KeysetPaginator, page_size_from
+from .services.ranking import recommend_page
+
+CARD_FIELDS = ('id', 'name', 'price', 'stock')
+
+
+def _etag(request, scope, versions):
+    """强ETag：接口 + 版本计数和数据库变化标记 + 规范化后的查询参数"""
+    params = sorted((key, value) for key, value in request.GET.items() if key != 'page_size')
+    payload = json.dumps([scope, versions, params, page_size_from(request)], ensure_ascii=False,
+                         cls=DjangoJSONEncoder)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def _catalog_versions():
+    """
+    缓存版本计数 + 数据库标记：商品的最后修改时间（新增、保存、库存变化、批量导入都会写入）、
+    删除标记（发现删除），热度表的最后修改时间（发现销量变化）
+    """
+    return [
+        recommendation_cache.catalog_version(),
+        recommendation_cache.inventory_version(),
+        recommendation_cache.popularity_version(),
+        Product.objects.aggregate(updated=Max('updated_at'))['updated'],
+        ChangeMarker.version_of(ChangeMarker.PRODUCTS_DELETED),
+        ProductPopularity.objects.aggregate(updated=Max('updated_at'))['updated'],
+    ]
+
+
+def products_etag(request):
+    return _etag(request, 'products', _catalog_versions())
+
+
+def search_etag(request):
+    return _etag(request, 'search', _catalog_versions())
+
+
+def recommendations_etag(request):
+    if not request.user.is_authenticated:
+        return None
+    preference_updated = UserPreference.objects.filter(user=request.user).values_list('updated_at', flat=True).first()
+    versions = _catalog_versions() + [recommendation_cache.preference_version(request.user.id), preference_updated]
+    return _etag(request, f'recommendations:{request.user.id}', versions)
+
+
+def _page_response(page, private=False):
+    response = JsonResponse({'results': list(page.object_list), 'next_cursor': page.next_cursor})
+    # 内容随版本计数变化，缓存方每次都要带 If-None-Match 回源验证
+    max_age = getattr(settings, 'API_CACHE_MAX_AGE', 0)
+    if private:
+        patch_cache_control(response, private=True, max_age=max_age, must_revalidate=True)
+    else:
+        patch_cache_control(response, public=True, max_age=max_age, must_revalidate=True)
+    return response
+
+
+def _popular_page(request):
+    """按近7天销量排序的商品（未登录或没有偏好记录时的默认列表）"""
+    products = popularity.with_sales(Product.objects.all()).values(*CARD_FIELDS, 'sales', 'popularity_pk')
+    page = KeysetPaginator(popularity.SALES_ORDERING, page_size_from(request)).paginate(
+        products, request.GET.get('cursor')
+    )
+    for row in page.object_list:
+        del row['popularity_pk']  # 只用于生成游标，与 id 相同
+    return page
+
+
+@require_GET
+@condition(etag_func=products_etag)
+def api_products(request):
+    """商品列表（与用户无关，可被边缘缓存共享）"""
+    return _page_response(_popular_page(request))
+
+
+@require_GET
+@condition(etag_func=search_etag)
+def api_search(request):
+    """搜索：?q= 查询词，?sort=sales 按近30天销量排序（默认按相关度）"""
+    query = request.GET.get('q', '').strip()
+    if not query:
+        return JsonResponse({'error': 'q is required'}, status=400)
+
+    sort = 'sales' if request.GET.get('sort') == 'sales' else 'relevance'
+    cursor = request.GET.get('cursor')
+    products = popularity.with_sales(search_index.search(query), '30d').values(*CARD_FIELDS, 'relevance', 'sales')
+    page = KeysetPaginator([f'-{sort}', '-id'], page_size_from(request)).paginate(products, cursor)
+
+    if request.user.is_authenticated and not cursor:
+        behavior_events.record_search(request.user, [query])
+    return _page_response(page)
+
+
+@require_GET
+@condition(etag_func=recommendations_etag)
+def api_recommendations(request):
+    """当前登录用户的个性化推荐（没有偏好记录时返回销量排序）"""
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'authentication required'}, status=401)
+
+    page = recommend_page(request.user, page_size_from(request), request.GET.get('cursor'), fields=CARD_FIELDS)
+    if page is None:
+        page = _popular_page(request)
+    return _page_response(page, private=True)
@@ -1,4 +1,10 @@
+import logging
+
 from django.apps import AppConfig
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
 
 class ProductManagementConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
@@ -8,6 +14,22 @@ class ProductManagementConfig(AppConfig):
         # 1. 注册信号（避免循环引用）
         from . import signals  # 确保 signals.py 使用 @receiver
 
-        # 2. 初始化标签服务（单例模式）
+        # 2. 推荐结果版本计数与购物车依赖多进程共享的缓存，配置成进程内缓存时直接拒绝启动
+        from .services import recommendation_cache
+        recommendation_cache.check_shared_cache()
+
+        # 3. 预热jieba词典（从 JIEBA_CACHE_FILE 读取），避免首个分词请求付出词典构建的耗时
+        from .services import tokenizer
+        if getattr(settings, 'JIEBA_WARM_UP', True):
+            try:
+                tokenizer.warm_up()
+            except Exception as e:
+                logger.warning("jieba词典预热失败: %s", e)
+
+        # 4. 初始化标签服务（单例模式），加载 build_tag_model 发布的TF-IDF模型
         from .services.tag_service import tag_service
-        # 延迟加载模型（实际在首次调用 generate_tags 时初始化）
\ No newline at end of file
+        try:
+            tag_service.load_model()
+        except Exception as e:
+            # 模型缺失或损坏时不阻止启动，标签生成会回退到本地算法
+            logger.warning("TF-IDF模型加载失败: %s", e)
\ No newline at end of file
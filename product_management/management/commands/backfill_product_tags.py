@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from product_management.models import Product, ProductTag
+
+
+class Command(BaseCommand):
+    help = 'Backfill the ProductTag relation table from Product.tags'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000,
+                            help='Products rebuilt per transaction')
+        parser.add_argument('--start-id', type=int, default=0,
+                            help='Only backfill products with id greater than this (resume point)')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        if chunk_size < 1:
+            raise CommandError('--chunk-size must be positive')
+
+        product_ids = (
+            Product.objects.filter(id__gt=options['start_id'])
+            .order_by('id')
+            .values_list('id', flat=True)
+            .iterator(chunk_size=chunk_size)
+        )
+
+        started = time.monotonic()
+        processed = links = 0
+        chunk = []
+        for product_id in product_ids:
+            chunk.append(product_id)
+            if len(chunk) >= chunk_size:
+                links += ProductTag.rebuild(chunk)
+                processed += len(chunk)
+                self.stdout.write(
+                    f'Up to product {chunk[-1]}: {processed} products, {links} tag rows '
+                    f'({processed / max(time.monotonic() - started, 1e-6):.0f} products/s)'
+                )
+                chunk = []
+        if chunk:
+            links += ProductTag.rebuild(chunk)
+            processed += len(chunk)
+
+        self.stdout.write(self.style.SUCCESS(f'Backfilled {links} tag rows for {processed} products'))
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from product_management.services import item_cf
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the item-item similarity table from paid order lines (cosine over co-purchases)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-n', type=int, default=None,
+                            help='Neighbors kept per product (default: ITEM_CF_NEIGHBORS)')
+        parser.add_argument('--block-size', type=int, default=2000,
+                            help='Products whose co-occurrence rows are computed at once')
+
+    def handle(self, *args, **options):
+        if options['block_size'] < 1:
+            raise CommandError('--block-size must be positive')
+        if options['top_n'] is not None and options['top_n'] < 1:
+            raise CommandError('--top-n must be positive')
+
+        started = time.monotonic()
+
+        def progress(done, total):
+            self.stdout.write(f'{done}/{total} products scored ({time.monotonic() - started:.1f}s)')
+
+        products, rows = item_cf.build(options['top_n'], options['block_size'], progress)
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {rows} neighbors for {products} products in {time.monotonic() - started:.1f}s'
+        ))
@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand, CommandError
+from product_management.models import Product
+from product_management.services.tag_service import tag_service
+
+
+class Command(BaseCommand):
+    help = 'Fit the TF-IDF tag model offline and publish it as a versioned artifact'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=None,
+                            help='Maximum number of product descriptions used as corpus')
+        parser.add_argument('--processes', type=int, default=1,
+                            help='Tokenize the corpus with this many worker processes before fitting')
+        parser.add_argument('--model-version', default=None,
+                            help='Version name of the artifact (default: current timestamp)')
+        parser.add_argument('--no-activate', action='store_true',
+                            help='Write the artifact without switching the CURRENT pointer')
+        parser.add_argument('--activate', dest='activate_version', default=None,
+                            help='Switch CURRENT to an existing version without fitting (rollback)')
+
+    def handle(self, *args, **options):
+        if options['processes'] < 1:
+            raise CommandError('--processes must be positive')
+        if options['activate_version']:
+            try:
+                tag_service.activate_model(options['activate_version'])
+            except FileNotFoundError as e:
+                raise CommandError(str(e))
+            self.stdout.write(self.style.SUCCESS(f"Activated tag model {options['activate_version']}"))
+            return
+
+        descriptions = (
+            Product.objects.exclude(description='')
+            .order_by('id')
+            .values_list('description', flat=True)
+        )
+        if options['limit']:
+            descriptions = descriptions[:options['limit']]
+        corpus = list(descriptions.iterator(chunk_size=2000))
+        if not corpus:
+            raise CommandError('No product descriptions available to fit the model')
+
+        tag_service.init_model(corpus, processes=options['processes'])
+        try:
+            version = tag_service.export_model(
+                version=options['model_version'],
+                activate=not options['no_activate'],
+            )
+        except FileExistsError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Built tag model {version} from {len(corpus)} descriptions "
+            f"({len(tag_service.vectorizer.vocabulary_)} features, config {tag_service.config_hash()})"
+        ))
@@ -1,18 +1,208 @@
 import csv
-from django.core.management.base import BaseCommand
+import io
+import itertools
+import json
+import os
+import sys
+import time
+from decimal import Decimal, InvalidOperation
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
 from product_management.models import Product
+from product_management.signals import products_bulk_saved
+
+UPDATE_FIELDS = ['name', 'stock', 'price', 'description', 'tags']
+
 
 class Command(BaseCommand):
-    help = 'Import products from a CSV file'
-
-    def handle(self, *args, **kwargs):
-        with open('products.csv', 'r') as csv_file:
-            csv_reader = csv.DictReader(csv_file)
-            for row in csv_reader:
-                product = Product(
-                    name=row['name'],
-                    stock=int(row['stock']),
-                    price=float(row['price'])
+    help = 'Stream products from a CSV file (or stdin) in chunks, upserting on a natural key'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='products.csv',
+                            help="CSV file to import, or '-' to read from stdin")
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Rows parsed, tagged and committed per transaction')
+        parser.add_argument('--key', choices=['sku', 'name'], default='sku',
+                            help='Natural key used to match rows against existing products (name is not unique: '
+                                 'rows whose name matches several existing products are skipped)')
+        parser.add_argument('--encoding', default='utf-8')
+        parser.add_argument('--state-file', default=None,
+                            help='Checkpoint file (default: <path>.import-state)')
+        parser.add_argument('--resume', action='store_true',
+                            help='Skip the rows already committed by a previous interrupted run')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        chunk_size = options['chunk_size']
+        if chunk_size < 1:
+            raise CommandError('--chunk-size must be positive')
+
+        state_file = options['state_file']
+        if not state_file:
+            if path == '-':
+                if options['resume']:
+                    raise CommandError('--resume from stdin requires --state-file')
+            else:
+                state_file = f'{path}.import-state'
+
+        committed = self._load_checkpoint(state_file, path) if options['resume'] else 0
+
+        if path == '-':
+            stream = io.TextIOWrapper(sys.stdin.buffer, encoding=options['encoding'], newline='')
+        else:
+            try:
+                stream = open(path, 'r', encoding=options['encoding'], newline='')
+            except OSError as e:
+                raise CommandError(f'Cannot open {path}: {e}')
+
+        with stream:
+            reader = csv.DictReader(stream)
+            missing = {'name', 'stock', 'price', options['key']} - set(reader.fieldnames or [])
+            if missing:
+                raise CommandError(f"CSV is missing required columns: {', '.join(sorted(missing))}")
+
+            rows = enumerate(reader, start=1)
+            if committed:
+                # 跳过上次已提交的行（按数据行计数，不含表头）
+                rows = itertools.islice(rows, committed, None)
+                self.stdout.write(f'Resuming after row {committed}')
+
+            started = time.monotonic()
+            processed = created = updated = skipped = 0
+            while True:
+                chunk = list(itertools.islice(rows, chunk_size))
+                if not chunk:
+                    break
+
+                c, u, s = self._import_chunk(chunk, options['key'])
+                created, updated, skipped = created + c, updated + u, skipped + s
+                processed += len(chunk)
+                committed = chunk[-1][0]
+                self._save_checkpoint(state_file, path, committed)
+
+                elapsed = max(time.monotonic() - started, 1e-6)
+                self.stdout.write(
+                    f'{committed} rows committed ({created} created, {updated} updated, '
+                    f'{skipped} skipped) - {processed / elapsed:.0f} rows/s'
                 )
-                product.save()
-                self.stdout.write(self.style.SUCCESS(f"Product '{product.name}' imported successfully"))
+
+        if state_file and os.path.exists(state_file):
+            os.remove(state_file)
+        self.stdout.write(self.style.SUCCESS(
+            f'Import finished: {created} created, {updated} updated, {skipped} skipped'
+        ))
+
+    def _import_chunk(self, chunk, key):
+        """解析、批量打标签并在单个事务内 upsert 一个分块，返回(新建数, 更新数, 跳过数)"""
+        parsed = {}
+        skipped = 0
+        for line, row in chunk:
+            try:
+                values = self._parse_row(row, key)
+            except ValueError as e:
+                skipped += 1
+                self.stderr.write(f'Row {line} skipped: {e}')
+                continue
+            parsed[values[key]] = values  # 同一分块内重复的键以最后一行为准
+
+        if not parsed:
+            return 0, 0, skipped
+
+        existing, ambiguous = {}, set()
+        for product in Product.objects.filter(**{f'{key}__in': list(parsed)}):
+            k = getattr(product, key)
+            if k in existing:
+                ambiguous.add(k)
+            existing[k] = product
+        # 商品名不唯一：匹配到多个已有商品的行无法确定更新哪一个，整行跳过
+        for k in ambiguous:
+            del parsed[k]
+            skipped += 1
+            self.stderr.write(f'Row with {key} {k!r} skipped: matches several existing products')
+        if not parsed:
+            return 0, 0, skipped
+
+        # 需要重新生成标签的行：CSV未给出标签，且是新商品或描述发生了变化
+        needs_tags = [
+            values for k, values in parsed.items()
+            if values['description'] and not values['tags'] and (
+                k not in existing or existing[k].description != values['description']
+            )
+        ]
+        if needs_tags:
+            generated = Product.build_tags_many([values['description'] for values in needs_tags])
+            for values, tags in zip(needs_tags, generated):
+                values['tags'] = tags
+
+        now = timezone.now()
+        to_create, to_update = [], []
+        for k, values in parsed.items():
+            product = existing.get(k)
+            if product is None:
+                to_create.append(Product(**values))
+                continue
+            if not values['tags'] and product.description == values['description']:
+                values['tags'] = product.tags
+            for field in UPDATE_FIELDS:
+                setattr(product, field, values[field])
+            product.updated_at = now  # bulk_update 不会自动更新 auto_now 字段
+            product.version = F('version') + 1
+            to_update.append(product)
+
+        with transaction.atomic():
+            Product.objects.bulk_create(to_create)
+            Product.objects.bulk_update(to_update, [*UPDATE_FIELDS, 'updated_at', 'version'])
+            # MySQL 的 bulk_create 不回填主键，按自然键取回本分块的商品ID
+            product_ids = list(
+                Product.objects.filter(**{f'{key}__in': list(parsed)}).values_list('id', flat=True)
+            )
+            products_bulk_saved.send(sender=Product, product_ids=product_ids)
+        return len(to_create), len(to_update), skipped
+
+    @staticmethod
+    def _parse_row(row, key):
+        name = (row.get('name') or '').strip()
+        if not name:
+            raise ValueError('empty name')
+        try:
+            stock = int(row['stock'])
+            price = Decimal(row['price'])
+        except (TypeError, ValueError, InvalidOperation):
+            raise ValueError(f"invalid stock/price {row.get('stock')!r}/{row.get('price')!r}")
+        if stock < 0:
+            raise ValueError('negative stock')
+
+        values = {
+            'sku': (row.get('sku') or '').strip() or None,
+            'name': name,
+            'stock': stock,
+            'price': price,
+            'description': (row.get('description') or '').strip(),
+            'tags': [tag.strip() for tag in (row.get('tags') or '').split('|') if tag.strip()],
+        }
+        if not values[key]:
+            raise ValueError(f'empty {key}')
+        return values
+
+    @staticmethod
+    def _load_checkpoint(state_file, path):
+        if not state_file or not os.path.exists(state_file):
+            return 0
+        with open(state_file, encoding='utf-8') as f:
+            state = json.load(f)
+        if state.get('source') != path:
+            raise CommandError(f"State file {state_file} belongs to {state.get('source')!r}, not {path!r}")
+        return state['rows_committed']
+
+    @staticmethod
+    def _save_checkpoint(state_file, path, committed):
+        """分块事务提交后再写检查点（先写临时文件再替换，崩溃时不会留下半个文件）"""
+        if not state_file:
+            return
+        tmp = f'{state_file}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'source': path, 'rows_committed': committed}, f)
+        os.replace(tmp, state_file)
@@ -0,0 +1,53 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from product_management.services import behavior_events
+
+
+class Command(BaseCommand):
+    help = 'Apply queued behavior events (cart/search/order) to UserPreference in per-user batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Events claimed per transaction')
+        parser.add_argument('--once', action='store_true',
+                            help='Drain the queue once and exit instead of polling')
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help='Seconds to sleep when the queue is empty')
+        parser.add_argument('--purge-days', type=int, default=None,
+                            help='Delete processed events older than this many days and exit')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+
+        if options['purge_days'] is not None:
+            deleted = behavior_events.purge_processed(options['purge_days'])
+            self.stdout.write(self.style.SUCCESS(f'Purged {deleted} processed events'))
+            return
+
+        total = 0
+        started = time.monotonic()
+        try:
+            while True:
+                batch_started = time.monotonic()
+                processed, users = behavior_events.process_batch(options['batch_size'])
+                if processed:
+                    total += processed
+                    elapsed = max(time.monotonic() - batch_started, 1e-6)
+                    stats = behavior_events.queue_stats()
+                    self.stdout.write(
+                        f'{processed} events for {users} users ({processed / elapsed:.0f} events/s), '
+                        f"{stats['pending']} pending, lag {stats['lag_seconds']:.1f}s"
+                    )
+                    continue
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+
+        elapsed = max(time.monotonic() - started, 1e-6)
+        self.stdout.write(self.style.SUCCESS(
+            f'Processed {total} events in {elapsed:.1f}s ({total / elapsed:.0f} events/s)'
+        ))
@@ -0,0 +1,62 @@
+import multiprocessing
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from product_management.services import preference_rebuild
+
+
+def _run_partition(args):
+    partitions, partition, chunk_size = args
+    try:
+        started = time.monotonic()
+        updated, created = preference_rebuild.rebuild_partition(partitions, partition, chunk_size)
+        return partition, updated, created, time.monotonic() - started
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Recompute UserPreference.preferred_tags from the full paid-order and processed event history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Worker processes; each rebuilds whole partitions')
+        parser.add_argument('--partitions', type=int, default=None,
+                            help='Split users by user_id %% N (default: number of workers); '
+                                 'more partitions lower the memory used per worker')
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Preferences written per bulk_update')
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        partitions = options['partitions'] or workers
+        if workers < 1 or partitions < 1 or options['chunk_size'] < 1:
+            raise CommandError('--workers, --partitions and --chunk-size must be positive')
+
+        tasks = [(partitions, partition, options['chunk_size']) for partition in range(partitions)]
+        started = time.monotonic()
+        updated = created = 0
+
+        if workers == 1:
+            results = map(_run_partition, tasks)
+        else:
+            # 子进程不能共用父进程的数据库连接：fork 前全部关闭，子进程各自重连
+            connections.close_all()
+            pool = multiprocessing.get_context('fork').Pool(workers)
+            results = pool.imap_unordered(_run_partition, tasks)
+
+        try:
+            for partition, part_updated, part_created, elapsed in results:
+                updated += part_updated
+                created += part_created
+                self.stdout.write(f'partition {partition + 1}/{partitions}: '
+                                  f'{part_updated} updated, {part_created} created in {elapsed:.1f}s')
+        finally:
+            if workers > 1:
+                pool.close()
+                pool.join()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {updated + created} preferences ({created} new) in {time.monotonic() - started:.1f}s'
+        ))
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from product_management.services import search_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the BM25 inverted search index from all products'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Products tokenized and written per batch')
+        parser.add_argument('--processes', type=int, default=1,
+                            help='Tokenize each batch with this many worker processes')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1 or options['processes'] < 1:
+            raise CommandError('--chunk-size and --processes must be positive')
+
+        started = time.monotonic()
+
+        def progress(processed):
+            elapsed = max(time.monotonic() - started, 1e-6)
+            self.stdout.write(f'{processed} products indexed ({processed / elapsed:.0f} products/s)')
+
+        products, terms = search_index.rebuild(options['chunk_size'], progress, options['processes'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {products} products, {terms} terms in {time.monotonic() - started:.1f}s'
+        ))
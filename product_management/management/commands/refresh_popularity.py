@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+from product_management.services import popularity
+
+
+class Command(BaseCommand):
+    help = 'Slide the 24h/7d/30d sales windows of the popularity table (run hourly); --rebuild backfills it'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Recompute hourly buckets and totals from all paid orders and Sale rows')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        if options['rebuild']:
+            products = popularity.rebuild()
+            self.stdout.write(self.style.SUCCESS(
+                f'Rebuilt popularity for {products} products in {time.monotonic() - started:.1f}s'
+            ))
+            return
+
+        updated = popularity.refresh()
+        self.stdout.write(self.style.SUCCESS(
+            f'Refreshed sales windows, {updated} products changed in {time.monotonic() - started:.1f}s'
+        ))
@@ -0,0 +1,154 @@
+import multiprocessing
+import time
+from collections import deque
+from functools import reduce
+from operator import or_
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from product_management.models import Product, TagKeyword
+from product_management.services.tag_service import tag_service
+from product_management.signals import products_bulk_saved
+
+
+def _retag_chunk(rows):
+    """
+    重新生成一块商品的标签（只做计算，不访问数据库）
+    :return: [(商品ID, 读取时的版本号, 旧标签, 新标签), ...] 仅含有变化的
+    """
+    generated = Product.build_tags_many([description for _, description, _, _ in rows])
+    return [(product_id, version, old, new)
+            for (product_id, _, old, version), new in zip(rows, generated) if new != old]
+
+
+class Command(BaseCommand):
+    help = 'Regenerate Product.tags for existing products with the current tag model and dictionaries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Worker processes generating tags (the tag model is loaded once before forking)')
+        parser.add_argument('--chunk-size', type=int, default=2000,
+                            help='Products read, tagged and written per batch')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Print the tag changes without writing them')
+        parser.add_argument('--changed-since', default=None,
+                            help='Only products modified at or after this date/datetime (ISO 8601)')
+        parser.add_argument('--category', default=None,
+                            help='Only products whose name or description mentions a keyword of this '
+                                 'TagKeyword category')
+        parser.add_argument('--model-version', default=None,
+                            help='Tag model version to use (default: CURRENT)')
+
+    def handle(self, *args, **options):
+        workers, chunk_size = options['workers'], options['chunk_size']
+        if workers < 1 or chunk_size < 1:
+            raise CommandError('--workers and --chunk-size must be positive')
+
+        products = self._filter(Product.objects.exclude(description=''), options)
+        try:
+            version = tag_service.pin_model(options['model_version'])
+        except (OSError, RuntimeError) as e:
+            raise CommandError(f'Cannot load tag model: {e}')
+        self.stdout.write(f'Tagging with model {version or "(none, dictionary and local rules only)"}')
+
+        self.verbosity = options['verbosity']
+        started = time.monotonic()
+        self.processed = self.changed = self.skipped = 0
+        if workers == 1:
+            for rows in self._chunks(products, chunk_size):
+                self._apply(len(rows), _retag_chunk(rows), options['dry_run'], started)
+        else:
+            self._run_pool(products, workers, chunk_size, options['dry_run'], started)
+
+        action = 'would change' if options['dry_run'] else 'changed'
+        self.stdout.write(self.style.SUCCESS(
+            f'Retagged {self.processed} products, {action} {self.changed} '
+            f'in {time.monotonic() - started:.1f}s'
+        ))
+        if self.skipped:
+            self.stdout.write(self.style.WARNING(
+                f'Skipped {self.skipped} products modified while retagging; rerun with --changed-since to retag them'
+            ))
+
+    def _run_pool(self, products, workers, chunk_size, dry_run, started):
+        # 子进程不访问数据库：读取和写回都在主进程；fork 前关闭连接，避免子进程继承同一个连接
+        connections.close_all()
+        pending = deque()
+        with multiprocessing.get_context('fork').Pool(workers) as pool:
+            for rows in self._chunks(products, chunk_size):
+                pending.append((len(rows), pool.apply_async(_retag_chunk, (rows,))))
+                # 限制在途分块数，商品数再多内存占用也是常数
+                if len(pending) >= workers * 2:
+                    count, result = pending.popleft()
+                    self._apply(count, result.get(), dry_run, started)
+            while pending:
+                count, result = pending.popleft()
+                self._apply(count, result.get(), dry_run, started)
+
+    def _filter(self, products, options):
+        if options['changed_since']:
+            value = options['changed_since']
+            since = parse_datetime(value)
+            if since is None:
+                day = parse_date(value)
+                if day is None:
+                    raise CommandError(f'Invalid --changed-since value: {value}')
+                since = timezone.datetime(day.year, day.month, day.day)
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since)
+            products = products.filter(updated_at__gte=since)
+
+        if options['category']:
+            keywords = set(TagKeyword.objects.filter(category=options['category']).values_list('keyword', flat=True))
+            if not keywords:
+                raise CommandError(f"Unknown category: {options['category']}")
+            keywords.add(options['category'])
+            products = products.filter(reduce(or_, (
+                Q(name__icontains=keyword) | Q(description__icontains=keyword) for keyword in sorted(keywords)
+            )))
+        return products
+
+    @staticmethod
+    def _chunks(products, chunk_size):
+        """按主键分页读取（每块一条查询，不在写回期间保持打开的游标）"""
+        last_id = 0
+        while True:
+            rows = list(products.filter(id__gt=last_id).order_by('id')
+                        .values_list('id', 'description', 'tags', 'version')[:chunk_size])
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            yield rows
+
+    def _apply(self, count, changes, dry_run, started):
+        self.processed += count
+        if dry_run:
+            self.changed += len(changes)
+            for product_id, _, old, new in changes:
+                old_tags = old if isinstance(old, list) else []
+                removed = [tag for tag in old_tags if tag not in new]
+                added = [tag for tag in new if tag not in old_tags]
+                self.stdout.write(f'{product_id}: -[{", ".join(map(str, removed))}] +[{", ".join(added)}]')
+        elif changes:
+            now = timezone.now()
+            with transaction.atomic():
+                # 只写回读取后未被修改过的商品（版本号未变），锁住这些行直到提交；其余跳过，不覆盖并发编辑
+                read_versions = {product_id: version for product_id, version, _, _ in changes}
+                current = set(Product.objects.select_for_update()
+                              .filter(id__in=read_versions, version__in=set(read_versions.values()))
+                              .values_list('id', 'version'))
+                products = [Product(id=product_id, tags=new, version=F('version') + 1, updated_at=now)
+                            for product_id, version, _, new in changes if (product_id, version) in current]
+                if products:
+                    Product.objects.bulk_update(products, ['tags', 'version', 'updated_at'])
+                    products_bulk_saved.send(sender=Product, product_ids=[product.id for product in products])
+            self.changed += len(products)
+            self.skipped += len(changes) - len(products)
+        if self.verbosity >= 1:
+            self.stderr.write(
+                f'{self.processed} products, {self.changed} changed, {self.skipped} skipped '
+                f'({self.processed / max(time.monotonic() - started, 1e-6):.0f} products/s)'
+            )
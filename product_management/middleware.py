@@ -0,0 +1,38 @@
+# product_management/middleware.py
+import time
+
+from django.db import connection
+
+from .services import metrics
+
+
+class MetricsMiddleware:
+    """
+    按URL名称记录请求耗时、SQL条数和SQL总耗时
+    SQL统计通过 connection.execute_wrapper 只包住本次请求，放在 MIDDLEWARE 最前面以覆盖其他中间件的查询
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        db = [0, 0.0]  # [查询条数, 耗时]
+
+        def track_query(execute, sql, params, many, context):
+            started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                db[0] += 1
+                db[1] += time.perf_counter() - started
+
+        started = time.perf_counter()
+        with connection.execute_wrapper(track_query):
+            response = self.get_response(request)
+        duration = time.perf_counter() - started
+
+        match = request.resolver_match
+        view = match.view_name if match is not None else 'unmatched'
+        metrics.observe_request(view, request.method, response.status_code, duration, db[0], db[1])
+        metrics.flush()
+        return response
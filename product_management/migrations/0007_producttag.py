@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product_management', '0006_product_sku'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductTag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tag', models.CharField(max_length=50)),
+                ('weight', models.FloatField(default=1.0)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tag_links', to='product_management.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['tag', 'product'], name='product_tag_tag_idx')],
+                'constraints': [models.UniqueConstraint(fields=('product', 'tag'), name='unique_product_tag')],
+            },
+        ),
+    ]
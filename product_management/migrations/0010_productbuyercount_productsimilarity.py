@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product_management', '0009_searchdocument_searchterm_searchposting'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductBuyerCount',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='buyer_count', serialize=False, to='product_management.product')),
+                ('buyers', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ProductSimilarity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('co_count', models.PositiveIntegerField(default=0)),
+                ('score', models.FloatField(default=0)),
+                ('neighbor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='product_management.product')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_links', to='product_management.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product', '-score'], name='product_similarity_rank_idx')],
+                'constraints': [models.UniqueConstraint(fields=('product', 'neighbor'), name='unique_product_neighbor')],
+            },
+        ),
+    ]
@@ -0,0 +1,44 @@
+from django.db import migrations
+
+SUMMARY_NAMES = 2
+CHUNK_SIZE = 1000
+
+
+def summarize(lines):
+    # 与 Order.set_summary 相同的规则（迁移中不能调用模型方法）
+    item_count = sum(quantity for _, quantity in lines)
+    summary = '、'.join(f'{name} ×{quantity}' for name, quantity in lines[:SUMMARY_NAMES])
+    if len(lines) > SUMMARY_NAMES:
+        summary += f' 等{item_count}件'
+    return item_count, summary[:200]
+
+
+def backfill_order_summary(apps, schema_editor):
+    Order = apps.get_model('product_management', 'Order')
+    OrderItem = apps.get_model('product_management', 'OrderItem')
+
+    # 按主键分块：每块一次查询取出订单项，一次 bulk_update 写回
+    last_id = 0
+    while True:
+        orders = list(Order.objects.filter(id__gt=last_id).order_by('id').only('id')[:CHUNK_SIZE])
+        if not orders:
+            break
+        last_id = orders[-1].id
+
+        lines = {}
+        items = (OrderItem.objects.filter(order_id__in=[order.id for order in orders])
+                 .order_by('id').values_list('order_id', 'product__name', 'quantity'))
+        for order_id, name, quantity in items:
+            lines.setdefault(order_id, []).append((name, quantity))
+        for order in orders:
+            order.item_count, order.summary = summarize(lines.get(order.id, []))
+        Order.objects.bulk_update(orders, ['item_count', 'summary'])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('product_management', '0011_order_item_count_order_summary_and_more'),
+    ]
+    operations = [
+        migrations.RunPython(backfill_order_summary, migrations.RunPython.noop),
+    ]
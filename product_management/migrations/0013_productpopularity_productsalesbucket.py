@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product_management', '0012_backfill_order_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductPopularity',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='popularity', serialize=False, to='product_management.product')),
+                ('sales_24h', models.PositiveIntegerField(default=0)),
+                ('sales_7d', models.PositiveIntegerField(db_index=True, default=0)),
+                ('sales_30d', models.PositiveIntegerField(db_index=True, default=0)),
+                ('sales_total', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ProductSalesBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField()),
+                ('quantity', models.PositiveIntegerField(default=0)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='product_management.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['hour'], name='product_sales_hour_idx')],
+                'constraints': [models.UniqueConstraint(fields=('product', 'hour'), name='unique_product_sales_hour')],
+            },
+        ),
+    ]
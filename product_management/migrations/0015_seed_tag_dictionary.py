@@ -0,0 +1,36 @@
+from django.db import migrations
+
+# 原 TagGenerator 中硬编码的词典，作为词典表的初始数据
+CATEGORY_KEYWORDS = {
+    "手机": ["5G", "曲面屏", "摄像头", "骁龙"],
+    "笔记本": ["游戏本", "轻薄", "i7", "RTX"],
+    "服装": ["纯棉", "修身", "加厚", "冬季"],
+}
+SYNONYMS = {
+    "智能手机": ["智能机", "智慧手机"],
+    "笔记本电脑": ["笔电", "手提电脑"],
+}
+
+
+def seed_dictionary(apps, schema_editor):
+    TagKeyword = apps.get_model('product_management', 'TagKeyword')
+    TagSynonym = apps.get_model('product_management', 'TagSynonym')
+    TagKeyword.objects.bulk_create(
+        [TagKeyword(keyword=word, category=category)
+         for category, words in CATEGORY_KEYWORDS.items() for word in [category, *words]],
+        ignore_conflicts=True,
+    )
+    TagSynonym.objects.bulk_create(
+        [TagSynonym(variant=variant, canonical=canonical)
+         for canonical, variants in SYNONYMS.items() for variant in variants],
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('product_management', '0014_tagkeyword_tagsynonym'),
+    ]
+    operations = [
+        migrations.RunPython(seed_dictionary, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 08:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product_management', '0018_alter_order_payment_method_status'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='productpopularity',
+            name='sales_30d',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='productpopularity',
+            name='sales_7d',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='productpopularity',
+            index=models.Index(fields=['sales_7d', 'product'], name='popularity_7d_rank_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productpopularity',
+            index=models.Index(fields=['sales_30d', 'product'], name='popularity_30d_rank_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+from django.db import migrations
+
+CHUNK_SIZE = 5000
+
+
+def backfill_product_popularity(apps, schema_editor):
+    Product = apps.get_model('product_management', 'Product')
+    ProductPopularity = apps.get_model('product_management', 'ProductPopularity')
+
+    # 按主键分块，为还没有热度行的商品补一行（销量为0）；按销量排序的列表改为内连接热度表
+    last_id = 0
+    while True:
+        product_ids = list(Product.objects.filter(id__gt=last_id).order_by('id')
+                           .values_list('id', flat=True)[:CHUNK_SIZE])
+        if not product_ids:
+            break
+        last_id = product_ids[-1]
+        ProductPopularity.objects.bulk_create(
+            [ProductPopularity(product_id=product_id) for product_id in product_ids], ignore_conflicts=True
+        )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('product_management', '0019_productpopularity_rank_indexes'),
+    ]
+    operations = [
+        migrations.RunPython(backfill_product_popularity, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 08:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product_management', '0020_backfill_product_popularity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productpopularity',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddField(
+            model_name='userpreference',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
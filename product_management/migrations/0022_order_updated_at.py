@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-17 08:18
+
+from django.db import migrations, models
+
+
+def backfill_updated_at(apps, schema_editor):
+    # 已有订单的修改时间取下单时间，否则首次按时间水位线增量导出时会把全部历史订单当作刚修改过
+    Order = apps.get_model('product_management', 'Order')
+    Order.objects.update(updated_at=models.F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product_management', '0021_popularity_preference_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.RunPython(backfill_updated_at, migrations.RunPython.noop),
+    ]
@@ -1,45 +1,67 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.contrib.postgres.fields import ArrayField
 from django.utils import timezone
 from datetime import timedelta
 from .services.tag_service import tag_service
+from .services import recommendation_cache
+from .services.metrics import timed
 
 
 class Product(models.Model):
+    sku = models.CharField(max_length=64, unique=True, null=True, blank=True)  # 供应商商品编码（导入时的自然键）
     name = models.CharField(max_length=100)
     stock = models.PositiveIntegerField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
     description = models.TextField(default='', blank=True)
     tags = models.JSONField(default=list, blank=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)  # save()时自动更新，批量导入时显式写入
+    # 行版本：每次保存、库存变化、批量更新时在数据库中原子递增；商品卡片片段缓存以 (id, version) 为键
+    version = models.PositiveIntegerField(default=1)
 
     def __str__(self):
         return self.name
 
     def save(self, *args, **kwargs):
-        """自动标签生成（混合新旧两种方式）"""
+        """自动标签生成（混合新旧两种方式），更新已有商品时递增行版本"""
         if self.description and not self.tags:
-            # 方式1：使用改进的tag_service（优先）
-            try:
-                if not hasattr(tag_service, 'vectorizer'):
-                    corpus = [p.description for p in Product.objects.exclude(description='')][:1000]
-                    if corpus:
-                        tag_service.init_model(corpus)
-
-                service_tags = tag_service.generate_tags(self.description)
-                if len(service_tags) >= 3:  # 新服务生成足够标签时使用
-                    self.tags = service_tags
-                    super().save(*args, **kwargs)
-                    return
-            except Exception as e:
-                print(f"标签服务异常，回退到本地算法: {e}")
-
-            # 方式2：回退到本地算法
-            self.tags = self._extract_tags_with_local_algorithm()
-
-        super().save(*args, **kwargs)
-
-    def _extract_tags_with_local_algorithm(self):
+            self.tags = self.build_tags_many([self.description])[0]
+
+        if self._state.adding:
+            super().save(*args, **kwargs)
+            return
+        if kwargs.get('update_fields') is not None:
+            # 任何修改都同时写入 updated_at（评分引擎、导出和 ETag 据此发现变化）
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'version', 'updated_at'}
+        with transaction.atomic(using=kwargs.get('using')):
+            # 锁住该行读取当前版本再写回加一：与库存扣减的 F('version') + 1 互斥，
+            # 实例上始终是具体的整数，post_save 接收者无需再查询
+            current = (type(self)._base_manager.using(kwargs.get('using')).select_for_update()
+                       .values_list('version', flat=True).get(pk=self.pk))
+            self.version = current + 1
+            super().save(*args, **kwargs)
+
+    @classmethod
+    def build_tags_many(cls, descriptions):
+        """
+        批量生成标签（save()与批量导入共用同一套规则）
+        方式1：使用改进的tag_service（优先），生成足够标签时使用
+        方式2：回退到本地算法
+        """
+        # TF-IDF模型由 build_tag_model 命令离线训练，这里只做推理，绝不在请求中训练
+        try:
+            service_tags = tag_service.generate_tags_many(descriptions)
+        except Exception as e:
+            print(f"标签服务异常，回退到本地算法: {e}")
+            service_tags = [[] for _ in descriptions]
+
+        return [
+            tags if len(tags) >= 3 else cls._extract_tags_with_local_algorithm(description)
+            for description, tags in zip(descriptions, service_tags)
+        ]
+
+    @staticmethod
+    def _extract_tags_with_local_algorithm(description):
         """原生的本地标签提取算法（保留作为备用）"""
         import re
         from collections import Counter
@@ -47,7 +69,7 @@ class Product(models.Model):
         category_keywords = {"手机", "笔记本", "服装"}
 
         tags = set()
-        description_lower = self.description.lower()
+        description_lower = description.lower()
 
         # 提取关键词的逻辑（示例）
         words = re.findall(r'\w+', description_lower)
@@ -57,79 +79,284 @@ class Product(models.Model):
         return list(tags)[:5]
 
 
+class ProductTag(models.Model):
+    """
+    商品-标签关系表（由Product.tags同步维护）
+    偏好排序与标签检索通过 (tag, product) 索引做连接，避免对JSON字段全表扫描
+    """
+    product = models.ForeignKey(Product, related_name='tag_links', on_delete=models.CASCADE)
+    tag = models.CharField(max_length=50)
+    weight = models.FloatField(default=1.0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'tag'], name='unique_product_tag'),
+        ]
+        indexes = [
+            models.Index(fields=['tag', 'product'], name='product_tag_tag_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.product_id}:{self.tag}'
+
+    @staticmethod
+    def weights_from(tags):
+        """
+        将Product.tags转换为 {标签: 权重}
+        兼容列表格式（权重均为1.0）和字典格式 {"标签": 权重}
+        """
+        if isinstance(tags, dict):
+            items = tags.items()
+        elif isinstance(tags, list):
+            items = ((tag, 1.0) for tag in tags)
+        else:
+            return {}
+
+        weights = {}
+        for tag, weight in items:
+            tag = str(tag).strip()[:50]
+            if tag:
+                try:
+                    weights[tag] = float(weight)
+                except (TypeError, ValueError):
+                    weights[tag] = 1.0
+        return weights
+
+    @classmethod
+    def sync(cls, product):
+        """增量同步单个商品的标签行（只增删改发生变化的标签）"""
+        wanted = cls.weights_from(product.tags)
+        current = dict(cls.objects.filter(product=product).values_list('tag', 'weight'))
+
+        stale = [tag for tag in current if tag not in wanted]
+        if stale:
+            cls.objects.filter(product=product, tag__in=stale).delete()
+        added = [cls(product=product, tag=tag, weight=weight)
+                 for tag, weight in wanted.items() if tag not in current]
+        if added:
+            cls.objects.bulk_create(added)
+        for tag, weight in wanted.items():
+            if tag in current and current[tag] != weight:
+                cls.objects.filter(product=product, tag=tag).update(weight=weight)
+
+    @classmethod
+    def rebuild(cls, product_ids):
+        """批量重建一组商品的标签行（批量导入与回填命令使用）"""
+        product_ids = list(product_ids)
+        rows = Product.objects.filter(id__in=product_ids).values_list('id', 'tags')
+        links = [
+            cls(product_id=product_id, tag=tag, weight=weight)
+            for product_id, tags in rows
+            for tag, weight in cls.weights_from(tags).items()
+        ]
+        with transaction.atomic():
+            cls.objects.filter(product_id__in=product_ids).delete()
+            cls.objects.bulk_create(links, batch_size=1000)
+        return len(links)
+
+
+class AbstractSearchTerm(models.Model):
+    term = models.CharField(max_length=64, unique=True)
+    df = models.IntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+    def __str__(self):
+        return self.term
+
+
+class AbstractSearchPosting(models.Model):
+    term = models.CharField(max_length=64)
+    tf = models.FloatField()
+    doc_length = models.FloatField()
+
+    class Meta:
+        abstract = True
+
+
+class AbstractSearchDocument(models.Model):
+    length = models.FloatField()
+
+    class Meta:
+        abstract = True
+
+
+class SearchTerm(AbstractSearchTerm):
+    """搜索倒排索引的词表：每个词的文档频率 df（用于计算BM25的idf）"""
+
+
+class SearchPosting(AbstractSearchPosting):
+    """
+    搜索倒排索引：词 -> 商品
+    tf 为按字段加权后的词频，doc_length 冗余保存文档长度，查询时无需再连表
+    """
+    product = models.ForeignKey(Product, related_name='search_postings', on_delete=models.CASCADE)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['term', 'product'], name='unique_search_posting'),
+        ]
+
+
+class SearchDocument(AbstractSearchDocument):
+    """已建立索引的商品及其加权文档长度（用于统计文档数与平均长度）"""
+    product = models.OneToOneField(Product, primary_key=True, related_name='search_document',
+                                   on_delete=models.CASCADE)
+
+
+# 第二套索引表：与上面三张表轮流作为当前索引，全量重建写入未使用的一套，完成后只切换指针（见 search_index.rebuild）
+class SearchTermShadow(AbstractSearchTerm):
+    pass
+
+
+class SearchPostingShadow(AbstractSearchPosting):
+    product = models.ForeignKey(Product, related_name='shadow_search_postings', on_delete=models.CASCADE)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['term', 'product'], name='unique_search_posting_shadow'),
+        ]
+
+
+class SearchDocumentShadow(AbstractSearchDocument):
+    product = models.OneToOneField(Product, primary_key=True, related_name='shadow_search_document',
+                                   on_delete=models.CASCADE)
+
+
+class TagKeyword(models.Model):
+    """标签词典：商品描述中出现该关键词时打上该标签（不区分大小写）"""
+    keyword = models.CharField(max_length=64, unique=True)
+    category = models.CharField(max_length=64, blank=True)  # 所属类目，便于运营分组维护
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.keyword
+
+
+class TagSynonym(models.Model):
+    """同义词表：标签为 variant 时统一替换为 canonical"""
+    variant = models.CharField(max_length=64, unique=True)
+    canonical = models.CharField(max_length=64)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.variant} -> {self.canonical}'
+
+
 class UserPreference(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     preferred_tags = models.JSONField(default=dict)  # 格式: {"tag1": {"weight": 1.0, "last_updated": "ISO时间字符串"}, ...}
-    DECAY_PERIOD = 30  # 标签衰减周期(天)
+    updated_at = models.DateTimeField(auto_now=True)  # 推荐接口的 ETag 由此发现偏好变化，批量写入时显式更新
+    DECAY_PERIOD = 30  # 标签衰减周期(天)：权重每经过一个周期衰减一半
     MAX_TAGS = 15  # 最大保存标签数量
+    MIN_WEIGHT = 0.1  # 衰减后低于该权重的标签会被清理
+    EVENT_INCREMENTS = {'order': 1.0, 'cart': 0.5, 'search': 0.3}  # 各类行为的权重增量
+
+    # 存储的 weight 是 last_updated 时刻的权重，读取时按经过的时间计算衰减：
+    #   当前权重 = weight * 0.5 ** (经过天数 / DECAY_PERIOD)
+    # 因此每次行为只需改写涉及的标签，不必逐个衰减所有标签
+
+    def _decay_factor(self, last_updated, now):
+        """从 last_updated 到 now 的衰减系数"""
+        elapsed_days = max((now - last_updated).total_seconds(), 0) / 86400
+        return 0.5 ** (elapsed_days / self.DECAY_PERIOD)
+
+    @staticmethod
+    def _last_updated(data):
+        """解析标签的 last_updated，旧数据格式或无法解析时返回None"""
+        if not isinstance(data, dict):
+            return None
+        try:
+            last_updated = timezone.datetime.fromisoformat(data['last_updated'])
+        except (ValueError, KeyError, TypeError):
+            return None
+        if timezone.is_naive(last_updated):
+            last_updated = timezone.make_aware(last_updated)
+        return last_updated
 
+    def _effective_weight(self, data, now):
+        """标签在 now 时刻的衰减后权重"""
+        if not isinstance(data, dict):
+            # 兼容旧数据格式（没有时间戳，不做衰减）
+            return float(data) if str(data).replace('.', '').isdigit() else 0
+
+        weight = data.get('weight', 0)
+        last_updated = self._last_updated(data)
+        if last_updated is None:
+            return weight
+        return weight * self._decay_factor(last_updated, now)
+
+    def _current_weights(self, now=None):
+        now = now or timezone.now()
+        return [(tag, self._effective_weight(data, now)) for tag, data in self.preferred_tags.items()]
+
+    @timed('UserPreference.get_top_preferences')
     def get_top_preferences(self, n=5):
         """
-        获取权重最高的前n个标签
+        获取衰减后权重最高的前n个标签（n为None时返回全部）
         返回格式: [("tag1", 权重数值), ("tag2", 权重数值)]
         """
         if not self.preferred_tags:
             return []
 
-        # 提取权重并排序
-        valid_tags = []
-        for tag, data in self.preferred_tags.items():
-            if isinstance(data, dict):
-                weight = data.get('weight', 0)
-            else:
-                # 兼容旧数据格式
-                weight = float(data) if str(data).replace('.', '').isdigit() else 0
-            valid_tags.append((tag, weight))
-
-        return sorted(valid_tags, key=lambda x: x[1], reverse=True)[:n]
+        return sorted(self._current_weights(), key=lambda x: x[1], reverse=True)[:n]
 
     def update_preferences(self, tags, increment=1.0):
         """
-        更新标签权重
+        更新标签权重（只改写本次涉及的标签）
         :param tags: 要更新的标签列表
         :param increment: 权重增量
         """
-        for tag in tags:
-            # 初始化或更新标签数据结构
-            if tag not in self.preferred_tags or not isinstance(self.preferred_tags[tag], dict):
-                self.preferred_tags[tag] = {
-                    'weight': 0,
-                    'last_updated': timezone.now().isoformat()
-                }
-
-            # 更新权重和时间戳
-            self.preferred_tags[tag]['weight'] += increment
-            self.preferred_tags[tag]['last_updated'] = timezone.now().isoformat()
+        self.apply_events([(tags, increment, None)])
 
-        self._apply_decay()
-        self._limit_tags()
-        self.save()
-
-    def _apply_decay(self):
-        """应用权重衰减（每天衰减10%）"""
-        decay_factor = 0.9  # 衰减系数
-        for tag in list(self.preferred_tags.keys()):
-            data = self.preferred_tags[tag]
+    @timed('UserPreference.apply_events')
+    def apply_events(self, events, commit=True):
+        """
+        批量应用行为事件，多个事件只写一次库
+        :param events: [(标签列表, 权重增量, 发生时间或None表示当前时间), ...]
+        :param commit: 为False时只修改内存中的数据，由调用方批量保存（process_behavior_events）
+        """
+        now = timezone.now()
+        for tags, increment, at in events:
+            at = at or now
+            for tag in tags:
+                data = self.preferred_tags.get(tag)
+                last_updated = self._last_updated(data)
+                if last_updated is not None and last_updated > at:
+                    # 事件晚于已记录的更新到达：把增量衰减到 last_updated 时刻再累加
+                    data['weight'] += increment * self._decay_factor(at, last_updated)
+                    continue
 
-            if isinstance(data, dict):
-                data['weight'] *= decay_factor
-                # 清理权重过低的标签
-                if data['weight'] < 0.1:
-                    del self.preferred_tags[tag]
-            else:
-                # 兼容旧数据：转换为新格式
+                # 先把旧权重衰减到事件时刻，再累加增量并刷新时间戳
+                weight = self._effective_weight(data, at) if data is not None else 0
                 self.preferred_tags[tag] = {
-                    'weight': (float(data) if str(data).replace('.', '').isdigit() else 0) * decay_factor,
-                    'last_updated': timezone.now().isoformat()
+                    'weight': weight + increment,
+                    'last_updated': at.isoformat()
                 }
 
-    def _limit_tags(self):
-        """限制标签数量（保留权重最高的MAX_TAGS个标签）"""
+        self._apply_decay(now)
+        self._limit_tags(now)
+        if not commit:
+            return
+        if self.pk:
+            self.save(update_fields=['preferred_tags', 'updated_at'])
+        else:
+            self.save()
+        recommendation_cache.bump_preference_version(self.user_id)
+
+    def _apply_decay(self, now=None):
+        """清理衰减后权重过低的标签（衰减本身在读取时按时间计算）"""
+        for tag, weight in self._current_weights(now):
+            if weight < self.MIN_WEIGHT:
+                del self.preferred_tags[tag]
+
+    def _limit_tags(self, now=None):
+        """限制标签数量（保留衰减后权重最高的MAX_TAGS个标签）"""
         if len(self.preferred_tags) > self.MAX_TAGS:
             # 获取权重最高的标签
             top_tags = sorted(
-                [(tag, data['weight']) if isinstance(data, dict) else (tag, float(data))
-                 for tag, data in self.preferred_tags.items()],
+                self._current_weights(now),
                 key=lambda x: x[1],
                 reverse=True
             )[:self.MAX_TAGS]
@@ -142,15 +369,16 @@ class UserPreference(models.Model):
     def add_cart_activity(self, product):
         """记录购物车活动（权重增量0.5）"""
         if isinstance(product.tags, list):
-            self.update_preferences(product.tags, increment=0.5)
+            self.update_preferences(product.tags, increment=self.EVENT_INCREMENTS['cart'])
 
     def add_search_activity(self, keywords):
         """记录搜索活动（权重增量0.3）"""
-        self.update_preferences(keywords, increment=0.3)
+        self.update_preferences(keywords, increment=self.EVENT_INCREMENTS['search'])
 
     def get_recent_preferences(self, days=30, n=5):
         """获取最近days天内活跃的权重最高标签"""
-        cutoff_date = timezone.now() - timezone.timedelta(days=days)
+        now = timezone.now()
+        cutoff_date = now - timezone.timedelta(days=days)
         recent_tags = []
 
         for tag, data in self.preferred_tags.items():
@@ -158,7 +386,7 @@ class UserPreference(models.Model):
                 try:
                     last_updated = timezone.datetime.fromisoformat(data['last_updated'])
                     if last_updated > cutoff_date:
-                        recent_tags.append((tag, data['weight']))
+                        recent_tags.append((tag, self._effective_weight(data, now)))
                 except (ValueError, KeyError):
                     continue
 
@@ -190,12 +418,31 @@ class UserPreference(models.Model):
         try:
             last_updated = timezone.datetime.fromisoformat(data['last_updated'])
             return {
-                'weight': data.get('weight', 0),
+                'weight': data.get('weight', 0) * self._decay_factor(last_updated, timezone.now()),
                 'last_updated': last_updated,
                 'days_since_updated': (timezone.now() - last_updated).days
             }
         except (ValueError, KeyError):
             return None
+class BehaviorEvent(models.Model):
+    """
+    用户行为事件队列
+    请求中只追加一行事件，由 process_behavior_events 按用户聚合后批量应用到 UserPreference
+    """
+    KIND_CHOICES = [('order', '下单'), ('cart', '加入购物车'), ('search', '搜索')]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    tags = models.JSONField(default=list)
+    created_at = models.DateTimeField(default=timezone.now)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['processed_at', 'id'], name='behavior_event_queue_idx'),
+        ]
+
+
 class Sale(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField()
@@ -212,29 +459,68 @@ class Order(models.Model):
     PAYMENT_METHODS = [('wechat', '微信支付'), ('alipay', '支付宝'), ('cash', '现金')]
     STATUS_CHOICES = [('pending', '待支付'), ('paid', '已支付'), ('shipped', '已发货'), ('completed', '已完成')]
 
+    PAID_STATUSES = ('paid', 'shipped', 'completed')  # 已付款（计入购买行为）的状态
+
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     order_number = models.CharField(max_length=20, unique=True)
     total_amount = models.DecimalField(max_digits=10, decimal_places=2)
     payment_method = models.CharField(max_length=10, choices=PAYMENT_METHODS)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)  # 状态变化时更新，增量导出的时间水位线
     receiver_name = models.CharField(max_length=50)
     receiver_phone = models.CharField(max_length=20)
     receiver_address = models.TextField()
     notes = models.TextField(blank=True)
+    # 冗余的订单项摘要：订单列表页只读订单表，不查询 OrderItem
+    item_count = models.PositiveIntegerField(default=0)  # 商品总件数
+    summary = models.CharField(max_length=200, blank=True)  # 如 "纯棉T恤 ×2、蓝牙耳机 等3件"
+
+    SUMMARY_NAMES = 2  # 摘要中列出的商品名数
+
+    class Meta:
+        indexes = [
+            # 订单历史按用户、下单时间倒序的游标分页
+            models.Index(fields=['user', '-created_at', '-id'], name='order_user_created_idx'),
+        ]
+
+    def set_summary(self, lines):
+        """
+        由订单项设置 item_count/summary
+        :param lines: [(商品名, 数量), ...]
+        """
+        lines = list(lines)
+        self.item_count = sum(quantity for _, quantity in lines)
+        summary = '、'.join(f'{name} ×{quantity}' for name, quantity in lines[:self.SUMMARY_NAMES])
+        if len(lines) > self.SUMMARY_NAMES:
+            summary += f' 等{self.item_count}件'
+        self.summary = summary[:200]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        # 记录从数据库读出时的状态，用于判断保存时是否刚变为已支付
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_status = instance.status if 'status' in field_names else None
+        return instance
+
+    @property
+    def became_paid(self):
+        """本次保存是否使订单进入已支付状态"""
+        return self.status == 'paid' and getattr(self, '_loaded_status', None) not in self.PAID_STATUSES
 
     def update_user_preferences(self):
-        """更新用户偏好"""
-        pref, _ = UserPreference.objects.get_or_create(user=self.user)
+        """更新用户偏好（写入行为事件队列，由 process_behavior_events 异步应用）"""
+        from .services import behavior_events
         all_tags = []
 
-        for item in self.items.all():
-            if isinstance(item.product.tags, list):
-                all_tags.extend(item.product.tags)
-            elif isinstance(item.product.tags, dict):
-                all_tags.extend(item.product.tags.keys())
+        # 一次查询取出全部订单项的商品标签，不逐个加载商品
+        for tags in self.items.values_list('product__tags', flat=True):
+            if isinstance(tags, list):
+                all_tags.extend(tags)
+            elif isinstance(tags, dict):
+                all_tags.extend(tags.keys())
 
-        pref.update_preferences(all_tags, increment=1.0)
+        behavior_events.record(self.user_id, 'order', all_tags)
 
 
 class OrderItem(models.Model):
@@ -250,4 +536,91 @@ class OrderItem(models.Model):
     def save(self, *args, **kwargs):
         if not self.price:
             self.price = self.product.price
-        super().save(*args, **kwargs)
\ No newline at end of file
+        super().save(*args, **kwargs)
+
+
+class ProductSimilarity(models.Model):
+    """
+    商品相似度（基于共同购买的物品协同过滤）
+    score 为购买者集合的余弦相似度 co_count / sqrt(购买者数A * 购买者数B)
+    """
+    product = models.ForeignKey(Product, related_name='similar_links', on_delete=models.CASCADE)
+    neighbor = models.ForeignKey(Product, related_name='+', on_delete=models.CASCADE)
+    co_count = models.PositiveIntegerField(default=0)  # 两件商品都买过的用户数
+    score = models.FloatField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'neighbor'], name='unique_product_neighbor'),
+        ]
+        indexes = [
+            models.Index(fields=['product', '-score'], name='product_similarity_rank_idx'),
+        ]
+
+
+class ProductBuyerCount(models.Model):
+    """购买过该商品的不同用户数（协同过滤相似度的分母）"""
+    product = models.OneToOneField(Product, primary_key=True, related_name='buyer_count',
+                                   on_delete=models.CASCADE)
+    buyers = models.PositiveIntegerField(default=0)
+
+
+class ProductSalesBucket(models.Model):
+    """商品每小时销量（已支付订单 + Sale），用于维护滑动窗口销量"""
+    product = models.ForeignKey(Product, related_name='+', on_delete=models.CASCADE)
+    hour = models.DateTimeField()  # 整点
+    quantity = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'hour'], name='unique_product_sales_hour'),
+        ]
+        indexes = [
+            models.Index(fields=['hour'], name='product_sales_hour_idx'),
+        ]
+
+
+class ChangeMarker(models.Model):
+    """
+    变化标记：无法由其他表的 MAX(updated_at) 发现的变化（如删除商品）在这里递增版本号，
+    与变化在同一事务中写入；JSON接口的 ETag 按主键读取，不对商品表计数
+    """
+    PRODUCTS_DELETED = 'products_deleted'
+    SEARCH_INDEX = 'search_index'  # 搜索索引的代数：奇偶决定当前使用哪一套索引表，全量重建完成时加一
+
+    name = models.CharField(max_length=50, primary_key=True)
+    version = models.PositiveBigIntegerField(default=0)
+
+    @classmethod
+    def bump(cls, name):
+        if not cls.objects.filter(name=name).update(version=models.F('version') + 1):
+            cls.objects.bulk_create([cls(name=name)], ignore_conflicts=True)
+            cls.objects.filter(name=name).update(version=models.F('version') + 1)
+
+    @classmethod
+    def version_of(cls, name):
+        return cls.objects.filter(name=name).values_list('version', flat=True).first() or 0
+
+
+class ProductPopularity(models.Model):
+    """
+    商品热度（物化的窗口销量），付款时增量累加，refresh_popularity 定时让过期的小时桶滑出窗口
+    冷启动排序与搜索按销量排序直接读取带索引的列，不做实时聚合
+    """
+    WINDOWS = {'24h': 1, '7d': 7, '30d': 30}  # 窗口名: 天数，对应 sales_<窗口名> 字段
+
+    product = models.OneToOneField(Product, primary_key=True, related_name='popularity',
+                                   on_delete=models.CASCADE)
+    sales_24h = models.PositiveIntegerField(default=0)
+    sales_7d = models.PositiveIntegerField(default=0)
+    sales_30d = models.PositiveIntegerField(default=0)
+    sales_total = models.PositiveIntegerField(default=0)
+    # 销量变化时间：商品接口的 ETag 取其最大值发现销量变化（带索引，MAX 只读索引一端）
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            # 按销量排序的游标分页：(销量, 商品ID) 与排序键一致，翻页只扫描一页的索引项
+            models.Index(fields=['sales_7d', 'product'], name='popularity_7d_rank_idx'),
+            models.Index(fields=['sales_30d', 'product'], name='popularity_30d_rank_idx'),
+        ]
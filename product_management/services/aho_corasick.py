@@ -0,0 +1,72 @@
+# product_management/services/aho_corasick.py
+from collections import deque
+
+
+class Automaton:
+    """
+    Aho–Corasick 多模式匹配自动机
+    一次扫描找出文本中出现的所有关键词，耗时与文本长度（加匹配数）成正比，与词典大小无关
+    使用方式：add() 添加全部关键词 -> build() -> find()/iter_matches()；build() 之后不可再修改
+    """
+
+    def __init__(self):
+        self._goto = [{}]      # 节点 -> {字符: 子节点}
+        self._fail = [0]       # 失配指针
+        self._outputs = [()]   # 以该节点结尾的关键词的值（含沿失配指针可达的）
+        self._built = False
+
+    def __len__(self):
+        return sum(1 for outputs in self._outputs if outputs)
+
+    def add(self, word, value=None):
+        """添加关键词，匹配时返回 value（默认为关键词本身）"""
+        if self._built:
+            raise RuntimeError('自动机已构建，不能再添加关键词')
+        if not word:
+            return
+        node = 0
+        for char in word:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][char] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._outputs.append(())
+            node = next_node
+        value = word if value is None else value
+        if value not in self._outputs[node]:
+            self._outputs[node] += (value,)
+
+    def build(self):
+        """广度优先计算失配指针，并把失配链上的输出合并到每个节点"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                if self._outputs[self._fail[child]]:
+                    self._outputs[child] += self._outputs[self._fail[child]]
+        self._built = True
+        return self
+
+    def iter_matches(self, text):
+        """逐个产出 (结束位置, 值)"""
+        if not self._built:
+            raise RuntimeError('必须先调用build()')
+        goto, fail, outputs = self._goto, self._fail, self._outputs
+        node = 0
+        for index, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            for value in outputs[node]:
+                yield index, value
+
+    def find(self, text):
+        """文本中出现的全部关键词的值（去重）"""
+        return {value for _, value in self.iter_matches(text)}
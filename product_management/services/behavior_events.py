@@ -0,0 +1,95 @@
+# product_management/services/behavior_events.py
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Min
+from django.utils import timezone
+
+from ..models import BehaviorEvent, UserPreference
+from . import recommendation_cache
+
+
+def record(user_id, kind, tags):
+    """追加一条行为事件（请求中只有这一次INSERT，偏好更新由后台worker完成）"""
+    tags = [str(tag) for tag in tags if tag]
+    if tags:
+        BehaviorEvent.objects.create(user_id=user_id, kind=kind, tags=tags)
+
+
+def record_cart(user, product):
+    """记录加入购物车"""
+    if isinstance(product.tags, list):
+        record(user.id, 'cart', product.tags)
+
+
+def record_search(user, keywords):
+    """记录搜索关键词"""
+    record(user.id, 'search', keywords)
+
+
+def process_batch(batch_size=500):
+    """
+    取出一批未处理事件，按用户聚合后一次性应用到 UserPreference
+    每个用户只读写一次偏好；多个worker并行时通过 SKIP LOCKED 领取不同的事件
+    :return: (处理的事件数, 涉及的用户数)
+    """
+    with transaction.atomic():
+        events = list(
+            BehaviorEvent.objects.select_for_update(skip_locked=True)
+            .filter(processed_at__isnull=True)
+            .order_by('id')[:batch_size]
+        )
+        if not events:
+            return 0, 0
+
+        by_user = defaultdict(list)
+        for event in events:
+            by_user[event.user_id].append(event)
+
+        # 搜索行为只对已有偏好记录的用户生效，下单/加购会为新用户创建偏好记录
+        creators = [user_id for user_id, user_events in by_user.items()
+                    if any(event.kind != 'search' for event in user_events)]
+        UserPreference.objects.bulk_create(
+            [UserPreference(user_id=user_id) for user_id in creators], ignore_conflicts=True
+        )
+        prefs = UserPreference.objects.select_for_update().filter(user_id__in=list(by_user))
+
+        now = timezone.now()
+        updated = []
+        for pref in prefs:
+            pref.apply_events([
+                (event.tags, UserPreference.EVENT_INCREMENTS[event.kind], event.created_at)
+                for event in by_user[pref.user_id]
+            ], commit=False)
+            pref.updated_at = now
+            updated.append(pref)
+        UserPreference.objects.bulk_update(updated, ['preferred_tags', 'updated_at'], batch_size=500)
+
+        BehaviorEvent.objects.filter(id__in=[event.id for event in events]).update(processed_at=now)
+
+        user_ids = [pref.user_id for pref in updated]
+        transaction.on_commit(lambda: _invalidate_recommendations(user_ids))
+
+    return len(events), len(by_user)
+
+
+def _invalidate_recommendations(user_ids):
+    for user_id in user_ids:
+        recommendation_cache.bump_preference_version(user_id)
+
+
+def queue_stats():
+    """队列积压指标：待处理事件数、最早待处理事件的滞后秒数"""
+    pending = BehaviorEvent.objects.filter(processed_at__isnull=True)
+    oldest = pending.aggregate(oldest=Min('created_at'))['oldest']
+    return {
+        'pending': pending.count(),
+        'lag_seconds': (timezone.now() - oldest).total_seconds() if oldest else 0.0,
+    }
+
+
+def purge_processed(days):
+    """删除 days 天前已处理的事件（保留近期历史用于重算偏好）"""
+    cutoff = timezone.now() - timezone.timedelta(days=days)
+    deleted, _ = BehaviorEvent.objects.filter(processed_at__lt=cutoff).delete()
+    return deleted
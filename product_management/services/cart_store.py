@@ -0,0 +1,222 @@
+# product_management/services/cart_store.py
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.module_loading import import_string
+
+from ..models import Product
+
+# 存储格式（可JSON序列化）:
+#   {"lines": {"商品ID": {"quantity": 2, "price": "19.90", "name": "商品名"}}, "total": "39.80"}
+# price/name 是加入购物车时的快照，展示购物车和结算页不再查询商品表；
+# total 随每次增减维护，不必每次遍历计算
+
+
+class CartStore:
+    """
+    购物车存储基类：一次请求内对购物车的多次修改只在内存中进行，
+    调用 save() 时若内容有变化才写一次存储
+    子类实现 _read() / _write(data) / _delete()
+    """
+
+    def __init__(self, request):
+        self.request = request
+        self._data = None
+        self._dirty = False
+
+    # ---- 存储后端 ----
+    def _read(self):
+        raise NotImplementedError
+
+    def _write(self, data):
+        raise NotImplementedError
+
+    def _delete(self):
+        raise NotImplementedError
+
+    # ---- 读取 ----
+    @property
+    def data(self):
+        if self._data is None:
+            data = self._read()
+            self._data = data if isinstance(data, dict) and 'lines' in data else self._empty()
+        return self._data
+
+    @staticmethod
+    def _empty():
+        return {'lines': {}, 'total': '0'}
+
+    def __bool__(self):
+        return bool(self.data['lines'])
+
+    def __len__(self):
+        """不同商品的行数"""
+        return len(self.data['lines'])
+
+    @property
+    def total(self):
+        return Decimal(self.data['total'])
+
+    @property
+    def item_count(self):
+        return sum(line['quantity'] for line in self.data['lines'].values())
+
+    def quantity(self, product_id):
+        line = self.data['lines'].get(str(product_id))
+        return line['quantity'] if line else 0
+
+    def quantities(self):
+        """{商品ID字符串: 数量}，与旧的 session['cart'] 格式一致"""
+        return {product_id: line['quantity'] for product_id, line in self.data['lines'].items()}
+
+    def prices(self):
+        """{商品ID: 快照价}（下单时与当前价格比对）"""
+        return {int(product_id): Decimal(line['price']) for product_id, line in self.data['lines'].items()}
+
+    def lines(self):
+        """购物车明细（价格为快照价），供模板展示"""
+        return [
+            {
+                'product_id': int(product_id),
+                'name': line['name'],
+                'price': Decimal(line['price']),
+                'quantity': line['quantity'],
+                'total_item_price': Decimal(line['price']) * line['quantity'],
+            }
+            for product_id, line in self.data['lines'].items()
+        ]
+
+    # ---- 修改（只改内存并标记为脏） ----
+    def add(self, product, quantity=1):
+        lines = self.data['lines']
+        key = str(product.id)
+        line = lines.get(key)
+        if line is None:
+            line = lines[key] = {'quantity': 0, 'price': str(product.price), 'name': product.name}
+        line['quantity'] += quantity
+        self._adjust_total(Decimal(line['price']) * quantity)
+
+    def remove(self, product_id, quantity=1):
+        """
+        减少数量，减到0时移除该行
+        :return: 实际减少的数量
+        """
+        lines = self.data['lines']
+        key = str(product_id)
+        line = lines.get(key)
+        if line is None:
+            return 0
+        removed = min(quantity, line['quantity'])
+        line['quantity'] -= removed
+        if line['quantity'] <= 0:
+            del lines[key]
+        self._adjust_total(-Decimal(line['price']) * removed)
+        return removed
+
+    def reprice(self, prices):
+        """
+        把快照价更新为当前价格并重算合计（下单时发现价格变化后调用）
+        :param prices: {商品ID: 当前价格}
+        """
+        lines = self.data['lines']
+        for product_id, price in prices.items():
+            line = lines.get(str(product_id))
+            if line is not None:
+                line['price'] = str(price)
+        self.data['total'] = str(sum((Decimal(line['price']) * line['quantity'] for line in lines.values()),
+                                     Decimal('0')))
+        self._dirty = True
+
+    def clear(self):
+        if self.data['lines']:
+            self._data = self._empty()
+            self._dirty = True
+
+    def _adjust_total(self, delta):
+        self.data['total'] = str(self.total + delta) if self.data['lines'] else '0'
+        self._dirty = True
+
+    def save(self):
+        """内容有变化时写入存储（一次请求最多写一次）"""
+        if not self._dirty:
+            return False
+        if self.data['lines']:
+            self._write(self.data)
+        else:
+            self._delete()
+        self._dirty = False
+        return True
+
+
+class SessionCartStore(CartStore):
+    """存放在 request.session['cart']（兼容原有实现，可读取旧的 {商品ID: 数量} 格式）"""
+    SESSION_KEY = 'cart'
+
+    def _read(self):
+        data = self.request.session.get(self.SESSION_KEY)
+        if data and 'lines' not in data:
+            data = self._upgrade(data)
+        return data
+
+    def _upgrade(self, legacy):
+        """旧格式没有价格快照：一次查询补齐，并在下次 save() 时写回新格式"""
+        products = Product.objects.in_bulk([int(product_id) for product_id in legacy])
+        data = self._empty()
+        total = Decimal('0')
+        for product_id, quantity in legacy.items():
+            product = products.get(int(product_id))
+            if product is None or quantity <= 0:
+                continue
+            data['lines'][str(product.id)] = {'quantity': quantity, 'price': str(product.price),
+                                              'name': product.name}
+            total += product.price * quantity
+        data['total'] = str(total)
+        self._dirty = True
+        return data
+
+    def _write(self, data):
+        self.request.session[self.SESSION_KEY] = data
+
+    def _delete(self):
+        self.request.session.pop(self.SESSION_KEY, None)
+
+
+class CacheCartStore(CartStore):
+    """
+    存放在 Django 缓存中（必须是各 worker 共享的后端，见 settings.CACHES；进程内缓存中的购物车只对写入它的 worker 可见）
+    登录用户按用户ID保存，未登录用户按会话ID保存；不占用会话，读写购物车不会改写会话表
+    """
+
+    def _key(self, create=False):
+        user = getattr(self.request, 'user', None)
+        if user is not None and user.is_authenticated:
+            return f'cart:user:{user.pk}'
+        session = self.request.session
+        if session.session_key is None:
+            if not create:
+                return None
+            session.save()
+        return f'cart:session:{session.session_key}'
+
+    def _read(self):
+        key = self._key()
+        return cache.get(key) if key else None
+
+    def _write(self, data):
+        cache.set(self._key(create=True), data, getattr(settings, 'CART_CACHE_TIMEOUT', 7 * 86400))
+
+    def _delete(self):
+        key = self._key()
+        if key:
+            cache.delete(key)
+
+
+def get_cart_store(request):
+    """当前请求的购物车（同一请求内复用同一个实例），后端由 settings.CART_STORE 指定"""
+    store = getattr(request, '_cart_store', None)
+    if store is None:
+        backend = import_string(getattr(settings, 'CART_STORE',
+                                        'product_management.services.cart_store.SessionCartStore'))
+        store = request._cart_store = backend(request)
+    return store
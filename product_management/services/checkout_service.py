@@ -0,0 +1,95 @@
+# product_management/services/checkout_service.py
+import random
+import string
+from datetime import datetime
+
+from django.db import IntegrityError, transaction
+
+from ..models import Order, OrderItem, Product
+from . import stock_service
+
+ORDER_NUMBER_ATTEMPTS = 5  # 订单号冲突时的最大重试次数
+
+
+class CheckoutError(Exception):
+    """下单失败（商品不存在、库存不足、订单号重试耗尽），消息可直接展示给用户"""
+
+
+class PriceChangedError(CheckoutError):
+    """加入购物车后商品价格发生了变化，需要用户按新价格重新确认"""
+
+    def __init__(self, prices):
+        super().__init__('商品价格已变化，请确认新价格后重新提交订单')
+        self.prices = prices  # {商品ID: 当前价格}（只含价格变化的商品）
+
+
+def generate_order_number():
+    return datetime.now().strftime('%Y%m%d') + ''.join(random.choices(string.digits, k=6))
+
+
+def place_order(user, quantities, delivery_info, reserved=True, expected_prices=None):
+    """
+    在一个事务中完成下单：一次查询取出全部商品、（需要时）一条UPDATE扣减全部库存、
+    插入订单、批量插入订单项；查询次数与购物车大小无关，任何一步失败整单回滚
+    :param quantities: {商品ID: 数量}
+    :param reserved: 库存是否已在加入购物车时预留（默认购物车流程已预留，不再重复扣减）
+    :param expected_prices: {商品ID: 用户确认的价格}（购物车快照价）；与当前价格不一致时不下单
+    :raises PriceChangedError: 价格已变化
+    :raises CheckoutError: 无法下单
+    """
+    quantities = {int(product_id): int(quantity) for product_id, quantity in quantities.items() if quantity}
+    if not quantities:
+        raise CheckoutError('购物车为空')
+
+    with transaction.atomic():
+        products = Product.objects.in_bulk(list(quantities))
+        missing = set(quantities) - set(products)
+        if missing:
+            raise CheckoutError(f'商品已下架: {", ".join(map(str, sorted(missing)))}')
+
+        # 按用户在购物车/结算页确认的价格收费：当前价格不同则中止，由用户重新确认
+        if expected_prices is not None:
+            changed = {
+                product_id: products[product_id].price for product_id in quantities
+                if products[product_id].price != expected_prices.get(product_id)
+            }
+            if changed:
+                raise PriceChangedError(changed)
+
+        if not reserved and not stock_service.reserve_many(quantities):
+            raise CheckoutError('库存不足')
+
+        order = Order(
+            user=user,
+            total_amount=sum(products[product_id].price * quantity for product_id, quantity in quantities.items()),
+            payment_method=delivery_info['payment_method'],
+            receiver_name=delivery_info['name'],
+            receiver_phone=delivery_info['phone'],
+            receiver_address=delivery_info['address'],
+            notes=delivery_info.get('notes', ''),
+        )
+        order.set_summary((products[product_id].name, quantity) for product_id, quantity in quantities.items())
+        _insert_with_order_number(order)
+
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=products[product_id], quantity=quantity,
+                      price=products[product_id].price)
+            for product_id, quantity in quantities.items()
+        ])
+    return order
+
+
+def _insert_with_order_number(order):
+    """插入订单，订单号冲突时在保存点内回滚并换号重试"""
+    for _ in range(ORDER_NUMBER_ATTEMPTS):
+        order.order_number = generate_order_number()
+        try:
+            with transaction.atomic():
+                order.save(force_insert=True)
+            return
+        except IntegrityError:
+            if Order.objects.filter(order_number=order.order_number).exists():
+                order.pk = None
+                continue
+            raise
+    raise CheckoutError('订单号生成失败，请重试')
@@ -0,0 +1,46 @@
+# product_management/services/fragment_cache.py
+"""
+商品卡片的模板片段缓存：片段只包含商品自身的字段（名称、价格、库存、按钮），
+以 (模板, 商品ID, 行版本) 为键——商品保存或库存变化时行版本递增，旧片段自然失效，无需主动删除；
+匹配度、相关度、销量等随请求变化的内容在页面模板中渲染，不进入片段
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import get_template
+from django.utils.safestring import mark_safe
+
+from .metrics import CacheStats
+
+FRAGMENT_VERSION = 1  # 修改卡片模板后递增，使已缓存的旧片段全部失效
+CARD_KEY = 'card:{fragment_version}:{template}:{product_id}:{version}'
+
+stats = CacheStats('product_card')
+
+
+def _key(template_name, product):
+    return CARD_KEY.format(fragment_version=FRAGMENT_VERSION, template=template_name,
+                           product_id=product.id, version=product.version)
+
+
+def attach_cards(products, template_name):
+    """
+    为一页商品设置 card_html：一次 get_many 取出已缓存的片段，只渲染未命中的商品，再一次 set_many 写回
+    :param products: 商品对象列表（需包含 version 字段）
+    :return: products
+    """
+    keys = {product.id: _key(template_name, product) for product in products}
+    cached = cache.get_many(list(keys.values())) if keys else {}
+
+    template = None
+    rendered = {}
+    for product in products:
+        html = cached.get(keys[product.id])
+        stats.record(html is not None)
+        if html is None:
+            template = template or get_template(template_name)
+            html = rendered[keys[product.id]] = template.render({'product': product})
+        product.card_html = mark_safe(html)
+
+    if rendered:
+        cache.set_many(rendered, getattr(settings, 'PRODUCT_CARD_CACHE_TIMEOUT', 3600))
+    return products
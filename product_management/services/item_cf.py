@@ -0,0 +1,242 @@
+# product_management/services/item_cf.py
+from array import array
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import (Case, Count, F, FloatField, IntegerField, OuterRef, Q, Subquery, Sum, Value, When,
+                              Window)
+from django.db.models.functions import Cast, Coalesce, NullIf, RowNumber, Sqrt
+from scipy.sparse import csr_matrix
+
+from ..models import Order, OrderItem, Product, ProductBuyerCount, ProductSimilarity
+from .sparse_utils import csr_entries, top_k_per_row
+
+
+def neighbor_count():
+    """每个商品保留的相似商品数"""
+    return getattr(settings, 'ITEM_CF_NEIGHBORS', 20)
+
+
+def _paid_items():
+    return OrderItem.objects.filter(order__status__in=Order.PAID_STATUSES)
+
+
+def _purchase_matrix(chunk_size=50000):
+    """
+    流式读取已支付订单的 (用户, 商品)，构造 0/1 的 用户×商品 稀疏矩阵
+    :return: (矩阵, 列号对应的商品ID数组)
+    """
+    users, products = array('q'), array('q')
+    pairs = _paid_items().values_list('order__user_id', 'product_id')
+    for user_id, product_id in pairs.iterator(chunk_size=chunk_size):
+        users.append(user_id)
+        products.append(product_id)
+
+    user_ids, user_index = np.unique(np.frombuffer(users, dtype=np.int64), return_inverse=True)
+    product_ids, product_index = np.unique(np.frombuffer(products, dtype=np.int64), return_inverse=True)
+    del users, products
+
+    matrix = csr_matrix(
+        (np.ones(user_index.size, dtype=np.float32), (user_index, product_index)),
+        shape=(user_ids.size, product_ids.size),
+    )
+    # 同一用户多次购买同一商品只算一次
+    matrix.sum_duplicates()
+    matrix.data[:] = 1
+    return matrix, product_ids
+
+
+def build(top_n=None, block_size=2000, progress=None):
+    """
+    全量构建商品相似度表：
+    按商品分块计算 共现矩阵 = X[:, 块]ᵀ · X，除以购买者数得到余弦相似度，每行只保留 top_n，
+    内存只与块大小和邻居数有关，不会生成稠密的 商品×商品 矩阵
+    :param progress: 可选回调 progress(已处理商品数, 商品总数)
+    :return: (商品数, 写入的相似度行数)
+    """
+    top_n = top_n or neighbor_count()
+    matrix, product_ids = _purchase_matrix()
+    n_products = product_ids.size
+    buyers = np.asarray(matrix.sum(axis=0), dtype=np.float64).ravel()
+    by_product = matrix.T.tocsr()
+
+    written = 0
+    # 每块算完即写入，内存中只保留一块的相似度行；整个替换在一个事务中，提交前读取方看到的是旧表
+    with transaction.atomic():
+        ProductSimilarity.objects.all().delete()
+        ProductBuyerCount.objects.all().delete()
+        ProductBuyerCount.objects.bulk_create(
+            [ProductBuyerCount(product_id=product_id, buyers=int(count))
+             for product_id, count in zip(product_ids.tolist(), buyers)],
+            batch_size=5000,
+        )
+        for start in range(0, n_products, block_size):
+            stop = min(start + block_size, n_products)
+            co = by_product[start:stop] @ matrix
+            rows, cols, counts = csr_entries(co)
+            keep = cols != rows + start  # 去掉商品与自身
+            rows, cols, counts = rows[keep], cols[keep], counts[keep]
+            scores = counts / np.sqrt(buyers[rows + start] * buyers[cols])
+            rows, cols, scores = top_k_per_row(rows, cols, scores, top_n)
+            # 由相似度和购买者数还原共现数，省去再次按下标取值
+            counts = np.rint(scores * np.sqrt(buyers[rows + start] * buyers[cols])).astype(np.int64).tolist()
+            similarities = [
+                ProductSimilarity(product_id=product_id, neighbor_id=neighbor_id,
+                                  co_count=int(count), score=float(score))
+                for product_id, neighbor_id, count, score in zip(
+                    product_ids[rows + start].tolist(), product_ids[cols].tolist(), counts, scores.tolist()
+                )
+            ]
+            ProductSimilarity.objects.bulk_create(similarities, batch_size=5000)
+            written += len(similarities)
+            if progress:
+                progress(stop, n_products)
+    return n_products, written
+
+
+def update_for_order(order_id, top_n=None):
+    """
+    订单变为已支付后增量更新相似度（不做全量重算）：
+    只有该用户第一次购买的商品会改变购买者数和共现数，
+    对这些商品重新统计与该用户所有已购商品的共现数，再重算涉及它们的相似度并截断到 top_n。
+    查询数与用户的购买历史长度无关（按集合读写，不逐个商品查询），在付款请求的 on_commit 中执行。
+    被截断掉的邻居之后不会自动回到列表中，定期全量构建可校正
+    """
+    top_n = top_n or neighbor_count()
+    order = Order.objects.filter(pk=order_id, status__in=Order.PAID_STATUSES).first()
+    if order is None:
+        return 0
+
+    ordered = set(OrderItem.objects.filter(order=order).values_list('product_id', flat=True))
+    history = set(
+        _paid_items().filter(order__user_id=order.user_id).exclude(order=order)
+        .values_list('product_id', flat=True)
+    )
+    new = ordered - history
+    if not new:
+        return 0
+    bought = ordered | history
+
+    with transaction.atomic():
+        # 购买者数：重新统计而不是 +1，重复处理同一订单也不会多算；
+        # 历史商品在从未全量构建过时也可能没有购买者数行，一并补齐，重算相似度时分母不会缺失
+        counted = set(ProductBuyerCount.objects.filter(product_id__in=bought).values_list('product_id', flat=True))
+        recount = new | (bought - counted)
+        buyer_counts = _buyer_counts(recount)
+        ProductBuyerCount.objects.bulk_create(
+            [ProductBuyerCount(product_id=product_id, buyers=0) for product_id in recount], ignore_conflicts=True
+        )
+        if buyer_counts:
+            ProductBuyerCount.objects.filter(product_id__in=list(buyer_counts)).update(buyers=Case(
+                *[When(product_id=product_id, then=Value(count)) for product_id, count in buyer_counts.items()],
+                output_field=IntegerField(),
+            ))
+
+        co_counts = {}
+        for product_id in new:
+            for neighbor_id, count in _co_counts(product_id, bought - {product_id}).items():
+                co_counts[product_id, neighbor_id] = count
+                co_counts[neighbor_id, product_id] = count
+        _upsert_co_counts(co_counts, new, bought)
+
+        _refresh_scores(Q(product_id__in=new) | Q(neighbor_id__in=new))
+        # 只有已购商品（包括新商品）的列表会新增邻居，其他商品的邻居只是分数变化，只截断这些列表
+        _trim(bought, top_n)
+    return len(new)
+
+
+def _buyer_counts(product_ids):
+    rows = (_paid_items().filter(product_id__in=list(product_ids)).values('product_id')
+            .annotate(buyers=Count('order__user_id', distinct=True)).values_list('product_id', 'buyers'))
+    return dict(rows)
+
+
+def _co_counts(product_id, neighbor_ids):
+    """同时买过 product_id 和 neighbor_ids 中各商品的用户数"""
+    if not neighbor_ids:
+        return {}
+    buyers = _paid_items().filter(product_id=product_id).values('order__user_id')
+    rows = (_paid_items().filter(product_id__in=list(neighbor_ids), order__user_id__in=buyers)
+            .values('product_id').annotate(users=Count('order__user_id', distinct=True))
+            .values_list('product_id', 'users'))
+    return dict(rows)
+
+
+def _upsert_co_counts(co_counts, new, bought):
+    """写入新商品与已购商品两两之间的共现数（co_counts 的键都在 new×bought 或 bought×new 中）"""
+    if not co_counts:
+        return
+    existing = list(ProductSimilarity.objects.filter(
+        Q(product_id__in=list(new), neighbor_id__in=list(bought))
+        | Q(product_id__in=list(bought), neighbor_id__in=list(new))
+    ).only('id', 'product_id', 'neighbor_id', 'co_count'))
+    updated = []
+    for link in existing:
+        count = co_counts.pop((link.product_id, link.neighbor_id), None)
+        if count is not None:
+            link.co_count = count
+            updated.append(link)
+    ProductSimilarity.objects.bulk_update(updated, ['co_count'], batch_size=1000)
+    ProductSimilarity.objects.bulk_create(
+        [ProductSimilarity(product_id=product_id, neighbor_id=neighbor_id, co_count=count)
+         for (product_id, neighbor_id), count in co_counts.items()],
+        ignore_conflicts=True,
+    )
+
+
+def _refresh_scores(condition):
+    """按最新的共现数和购买者数重算相似度（缺少购买者数时按0分处理，不会写入NULL）"""
+    def buyers(field):
+        return Cast(Subquery(
+            ProductBuyerCount.objects.filter(product_id=OuterRef(field)).values('buyers')[:1]
+        ), FloatField())
+
+    denominator = NullIf(Sqrt(buyers('product_id') * buyers('neighbor_id')), Value(0.0))
+    ProductSimilarity.objects.filter(condition).update(
+        score=Coalesce(Cast(F('co_count'), FloatField()) / denominator, Value(0.0), output_field=FloatField())
+    )
+
+
+def _trim(product_ids, top_n):
+    """删除这些商品各自排在 top_n 之后的邻居（一条窗口函数查询找出，一条DELETE删除）"""
+    stale = list(
+        ProductSimilarity.objects.filter(product_id__in=list(product_ids))
+        .annotate(rank=Window(RowNumber(), partition_by=[F('product_id')],
+                              order_by=[F('score').desc(), F('neighbor_id').asc()]))
+        .filter(rank__gt=top_n).values_list('id', flat=True)
+    )
+    if stale:
+        ProductSimilarity.objects.filter(id__in=stale).delete()
+
+
+def similar_products(product_id, n=10):
+    """与某商品最相似的商品（按相似度降序）"""
+    neighbor_ids = list(
+        ProductSimilarity.objects.filter(product_id=product_id)
+        .order_by('-score', 'neighbor_id').values_list('neighbor_id', flat=True)[:n]
+    )
+    products = Product.objects.in_bulk(neighbor_ids)
+    return [products[pk] for pk in neighbor_ids if pk in products]
+
+
+def related_to(product_ids, n=10):
+    """
+    一组商品（如订单、购物车）的关联推荐：邻居相似度求和后取前 n 个，排除这组商品本身
+    :return: 带 similarity 属性的商品列表
+    """
+    product_ids = list(product_ids)
+    rows = list(
+        ProductSimilarity.objects.filter(product_id__in=product_ids)
+        .exclude(neighbor_id__in=product_ids)
+        .values('neighbor_id').annotate(total=Sum('score'))
+        .order_by('-total', 'neighbor_id').values_list('neighbor_id', 'total')[:n]
+    )
+    products = Product.objects.in_bulk([neighbor_id for neighbor_id, _ in rows])
+    related = []
+    for neighbor_id, total in rows:
+        if neighbor_id in products:
+            product = products[neighbor_id]
+            product.similarity = total
+            related.append(product)
+    return related
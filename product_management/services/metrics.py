@@ -0,0 +1,286 @@
+# product_management/services/metrics.py
+"""
+进程内指标（计数器、直方图），以 Prometheus 文本格式导出
+多进程部署（gunicorn多个worker）时设置 METRICS_DIR：各进程定期把快照写到 <METRICS_DIR>/<pid>-<启动时间>.json，
+/metrics 读取全部快照求和后输出；worker 退出时（gunicorn child_exit 钩子，见 gunicorn.conf.py）
+其快照并入 archive.json 后删除——计数器总和不回退，快照文件数也不随 worker 重启增长
+"""
+import bisect
+import functools
+import glob
+import json
+import math
+import os
+import threading
+import time
+
+from django.conf import settings
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+FUNCTION_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+ARCHIVE_FILE = 'archive.json'  # 已退出 worker 的累计快照
+
+DESCRIPTIONS = {
+    'http_requests_total': ('counter', 'Requests by URL name, method and status code'),
+    'http_request_duration_seconds': ('histogram', 'Request latency by URL name'),
+    'http_request_db_queries': ('histogram', 'SQL queries executed per request by URL name'),
+    'http_request_db_seconds_total': ('counter', 'Time spent executing SQL by URL name'),
+    'app_function_duration_seconds': ('histogram', 'Time spent in instrumented tagging/preference functions'),
+    'cache_requests_total': ('counter', 'Cache lookups by cache and result (hit/miss)'),
+}
+
+
+class Registry:
+    """标签固定为排好序的 ((名称, 值), ...) 元组；直方图存各桶（非累计）计数与总和"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.pid = os.getpid()
+        # 快照文件名：PID 加进程启动时间，PID 被复用时不会覆盖已退出 worker 的快照
+        self.token = f'{self.pid}-{time.time_ns()}'
+        self.counters = {}
+        self.histograms = {}
+        self.flushed_at = 0.0
+
+    def _check_fork(self):
+        # fork 出的子进程（gunicorn --preload）不继承父进程的计数
+        if self.pid != os.getpid():
+            self._reset()
+
+    def inc(self, name, labels, value=1):
+        with self._lock:
+            self._check_fork()
+            key = (name, labels)
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, labels, value, buckets):
+        index = bisect.bisect_left(buckets, value)
+        with self._lock:
+            self._check_fork()
+            key = (name, labels)
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = {'buckets': buckets, 'counts': [0] * (len(buckets) + 1),
+                                                    'sum': 0.0}
+            histogram['counts'][index] += 1
+            histogram['sum'] += value
+
+    def snapshot(self):
+        with self._lock:
+            self._check_fork()
+            return {
+                'counters': [[name, list(labels), value] for (name, labels), value in self.counters.items()],
+                'histograms': [[name, list(labels), list(h['buckets']), list(h['counts']), h['sum']]
+                               for (name, labels), h in self.histograms.items()],
+            }
+
+
+registry = Registry()
+
+
+def _labels(**labels):
+    return tuple(sorted(labels.items()))
+
+
+def inc(name, value=1, **labels):
+    registry.inc(name, _labels(**labels), value)
+
+
+def observe(name, value, buckets, **labels):
+    registry.observe(name, _labels(**labels), value, buckets)
+
+
+def record_cache(cache_name, hit):
+    inc('cache_requests_total', cache=cache_name, result='hit' if hit else 'miss')
+
+
+class CacheStats:
+    """进程内命中/未命中计数（用于评估缓存容量），同时计入 cache_requests_total 指标"""
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def record(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        record_cache(self.name, hit)
+
+    def as_dict(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
+
+
+def observe_request(view, method, status, duration, queries, db_seconds):
+    labels = (('view', view),)
+    registry.inc('http_requests_total', (('method', method), ('status', str(status)), ('view', view)))
+    registry.observe('http_request_duration_seconds', labels, duration, LATENCY_BUCKETS)
+    registry.observe('http_request_db_queries', labels, queries, QUERY_BUCKETS)
+    registry.inc('http_request_db_seconds_total', labels, db_seconds)
+
+
+def timed(function_name):
+    """记录被装饰函数的耗时到 app_function_duration_seconds{function=...}"""
+    labels = (('function', function_name),)
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                registry.observe('app_function_duration_seconds', labels,
+                                 time.perf_counter() - started, FUNCTION_BUCKETS)
+        return wrapper
+    return decorator
+
+
+# ---- 多进程汇总 ----
+
+def _metrics_dir():
+    return getattr(settings, 'METRICS_DIR', None)
+
+
+def flush(force=False):
+    """把本进程快照写入 METRICS_DIR（按 METRICS_FLUSH_INTERVAL 节流，先写临时文件再原子替换）"""
+    directory = _metrics_dir()
+    if not directory:
+        return False
+    now = time.monotonic()
+    if not force and now - registry.flushed_at < getattr(settings, 'METRICS_FLUSH_INTERVAL', 5):
+        return False
+    registry.flushed_at = now
+
+    os.makedirs(directory, exist_ok=True)
+    snapshot = registry.snapshot()
+    _write_snapshot(os.path.join(directory, f'{registry.token}.json'), snapshot)
+    return True
+
+
+def _write_snapshot(path, snapshot):
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(snapshot, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def _read_snapshots(paths):
+    snapshots = []
+    for path in paths:
+        try:
+            with open(path, encoding='utf-8') as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+
+def collect():
+    """汇总所有进程的快照（未设置 METRICS_DIR 时只有本进程），包括已退出 worker 的累计快照 archive.json"""
+    directory = _metrics_dir()
+    if not directory:
+        return [registry.snapshot()]
+    flush(force=True)
+    return _read_snapshots(glob.glob(os.path.join(directory, '*.json')))
+
+
+def mark_process_dead(pid, directory=None):
+    """
+    worker 退出后调用（gunicorn child_exit 钩子，在主进程中执行）：
+    把该 PID 的快照累加进 archive.json 后删除，已退出 worker 的计数仍计入总和
+    :return: 并入的快照文件数
+    """
+    directory = directory or _metrics_dir()
+    if not directory:
+        return 0
+    paths = glob.glob(os.path.join(directory, f'{pid}-*.json'))
+    if not paths:
+        return 0
+    archive = os.path.join(directory, ARCHIVE_FILE)
+    counters, histograms = merge(_read_snapshots([archive, *paths]))
+    _write_snapshot(archive, {
+        'counters': [[name, list(labels), value] for (name, labels), value in counters.items()],
+        'histograms': [[name, list(labels), list(h['buckets']), h['counts'], h['sum']]
+                       for (name, labels), h in histograms.items()],
+    })
+    for path in paths + glob.glob(os.path.join(directory, f'{pid}-*.json.tmp')):
+        os.remove(path)
+    return len(paths)
+
+
+def merge(snapshots):
+    """
+    按指标名和标签求和；同一直方图在不同快照中的桶边界不一致时报错
+    （修改了桶边界的部署需要先清空 METRICS_DIR，否则新旧计数无法相加）
+    """
+    counters, histograms = {}, {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot['counters']:
+            key = (name, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, buckets, counts, total in snapshot['histograms']:
+            key = (name, tuple(map(tuple, labels)))
+            merged = histograms.get(key)
+            if merged is None:
+                histograms[key] = {'buckets': list(buckets), 'counts': list(counts), 'sum': total}
+            elif merged['buckets'] != list(buckets):
+                raise ValueError(f'直方图 {name}{dict(key[1])} 的桶边界不一致: {merged["buckets"]} != {list(buckets)}，'
+                                 f'修改桶边界后请清空 METRICS_DIR')
+            else:
+                merged['counts'] = [a + b for a, b in zip(merged['counts'], counts)]
+                merged['sum'] += total
+    return counters, histograms
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in pairs) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render():
+    """Prometheus 文本格式（text/plain; version=0.0.4）"""
+    counters, histograms = merge(collect())
+    lines = []
+    names = sorted({name for name, _ in counters} | {name for name, _ in histograms})
+    for name in names:
+        kind, description = DESCRIPTIONS.get(name, ('untyped', name))
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} {kind}')
+        for (metric, labels), value in sorted(counters.items()):
+            if metric == name:
+                lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        for (metric, labels), histogram in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(list(histogram['buckets']) + [math.inf], histogram['counts']):
+                cumulative += count
+                le = '+Inf' if math.isinf(bound) else repr(float(bound))
+                lines.append(f'{name}_bucket{_format_labels(labels, [("le", le)])} {cumulative}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {_format_value(float(histogram["sum"]))}')
+            lines.append(f'{name}_count{_format_labels(labels)} {cumulative}')
+    return '\n'.join(lines) + '\n'
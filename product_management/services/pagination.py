@@ -0,0 +1,108 @@
+# product_management/services/pagination.py
+from datetime import datetime
+from decimal import Decimal
+
+from django.conf import settings
+from django.core import signing
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+CURSOR_SALT = 'product_management.keyset'
+
+
+class KeysetPage:
+    """一页结果：object_list 为本页对象，next_cursor 为下一页游标（没有下一页时为None）"""
+
+    def __init__(self, object_list, next_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class KeysetPaginator:
+    """
+    游标（keyset）分页
+    用上一页最后一行的排序键生成不透明游标，下一页用 WHERE 条件接着取，
+    不使用 OFFSET 和 COUNT(*)，第N页与第1页成本相同
+    :param ordering: 排序字段，如 ['-match_score', '-id']，最后一个字段必须唯一
+    :param page_size: 每页条数
+    """
+
+    def __init__(self, ordering, page_size):
+        self.ordering = [(field.lstrip('-'), field.startswith('-')) for field in ordering]
+        self.page_size = page_size
+
+    def paginate(self, queryset, cursor=None):
+        """取一页；游标无效（被篡改或过期格式）时从第一页开始"""
+        queryset = queryset.order_by(*[f"{'-' if desc else ''}{name}" for name, desc in self.ordering])
+        values = self.decode(cursor) if cursor else None
+        if values is not None:
+            queryset = queryset.filter(self._after(values))
+
+        rows = list(queryset[:self.page_size + 1])
+        if len(rows) <= self.page_size:
+            return KeysetPage(rows, None)
+        rows = rows[:self.page_size]
+        return KeysetPage(rows, self.encode([_field(rows[-1], name) for name, _ in self.ordering]))
+
+    def _after(self, values):
+        """(a, b, c) 之后的行: a<va OR (a=va AND b<vb) OR (a=va AND b=vb AND c<vc)（升序字段用 >）"""
+        condition = Q()
+        equal = Q()
+        for (name, desc), value in zip(self.ordering, values):
+            condition |= equal & Q(**{f"{name}__{'lt' if desc else 'gt'}": value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def encode(self, values):
+        return signing.dumps([_dump(value) for value in values], salt=CURSOR_SALT, compress=True)
+
+    def decode(self, cursor):
+        try:
+            values = [_load(value) for value in signing.loads(cursor, salt=CURSOR_SALT)]
+        except (signing.BadSignature, TypeError, ValueError):
+            return None
+        return values if len(values) == len(self.ordering) else None
+
+
+def _field(row, name):
+    """行可以是模型对象，也可以是 .values() 返回的字典"""
+    return row[name] if isinstance(row, dict) else getattr(row, name)
+
+
+def _dump(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    if isinstance(value, Decimal):
+        return {'dec': str(value)}
+    return value
+
+
+def _load(value):
+    if isinstance(value, dict):
+        if 'dt' in value:
+            return parse_datetime(value['dt'])
+        if 'dec' in value:
+            return Decimal(value['dec'])
+        raise ValueError('unknown cursor value')
+    return value
+
+
+def page_size_from(request, default=None):
+    """读取 ?page_size= 参数，限制在 1..MAX_PAGE_SIZE 之间"""
+    default = default or getattr(settings, 'PRODUCT_PAGE_SIZE', 20)
+    maximum = getattr(settings, 'MAX_PAGE_SIZE', 100)
+    try:
+        size = int(request.GET.get('page_size', default))
+    except (TypeError, ValueError):
+        size = default
+    return max(1, min(size, maximum))
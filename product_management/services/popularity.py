@@ -0,0 +1,174 @@
+# product_management/services/popularity.py
+from collections import Counter
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from ..models import Order, OrderItem, Product, ProductPopularity, ProductSalesBucket, Sale
+from . import recommendation_cache
+
+WINDOWS = ProductPopularity.WINDOWS
+RETENTION_DAYS = max(WINDOWS.values()) + 1  # 小时桶保留天数（最长窗口再多一天）
+# 按销量排序的游标分页键（with_sales 的注解）：与热度表 (sales_<窗口>, product_id) 复合索引的列顺序一致
+SALES_ORDERING = ['-sales', '-popularity_pk']
+
+
+def _hour(at):
+    return at.replace(minute=0, second=0, microsecond=0)
+
+
+def _increment(field, quantities):
+    """F(field) + 各商品的增量（一条UPDATE更新全部商品）"""
+    return F(field) + Case(
+        *[When(pk=product_id, then=Value(quantity)) for product_id, quantity in quantities.items()],
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+
+
+def ensure_rows(product_ids):
+    """为商品建立热度行（商品创建、批量导入后调用）：每个商品都有热度行，按销量排序时可以内连接走索引"""
+    ProductPopularity.objects.bulk_create(
+        [ProductPopularity(product_id=product_id) for product_id in product_ids], ignore_conflicts=True
+    )
+
+
+def record_sales(quantities, at=None):
+    """
+    增量累加销量：写入对应的小时桶，并把增量加到仍包含该时刻的各窗口及总销量上
+    :param quantities: {商品ID: 数量}
+    """
+    quantities = {int(product_id): int(quantity) for product_id, quantity in quantities.items() if quantity > 0}
+    if not quantities:
+        return
+    now = timezone.now()
+    at = at or now
+    hour = _hour(at)
+
+    with transaction.atomic():
+        ProductSalesBucket.objects.bulk_create(
+            [ProductSalesBucket(product_id=product_id, hour=hour) for product_id in quantities],
+            ignore_conflicts=True,
+        )
+        buckets = ProductSalesBucket.objects.filter(product_id__in=list(quantities), hour=hour)
+        buckets.update(quantity=F('quantity') + Case(
+            *[When(product_id=product_id, then=Value(quantity)) for product_id, quantity in quantities.items()],
+            default=Value(0),
+            output_field=IntegerField(),
+        ))
+
+        ensure_rows(quantities)
+        fields = {'sales_total': _increment('sales_total', quantities)}
+        for window, days in WINDOWS.items():
+            if at >= now - timedelta(days=days):
+                fields[f'sales_{window}'] = _increment(f'sales_{window}', quantities)
+        ProductPopularity.objects.filter(pk__in=list(quantities)).update(**fields, updated_at=now)
+        transaction.on_commit(recommendation_cache.bump_popularity_version)
+
+
+def record_order(order_id):
+    """订单付款后累加其商品销量"""
+    quantities = Counter()
+    for product_id, quantity in OrderItem.objects.filter(order_id=order_id).values_list('product_id', 'quantity'):
+        quantities[product_id] += quantity
+    record_sales(quantities)
+
+
+def refresh(now=None, chunk_size=1000):
+    """
+    重新汇总各窗口销量，让超出窗口的小时桶滑出（建议每小时执行一次），并清理过期的小时桶
+    只读取保留期内的小时桶，只写回有变化的行
+    :return: 更新的商品数
+    """
+    now = now or timezone.now()
+    sums = {}
+    for window, days in WINDOWS.items():
+        rows = (ProductSalesBucket.objects.filter(hour__gte=_hour(now) - timedelta(days=days) + timedelta(hours=1))
+                .values('product_id').annotate(total=Sum('quantity')).values_list('product_id', 'total'))
+        sums[window] = dict(rows)
+
+    fields = [f'sales_{window}' for window in WINDOWS]
+    stamp = timezone.now()  # now 可由调用方指定为过去的时刻，写入时间始终取当前时间
+    updated, chunk = 0, []
+    with transaction.atomic():
+        rows = ProductPopularity.objects.only('pk', *fields).order_by('pk')
+        for popularity in rows.iterator(chunk_size=chunk_size):
+            changed = False
+            for window in WINDOWS:
+                value = sums[window].get(popularity.pk, 0)
+                if getattr(popularity, f'sales_{window}') != value:
+                    setattr(popularity, f'sales_{window}', value)
+                    changed = True
+            if changed:
+                popularity.updated_at = stamp
+                chunk.append(popularity)
+            if len(chunk) >= chunk_size:
+                ProductPopularity.objects.bulk_update(chunk, [*fields, 'updated_at'])
+                updated += len(chunk)
+                chunk = []
+        if chunk:
+            ProductPopularity.objects.bulk_update(chunk, [*fields, 'updated_at'])
+            updated += len(chunk)
+        ProductSalesBucket.objects.filter(hour__lt=_hour(now) - timedelta(days=RETENTION_DAYS)).delete()
+        if updated:
+            transaction.on_commit(recommendation_cache.bump_popularity_version)
+    return updated
+
+
+def rebuild(now=None, chunk_size=5000):
+    """
+    由全部已支付订单和 Sale 记录重建小时桶与总销量（首次上线或数据修复时使用），之后按窗口汇总
+    订单没有付款时间，按下单时间计入；没有销量的商品也写入热度行（销量为0）
+    """
+    now = now or timezone.now()
+    since = _hour(now) - timedelta(days=RETENTION_DAYS)
+    buckets, totals = Counter(), Counter()
+
+    order_lines = OrderItem.objects.filter(order__status__in=Order.PAID_STATUSES)
+    for product_id, hour, quantity in (order_lines.filter(order__created_at__gte=since)
+                                       .values('product_id', hour=TruncHour('order__created_at'))
+                                       .annotate(quantity=Sum('quantity'))
+                                       .values_list('product_id', 'hour', 'quantity')):
+        buckets[product_id, hour] += quantity
+    for product_id, hour, quantity in (Sale.objects.filter(date__gte=since)
+                                       .values('product_id', hour=TruncHour('date'))
+                                       .annotate(quantity=Sum('quantity'))
+                                       .values_list('product_id', 'hour', 'quantity')):
+        buckets[product_id, hour] += quantity
+    for queryset in (order_lines.values('product_id'), Sale.objects.values('product_id')):
+        for product_id, quantity in queryset.annotate(total=Sum('quantity')).values_list('product_id', 'total'):
+            totals[product_id] += quantity
+
+    with transaction.atomic():
+        ProductSalesBucket.objects.all().delete()
+        ProductSalesBucket.objects.bulk_create(
+            [ProductSalesBucket(product_id=product_id, hour=hour, quantity=quantity)
+             for (product_id, hour), quantity in buckets.items()],
+            batch_size=5000,
+        )
+        ProductPopularity.objects.all().delete()
+        product_ids = Product.objects.order_by('id').values_list('id', flat=True)
+        chunk = []
+        for product_id in product_ids.iterator(chunk_size=chunk_size):
+            chunk.append(ProductPopularity(product_id=product_id, sales_total=totals.get(product_id, 0)))
+            if len(chunk) >= chunk_size:
+                ProductPopularity.objects.bulk_create(chunk)
+                chunk = []
+        ProductPopularity.objects.bulk_create(chunk)
+        refresh(now)
+        transaction.on_commit(recommendation_cache.bump_popularity_version)
+    return len(totals)
+
+
+def with_sales(products, window='7d'):
+    """
+    为商品查询集加上 sales（热度表的窗口销量列）和 popularity_pk（热度表主键，即商品ID）注解
+    每个商品都有热度行（创建/导入时建立，迁移回填），这里内连接热度表：
+    按 SALES_ORDERING 排序和翻页时由 (sales_<窗口>, product_id) 复合索引驱动，不需要对全表排序
+    """
+    return products.filter(popularity__isnull=False).annotate(
+        sales=F(f'popularity__sales_{window}'), popularity_pk=F('popularity__product_id'),
+    )
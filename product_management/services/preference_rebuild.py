@@ -0,0 +1,207 @@
+# product_management/services/preference_rebuild.py
+from array import array
+
+import numpy as np
+from django.db import transaction
+from django.db.models import F, Max, Q
+from django.db.models.functions import Mod
+from django.utils import timezone
+
+from ..models import BehaviorEvent, Order, OrderItem, UserPreference
+from . import recommendation_cache
+from .sparse_utils import top_k_per_row
+
+
+class _History:
+    """按列存放的行为历史：(用户, 标签编号, 时间戳, 权重增量)"""
+
+    def __init__(self):
+        self.users = array('q')
+        self.tags = array('q')
+        self.times = array('d')
+        self.increments = array('d')
+        self.tag_ids = {}
+        self.creators = set()  # 有下单/加购行为、需要时新建偏好记录的用户
+
+    def add(self, user_id, tags, at, increment):
+        if isinstance(tags, dict):
+            tags = list(tags)
+        elif not isinstance(tags, list):
+            return
+        timestamp = at.timestamp()
+        for tag in tags:
+            if not tag:
+                continue
+            tag = str(tag)
+            self.users.append(user_id)
+            self.tags.append(self.tag_ids.setdefault(tag, len(self.tag_ids)))
+            self.times.append(timestamp)
+            self.increments.append(increment)
+
+
+def _partition(queryset, field, partitions, partition):
+    if partitions <= 1:
+        return queryset
+    return queryset.annotate(_bucket=Mod(F(field), partitions)).filter(_bucket=partition)
+
+
+def high_water_mark():
+    """当前最大的行为事件ID：重算使用不超过它的事件，之后到达的事件在写入时重放"""
+    return BehaviorEvent.objects.aggregate(mark=Max('id'))['mark'] or 0
+
+
+def load_history(partitions=1, partition=0, chunk_size=5000, mark=None, cutoff=None):
+    """
+    流式读取已支付订单的商品标签和ID不超过 mark 的加购/搜索事件（只取 user_id % partitions == partition 的用户）
+    其中尚未处理的事件在 write() 中标记为已处理，不会再被 process_behavior_events 重复累加
+    :param cutoff: 只读取最后修改时间不晚于该时刻的订单（与 mark 同时取得）：之后付款的订单
+                   由其下单事件在写入时重放或由 worker 应用，不能在这里再计一次
+    """
+    history = _History()
+    increments = UserPreference.EVENT_INCREMENTS
+
+    paid = OrderItem.objects.filter(order__status__in=Order.PAID_STATUSES)
+    if cutoff is not None:
+        paid = paid.filter(order__updated_at__lte=cutoff)
+    lines = _partition(
+        paid,
+        'order__user_id', partitions, partition,
+    ).values_list('order__user_id', 'order__created_at', 'product__tags')
+    for user_id, created_at, tags in lines.iterator(chunk_size=chunk_size):
+        history.add(user_id, tags, created_at, increments['order'])
+        history.creators.add(user_id)
+
+    events = BehaviorEvent.objects.exclude(kind='order')
+    if mark is not None:
+        events = events.filter(id__lte=mark)
+    events = _partition(
+        events,
+        'user_id', partitions, partition,
+    ).values_list('user_id', 'kind', 'created_at', 'tags')
+    for user_id, kind, created_at, tags in events.iterator(chunk_size=chunk_size):
+        history.add(user_id, tags, created_at, increments[kind])
+        if kind != 'search':
+            history.creators.add(user_id)
+    return history
+
+
+def aggregate(history, now=None):
+    """
+    向量化计算每个用户的标签权重（与 UserPreference 的衰减规则一致）：
+      存储权重 = Σ 增量 × 0.5 ** ((该标签最后一次行为时间 - 行为时间) / 衰减周期)
+    再按当前时刻的衰减后权重清理低于 MIN_WEIGHT 的标签、每个用户保留前 MAX_TAGS 个
+    :return: {user_id: preferred_tags}
+    """
+    if not history.users:
+        return {}
+    now = (now or timezone.now()).timestamp()
+    period = UserPreference.DECAY_PERIOD * 86400
+    users = np.frombuffer(history.users, dtype=np.int64)
+    tags = np.frombuffer(history.tags, dtype=np.int64)
+    times = np.frombuffer(history.times, dtype=np.float64)
+    increments = np.frombuffer(history.increments, dtype=np.float64)
+
+    user_ids, user_index = np.unique(users, return_inverse=True)
+    pairs, pair_index = np.unique(user_index * len(history.tag_ids) + tags, return_inverse=True)
+    last = np.full(pairs.size, -np.inf)
+    np.maximum.at(last, pair_index, times)
+    weights = np.bincount(pair_index, weights=increments * 0.5 ** ((last[pair_index] - times) / period),
+                          minlength=pairs.size)
+    current = weights * 0.5 ** (np.maximum(now - last, 0) / period)
+
+    keep = current >= UserPreference.MIN_WEIGHT
+    rows = pairs[keep] // len(history.tag_ids)
+    order = np.flatnonzero(keep)
+    rows, picked, _ = top_k_per_row(rows, np.arange(order.size), current[keep], UserPreference.MAX_TAGS)
+    picked = order[picked]
+
+    names = np.empty(len(history.tag_ids), dtype=object)
+    for tag, tag_id in history.tag_ids.items():
+        names[tag_id] = tag
+    result = {}
+    tz = timezone.get_current_timezone()
+    for row, index in zip(rows.tolist(), picked.tolist()):
+        user_tags = result.setdefault(int(user_ids[row]), {})
+        user_tags[names[pairs[index] % len(history.tag_ids)]] = {
+            'weight': float(weights[index]),
+            'last_updated': timezone.datetime.fromtimestamp(last[index], tz).isoformat(),
+        }
+    return result
+
+
+def write(preferences, creators, mark, partitions=1, partition=0, chunk_size=1000, cutoff=None):
+    """
+    为有下单/加购行为的新用户建立偏好记录后，分块写入本分区全部偏好记录（没有任何历史的记录清空）
+    重算期间 process_behavior_events 仍在运行，每块在一个事务中：
+      1. 锁定并标记这些用户已计入重算结果的未处理事件（worker 不再重复应用）：ID不超过 mark 的事件，
+         以及 cutoff 之前产生的下单事件（订单在 cutoff 前付款、已由订单扫描计入，事件在取 mark 之后才写入）；
+      2. 锁定偏好记录（worker 应用事件时同样先锁事件、再锁偏好，与本事务串行）；
+      3. 把 worker 在重算期间已应用的、未计入重算结果的事件重放到重算结果上再写入，不会被覆盖丢失
+    提交后推进这些用户的偏好版本，使其推荐结果缓存失效
+    :return: (更新的记录数, 新建的记录数)
+    """
+    existing = set(_partition(UserPreference.objects.all(), 'user_id', partitions, partition)
+                   .values_list('user_id', flat=True))
+    new_users = sorted(creators - existing)
+    UserPreference.objects.bulk_create([UserPreference(user_id=user_id) for user_id in new_users],
+                                       batch_size=chunk_size, ignore_conflicts=True)
+
+    user_ids = _partition(UserPreference.objects.all(), 'user_id', partitions, partition) \
+        .order_by('user_id').values_list('user_id', flat=True)
+    written, chunk = 0, []
+    for user_id in user_ids.iterator(chunk_size=chunk_size):
+        chunk.append(user_id)
+        if len(chunk) >= chunk_size:
+            written += _write_chunk(chunk, preferences, mark, cutoff)
+            chunk = []
+    if chunk:
+        written += _write_chunk(chunk, preferences, mark, cutoff)
+    return written - len(new_users), len(new_users)
+
+
+def _write_chunk(user_ids, preferences, mark, cutoff=None):
+    counted = Q(id__lte=mark)
+    if cutoff is not None:
+        counted |= Q(kind='order', created_at__lte=cutoff)
+    with transaction.atomic():
+        claimed = list(
+            BehaviorEvent.objects.select_for_update()
+            .filter(counted, user_id__in=user_ids, processed_at__isnull=True).values_list('id', flat=True)
+        )
+        if claimed:
+            BehaviorEvent.objects.filter(id__in=claimed).update(processed_at=timezone.now())
+
+        prefs = list(UserPreference.objects.select_for_update().filter(user_id__in=user_ids))
+        replay = {}
+        for event in (BehaviorEvent.objects.filter(user_id__in=user_ids, processed_at__isnull=False)
+                      .exclude(counted).order_by('id')):
+            replay.setdefault(event.user_id, []).append(
+                (event.tags, UserPreference.EVENT_INCREMENTS[event.kind], event.created_at)
+            )
+        now = timezone.now()
+        for pref in prefs:
+            pref.preferred_tags = dict(preferences.get(pref.user_id, {}))
+            pref.updated_at = now
+            if pref.user_id in replay:
+                pref.apply_events(replay[pref.user_id], commit=False)
+        UserPreference.objects.bulk_update(prefs, ['preferred_tags', 'updated_at'])
+
+        transaction.on_commit(lambda: _invalidate_recommendations(user_ids))
+    return len(prefs)
+
+
+def _invalidate_recommendations(user_ids):
+    for user_id in user_ids:
+        recommendation_cache.bump_preference_version(user_id)
+
+
+def rebuild_partition(partitions=1, partition=0, chunk_size=1000, now=None):
+    """重算一个分区内所有用户的偏好 :return: (更新数, 新建数)"""
+    # 先取事件高水位、再取时间截止点，然后读订单与事件历史：截止点之后付款的订单不读取，
+    # 由其下单事件（ID大于高水位）在写入时重放或由 worker 应用，每个订单只计一次。
+    # 高水位在前：ID不超过高水位的下单事件一定产生于截止点之前，对应的订单一定在扫描范围内
+    mark = high_water_mark()
+    cutoff = timezone.now()
+    history = load_history(partitions, partition, chunk_size=max(chunk_size, 2000), mark=mark, cutoff=cutoff)
+    preferences = aggregate(history, now)
+    return write(preferences, history.creators, mark, partitions, partition, chunk_size, cutoff=cutoff)
@@ -0,0 +1,73 @@
+# product_management/services/ranking.py
+import bisect
+
+from django.conf import settings
+
+from ..models import Product, UserPreference
+from . import recommendation_cache
+from .pagination import KeysetPage, KeysetPaginator
+from .scoring_engine import scoring_engine
+
+
+def _build_ranking(user):
+    """
+    计算用户排名靠前的商品 [(商品ID, 匹配度), ...]（推荐结果缓存未命中时调用）
+    使用用户的全部偏好标签，由评分引擎在内存中对全部商品打分
+    """
+    try:
+        pref = UserPreference.objects.get(user=user)
+    except UserPreference.DoesNotExist:
+        return {'tags': None}
+
+    tags = pref.get_top_preferences(n=None)
+    limit = getattr(settings, 'RECOMMENDATION_CACHE_SIZE', 500)
+    ranking = scoring_engine.rank(tags, limit)
+    return {'tags': tags, 'ranking': ranking, 'complete': len(ranking) < limit}
+
+
+def recommend_page(user, page_size, cursor=None, fields=None):
+    """
+    登录用户的个性化商品列表（一页）
+    排名ID列表来自推荐结果缓存，只加载当前页的商品；
+    翻页超出缓存窗口时，用缓存中的偏好标签让评分引擎从游标位置之后重新取一页
+    :param fields: 指定时返回只含这些字段（须含 id）和 match_score 的字典，不构造模型对象（JSON接口使用）
+    :return: KeysetPage，用户没有偏好记录时返回None
+    """
+    entry = recommendation_cache.get_ranking(user.id, lambda: _build_ranking(user))
+    if entry['tags'] is None:
+        return None
+
+    paginator = KeysetPaginator(['-match_score', '-id'], page_size)
+    ranking = entry['ranking']
+    start = 0
+    if cursor:
+        after = paginator.decode(cursor)
+        if after is not None:
+            # 排名按 (-匹配度, -id) 升序排列，二分定位游标之后的位置
+            start = bisect.bisect_right(ranking, (-after[0], -after[1]), key=lambda row: (-row[1], -row[0]))
+
+    rows = ranking[start:start + page_size + 1]
+    if len(rows) <= page_size and not entry['complete']:
+        after = paginator.decode(cursor) if cursor else None
+        rows = scoring_engine.rank(entry['tags'], page_size + 1, after=tuple(after) if after else None)
+    has_next = len(rows) > page_size
+
+    rows = rows[:page_size]
+    product_ids = [product_id for product_id, _ in rows]
+    if fields:
+        products = {row['id']: row for row in Product.objects.filter(id__in=product_ids).values(*fields)}
+    else:
+        products = Product.objects.in_bulk(product_ids)
+    page = []
+    for product_id, score in rows:
+        product = products.get(product_id)
+        if product is None:
+            continue
+        if fields:
+            product['match_score'] = score
+        else:
+            product.match_score = score
+        page.append(product)
+
+    next_cursor = paginator.encode(list(rows[-1][::-1])) if has_next and rows else None
+    return KeysetPage(page, next_cursor)
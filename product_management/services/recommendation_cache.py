@@ -0,0 +1,112 @@
+# product_management/services/recommendation_cache.py
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+
+from . import metrics
+
+PREFERENCE_VERSION_KEY = 'rec:pref_version:{user_id}'
+CATALOG_VERSION_KEY = 'rec:catalog_version'
+INVENTORY_VERSION_KEY = 'rec:inventory_version'
+POPULARITY_VERSION_KEY = 'rec:popularity_version'
+RANKING_KEY = 'rec:ranking:{user_id}:{pref_version}:{catalog_version}'
+
+# 只在当前进程内有效的缓存后端：版本计数的推进无法传到其他 worker 和管理命令
+PROCESS_LOCAL_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+stats = metrics.CacheStats('recommendation')
+
+
+def check_shared_cache():
+    """
+    启动时检查默认缓存是否为多进程共享的后端（REQUIRE_SHARED_CACHE 为True时）
+    版本计数放在进程内缓存里时，其他 worker 和管理命令的推进永远看不到，推荐结果与ETag会一直停留在旧数据上
+    """
+    if not getattr(settings, 'REQUIRE_SHARED_CACHE', True):
+        return
+    backend = settings.CACHES.get('default', {}).get('BACKEND', 'django.core.cache.backends.locmem.LocMemCache')
+    if backend in PROCESS_LOCAL_BACKENDS:
+        raise ImproperlyConfigured(
+            f'CACHES["default"] uses the process-local backend {backend}; recommendation/ETag version counters '
+            f'and cached carts must be shared by all workers and management commands. Configure Redis, '
+            f'Memcached or the database cache, or set REQUIRE_SHARED_CACHE = False for a single-process setup.'
+        )
+
+
+def _get_version(key):
+    """
+    读取版本号；不存在（首次使用或被淘汰）时以纳秒时间戳初始化，
+    保证淘汰后重新生成的版本不会与旧缓存键重合
+    """
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def _bump_version(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, time.time_ns(), None)
+
+
+def preference_version(user_id):
+    return _get_version(PREFERENCE_VERSION_KEY.format(user_id=user_id))
+
+
+def bump_preference_version(user_id):
+    """用户偏好变化后调用，使该用户的推荐结果缓存失效"""
+    _bump_version(PREFERENCE_VERSION_KEY.format(user_id=user_id))
+
+
+def catalog_version():
+    return _get_version(CATALOG_VERSION_KEY)
+
+
+def bump_catalog_version():
+    """商品增删改后调用，使所有用户的推荐结果缓存失效"""
+    _bump_version(CATALOG_VERSION_KEY)
+
+
+def inventory_version():
+    return _get_version(INVENTORY_VERSION_KEY)
+
+
+def bump_inventory_version():
+    """库存变化后调用（库存不影响推荐排序，不推进目录版本；只用于JSON接口的ETag）"""
+    _bump_version(INVENTORY_VERSION_KEY)
+
+
+def popularity_version():
+    return _get_version(POPULARITY_VERSION_KEY)
+
+
+def bump_popularity_version():
+    """商品销量（热度表）变化后调用，按销量排序的列表随之变化"""
+    _bump_version(POPULARITY_VERSION_KEY)
+
+
+def get_ranking(user_id, compute):
+    """
+    读取用户的推荐排序结果，未命中时调用 compute() 计算并写入缓存
+    缓存键包含偏好版本与商品目录版本，任一变化即自然失效，无需主动删除
+    """
+    key = RANKING_KEY.format(
+        user_id=user_id,
+        pref_version=preference_version(user_id),
+        catalog_version=catalog_version(),
+    )
+    ranking = cache.get(key)
+    stats.record(ranking is not None)
+    if ranking is None:
+        ranking = compute()
+        cache.set(key, ranking, getattr(settings, 'RECOMMENDATION_CACHE_TIMEOUT', 300))
+    return ranking
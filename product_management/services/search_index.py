@@ -0,0 +1,256 @@
+# product_management/services/search_index.py
+"""
+BM25 倒排索引：商品保存时增量更新，rebuild_search_index 全量重建
+两套索引表轮流使用：全量重建写入当前未使用的一套（不锁当前索引，查询和商品保存照常进行），
+完成后在一个很短的事务中推进代数（ChangeMarker.SEARCH_INDEX）切换过去，再补上重建期间修改过的商品
+"""
+import math
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, Count, F, FloatField, Sum, Value, When
+from django.utils import timezone
+
+from ..models import (ChangeMarker, Product, SearchDocument, SearchDocumentShadow, SearchPosting,
+                      SearchPostingShadow, SearchTerm, SearchTermShadow)
+from . import metrics
+from .tag_service import tag_service
+
+FIELD_WEIGHTS = {'name': 3.0, 'tags': 2.0, 'description': 1.0}  # 名称命中最重要，其次标签、描述
+BM25_K1 = 1.2
+BM25_B = 0.75
+MAX_QUERY_TERMS = 10
+MAX_TERM_LENGTH = 64
+MAX_DF_RATIO = 0.5  # 多词查询时忽略出现在一半以上商品中的词（近似停用词）
+STATS_CACHE_KEY = 'search:index_stats'
+CATCH_UP_OVERLAP = timedelta(seconds=60)  # 切换后补索引的时间往前留出的重叠，覆盖重建开始时尚未提交的修改
+
+# 按代数奇偶使用的两套索引表：(词表, 倒排记录, 文档, 商品上倒排记录的反向关系名)
+INDEX_SETS = (
+    (SearchTerm, SearchPosting, SearchDocument, 'search_postings'),
+    (SearchTermShadow, SearchPostingShadow, SearchDocumentShadow, 'shadow_search_postings'),
+)
+
+
+def _generation():
+    return ChangeMarker.version_of(ChangeMarker.SEARCH_INDEX)
+
+
+def _index_set(generation=None):
+    """当前（或指定代数）使用的一套索引表"""
+    return INDEX_SETS[(_generation() if generation is None else generation) % 2]
+
+
+def _field_texts(name, description, tags):
+    if isinstance(tags, dict):
+        tags = list(tags)
+    elif not isinstance(tags, list):
+        tags = []
+    return (('name', name or ''), ('description', description or ''), ('tags', ' '.join(map(str, tags))))
+
+
+def _weighted_tf(field_tokens):
+    tf = Counter()
+    for field, tokens in field_tokens:
+        for term in tokens:
+            if len(term) <= MAX_TERM_LENGTH:
+                tf[term] += FIELD_WEIGHTS[field]
+    return tf
+
+
+def document_terms(name, description, tags):
+    """按字段加权统计商品文档的词频 {词: 加权词频}"""
+    return _weighted_tf((field, tag_service.tokenize(text)) for field, text in _field_texts(name, description, tags))
+
+
+def documents_terms(rows, processes=None):
+    """
+    批量 document_terms，所有字段一次分词
+    :param rows: [(name, description, tags), ...]
+    :param processes: 大于1时多进程分词（离线重建使用）
+    """
+    fields = [_field_texts(*row) for row in rows]
+    tokens = iter(tag_service.tokenize_many([text for row in fields for _, text in row], processes))
+    return [_weighted_tf([(field, next(tokens)) for field, _ in row]) for row in fields]
+
+
+def _adjust_df(term_model, deltas):
+    """按变化量批量调整词的 df，相同变化量的词合并为一条UPDATE"""
+    added = [term for term, delta in deltas.items() if delta > 0]
+    if added:
+        term_model.objects.bulk_create([term_model(term=term) for term in added], ignore_conflicts=True)
+
+    by_delta = defaultdict(list)
+    for term, delta in deltas.items():
+        if delta:
+            by_delta[delta].append(term)
+    for delta, terms in by_delta.items():
+        term_model.objects.filter(term__in=terms).update(df=F('df') + delta)
+
+
+def _index_rows(rows):
+    """为一批商品 [(id, name, description, tags), ...] 在当前索引中重建索引，并增量维护 df"""
+    term_model, posting_model, document_model, _ = _index_set()
+    documents = {product_id: document_terms(name, description, tags)
+                 for product_id, name, description, tags in rows}
+    deltas = Counter()
+    with transaction.atomic():
+        old = posting_model.objects.filter(product_id__in=list(documents)).values_list('term', flat=True)
+        deltas.subtract(old)
+        posting_model.objects.filter(product_id__in=list(documents)).delete()
+        document_model.objects.filter(product_id__in=list(documents)).delete()
+
+        postings, docs = [], []
+        for product_id, tf in documents.items():
+            length = sum(tf.values())
+            docs.append(document_model(product_id=product_id, length=length))
+            postings.extend(
+                posting_model(term=term, product_id=product_id, tf=freq, doc_length=length)
+                for term, freq in tf.items()
+            )
+            deltas.update(tf.keys())
+        document_model.objects.bulk_create(docs, batch_size=1000)
+        posting_model.objects.bulk_create(postings, batch_size=1000)
+        _adjust_df(term_model, deltas)
+
+
+def index_product(product):
+    """商品保存后增量更新其索引"""
+    _index_rows([(product.id, product.name, product.description, product.tags)])
+
+
+def index_products(product_ids):
+    """批量写入商品后增量更新索引"""
+    rows = Product.objects.filter(id__in=list(product_ids)).values_list('id', 'name', 'description', 'tags')
+    _index_rows(list(rows))
+
+
+def remove_product(product_id):
+    """商品删除前扣减其词在当前索引中的 df（两套表的倒排记录都随商品级联删除）"""
+    term_model, posting_model, _, _ = _index_set()
+    terms = posting_model.objects.filter(product_id=product_id).values_list('term', flat=True)
+    _adjust_df(term_model, Counter({term: -1 for term in terms}))
+
+
+def rebuild(chunk_size=1000, progress=None, processes=None):
+    """
+    全量重建索引，不锁当前索引：
+      1. 清空未使用的一套表，分块流式读取商品写入（每块一个短事务），最后按倒排记录统计 df 写入词表；
+      2. 一个只更新一行的事务推进代数，之后的查询和增量索引都使用新的一套表；
+      3. 重新索引重建开始以来修改过的商品（重建期间的增量索引写入的是旧的一套表）
+    上一代的表保留到下次重建时清空
+    :param progress: 可选回调 progress(已处理商品数)
+    :param processes: 大于1时每块商品用多个进程并行分词
+    :return: (商品数, 词数)
+    """
+    ChangeMarker.objects.bulk_create([ChangeMarker(name=ChangeMarker.SEARCH_INDEX)], ignore_conflicts=True)
+    generation = _generation()
+    term_model, posting_model, document_model, _ = _index_set(generation + 1)
+    started = timezone.now()
+
+    posting_model.objects.all().delete()
+    document_model.objects.all().delete()
+    term_model.objects.all().delete()
+
+    processed = 0
+    last_id = 0
+    while True:
+        chunk = list(Product.objects.filter(id__gt=last_id).order_by('id')
+                     .values_list('id', 'name', 'description', 'tags')[:chunk_size])
+        if not chunk:
+            break
+        last_id = chunk[-1][0]
+        with transaction.atomic():
+            processed += _bulk_insert(posting_model, document_model, chunk, processes)
+        if progress:
+            progress(processed)
+
+    # 按已写入的倒排记录统计 df：重建期间删除的商品的记录已随商品级联删除，不会计入
+    terms = 0
+    rows = posting_model.objects.values('term').annotate(df=Count('pk')).order_by('term').values_list('term', 'df')
+    batch = []
+    for term, df in rows.iterator(chunk_size=5000):
+        batch.append(term_model(term=term, df=df))
+        if len(batch) >= 5000:
+            term_model.objects.bulk_create(batch)
+            terms += len(batch)
+            batch = []
+    term_model.objects.bulk_create(batch)
+    terms += len(batch)
+
+    with transaction.atomic():
+        switched = ChangeMarker.objects.filter(name=ChangeMarker.SEARCH_INDEX, version=generation).update(
+            version=F('version') + 1
+        )
+        if not switched:
+            raise RuntimeError('另一个全量重建已先切换了搜索索引，本次结果作废')
+        transaction.on_commit(lambda: cache.delete(STATS_CACHE_KEY))
+
+    changed = Product.objects.filter(updated_at__gte=started - CATCH_UP_OVERLAP).order_by('id')
+    changed_ids = list(changed.values_list('id', flat=True))
+    for start in range(0, len(changed_ids), chunk_size):
+        index_products(changed_ids[start:start + chunk_size])
+    return processed, terms
+
+
+def _bulk_insert(posting_model, document_model, rows, processes=None):
+    postings, docs = [], []
+    documents = documents_terms([row[1:] for row in rows], processes)
+    for (product_id, *_), tf in zip(rows, documents):
+        length = sum(tf.values())
+        docs.append(document_model(product_id=product_id, length=length))
+        postings.extend(
+            posting_model(term=term, product_id=product_id, tf=freq, doc_length=length)
+            for term, freq in tf.items()
+        )
+    document_model.objects.bulk_create(docs)
+    posting_model.objects.bulk_create(postings, batch_size=5000)
+    return len(rows)
+
+
+def index_stats():
+    """文档总数与平均文档长度（缓存 SEARCH_STATS_TIMEOUT 秒，避免每次查询都做聚合）"""
+    stats = cache.get(STATS_CACHE_KEY)
+    metrics.record_cache('search_stats', stats is not None)
+    if stats is None:
+        result = _index_set()[2].objects.aggregate(count=Count('pk'), total=Sum('length'))
+        count = result['count'] or 0
+        stats = (count, (result['total'] or 0) / count if count else 1.0)
+        cache.set(STATS_CACHE_KEY, stats, getattr(settings, 'SEARCH_STATS_TIMEOUT', 300))
+    return stats
+
+
+def search(query):
+    """
+    BM25检索：查询词用与索引相同的jieba分词，按 (term, product) 索引取倒排记录，
+    在数据库中按商品聚合 BM25 得分
+    :return: 带 relevance 注解的商品查询集（未排序，由调用方分页排序）
+    """
+    terms = list(dict.fromkeys(tag_service.tokenize(query)))[:MAX_QUERY_TERMS]
+    term_model, _, _, postings = _index_set()
+    dfs = dict(term_model.objects.filter(term__in=terms, df__gt=0).values_list('term', 'df'))
+    if not dfs:
+        return Product.objects.none().annotate(relevance=Value(0.0, output_field=FloatField()))
+
+    count, avg_length = index_stats()
+    count = max(count, max(dfs.values()))
+    if len(dfs) > 1:
+        common = [term for term, df in dfs.items() if df > count * MAX_DF_RATIO]
+        if len(common) < len(dfs):
+            for term in common:
+                del dfs[term]
+
+    idf = Case(
+        *[When(**{f'{postings}__term': term}, then=Value(math.log(1 + (count - df + 0.5) / (df + 0.5))))
+          for term, df in dfs.items()],
+        default=Value(0.0),
+        output_field=FloatField(),
+    )
+    tf = F(f'{postings}__tf')
+    norm = BM25_K1 * (1 - BM25_B + BM25_B * F(f'{postings}__doc_length') / avg_length)
+    return Product.objects.filter(**{f'{postings}__term__in': list(dfs)}).annotate(
+        relevance=Sum(idf * tf * (BM25_K1 + 1) / (tf + norm), output_field=FloatField())
+    )
@@ -0,0 +1,48 @@
+# product_management/services/sparse_utils.py
+import numpy as np
+
+
+def csr_entries(matrix):
+    """CSR矩阵的非零元素 (行号, 列号, 值) 三个数组"""
+    matrix = matrix.tocsr()
+    rows = np.repeat(np.arange(matrix.shape[0]), np.diff(matrix.indptr))
+    return rows, matrix.indices, matrix.data
+
+
+def top_k_per_row(rows, cols, values, k):
+    """
+    按行选出值最大的k个元素（不转换为稠密矩阵）
+    :return: (rows, cols, values)，按行号升序、值降序（同值按列号升序）排列
+    """
+    order = np.lexsort((cols, -values, rows))
+    rows, cols, values = rows[order], cols[order], values[order]
+    rank = np.arange(rows.size) - np.searchsorted(rows, rows, side='left')
+    keep = rank < k
+    return rows[keep], cols[keep], values[keep]
+
+
+def split_rows(rows, items, n_rows):
+    """把按行号排好序的元素拆成每行一个列表（没有元素的行为空列表）"""
+    bounds = np.searchsorted(rows, np.arange(1, n_rows))
+    return [chunk.tolist() for chunk in np.split(items, bounds)]
+
+
+def top_k(scores, ids, k):
+    """
+    按 (分数降序, ID降序) 选出前k个元素的下标（argpartition，不对全部元素排序）
+    边界上的同分元素按ID取较大的，结果与完整排序后截取前k个一致
+    """
+    n = scores.size
+    if k <= 0 or n == 0:
+        return np.empty(0, dtype=np.int64)
+    if k < n:
+        kth = np.partition(scores, n - k)[n - k]  # 第k大的分数
+        above = np.flatnonzero(scores > kth)
+        ties = np.flatnonzero(scores == kth)
+        need = k - above.size
+        if need < ties.size:
+            ties = ties[np.argpartition(-ids[ties], need - 1)[:need]]
+        index = np.concatenate([above, ties])
+    else:
+        index = np.arange(n)
+    return index[np.lexsort((-ids[index], -scores[index]))]
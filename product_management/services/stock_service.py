@@ -0,0 +1,69 @@
+# product_management/services/stock_service.py
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+
+from ..models import Product
+from . import recommendation_cache
+
+
+def _inventory_changed():
+    # 事务提交后才推进库存版本，避免其他请求用新版本号缓存到旧库存
+    transaction.on_commit(recommendation_cache.bump_inventory_version)
+
+
+def reserve(product_id, quantity=1):
+    """
+    原子预留库存
+    单条 UPDATE ... SET stock = stock - n WHERE id = ? AND stock >= n，
+    只改写 stock（及行版本、修改时间）列，并发下不会超卖，也不需要先读后写
+    :return: 是否预留成功（库存不足或商品不存在时为False）
+    """
+    if quantity <= 0:
+        raise ValueError('预留数量必须为正数')
+    updated = Product.objects.filter(pk=product_id, stock__gte=quantity).update(
+        stock=F('stock') - quantity, version=F('version') + 1, updated_at=timezone.now()
+    )
+    if updated:
+        _inventory_changed()
+    return updated == 1
+
+
+def release(product_id, quantity=1):
+    """归还库存（移出购物车、减少数量时调用）"""
+    if quantity <= 0:
+        raise ValueError('归还数量必须为正数')
+    updated = Product.objects.filter(pk=product_id).update(
+        stock=F('stock') + quantity, version=F('version') + 1, updated_at=timezone.now()
+    )
+    if updated:
+        _inventory_changed()
+    return updated == 1
+
+
+def reserve_many(quantities):
+    """
+    批量预留库存：一条 UPDATE 同时扣减所有商品，任一商品库存不足则全部不扣
+    :param quantities: {商品ID: 数量}
+    :return: 是否全部预留成功
+    """
+    quantities = {int(product_id): int(quantity) for product_id, quantity in quantities.items()}
+    if any(quantity <= 0 for quantity in quantities.values()):
+        raise ValueError('预留数量必须为正数')
+    if not quantities:
+        return True
+
+    needed = Case(
+        *[When(pk=product_id, then=Value(quantity)) for product_id, quantity in quantities.items()],
+        output_field=IntegerField(),
+    )
+    with transaction.atomic():
+        updated = Product.objects.filter(pk__in=list(quantities), stock__gte=needed).update(
+            stock=F('stock') - needed, version=F('version') + 1, updated_at=timezone.now()
+        )
+        if updated != len(quantities):
+            # 部分商品库存不足：回滚本次扣减
+            transaction.set_rollback(True)
+            return False
+        _inventory_changed()
+    return True
@@ -1,19 +1,55 @@
 # product_management/services/tag_service.py
+import hashlib
+import json
+import os
+import time
 import jieba
 import re
+import numpy as np
 from collections import Counter
+from pathlib import Path
 from sklearn.feature_extraction.text import TfidfVectorizer
+from django.conf import settings
 from django.core.cache import cache
+from django.db import DatabaseError, transaction
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from . import tokenizer
+from .aho_corasick import Automaton
+from .metrics import timed
+from .sparse_utils import csr_entries, split_rows, top_k_per_row
+
+MODEL_POINTER = 'CURRENT'  # 记录当前生效模型版本的指针文件
+WORD_PATTERN = re.compile(r'\w')  # 至少包含一个文字/数字字符的词才参与检索
+
+# 内置词典：TagKeyword/TagSynonym 表的初始数据，数据库不可用（如尚未迁移）时使用
+DEFAULT_CATEGORY_KEYWORDS = {
+    "手机": ["5G", "曲面屏", "摄像头", "骁龙"],
+    "笔记本": ["游戏本", "轻薄", "i7", "RTX"],
+    "服装": ["纯棉", "修身", "加厚", "冬季"]
+}
+DEFAULT_SYNONYMS = {
+    "智能手机": ["智能机", "智慧手机"],
+    "笔记本电脑": ["笔电", "手提电脑"]
+}
+
+
+def _identity(value):
+    return value
 
 
 class TagGenerator:
     """
     商品标签生成器（混合词典匹配+TF-IDF算法）
     使用方式：
-    1. 在Django的AppConfig.ready()中初始化单例
-    2. 调用generate_tags()生成标签
+    1. 通过 manage.py build_tag_model 离线训练并发布TF-IDF模型
+    2. 在Django的AppConfig.ready()中调用load_model()加载已发布的模型
+    3. 调用generate_tags()生成标签（模型版本切换后自动热加载）
     """
     _instance = None  # 单例模式
+    TFIDF_MIN_SCORE = 0.2  # TF-IDF关键词的最低得分
+    MAX_TAGS = 5  # 每个商品最多保留的标签数
 
     def __new__(cls):
         if cls._instance is None:
@@ -23,70 +59,285 @@ class TagGenerator:
 
     def init_components(self):
         """初始化组件（非模型数据）"""
-        self.vectorizer = None
-        self.category_keywords = {
-            "手机": ["5G", "曲面屏", "摄像头", "骁龙"],
-            "笔记本": ["游戏本", "轻薄", "i7", "RTX"],
-            "服装": ["纯棉", "修身", "加厚", "冬季"]
-        }
+        self._model = None  # (vectorizer, 特征名数组, 可作为标签的特征掩码)，整体替换保证原子性
+        self.model_version = None
+        self._last_reload_check = 0.0
+        self._last_dictionary_check = 0.0  # 词典指纹（两条聚合查询）同样按间隔节流，不在每次打标签时查询
+        self._reload_pinned = False  # 离线批量任务固定模型和词典后不再热加载
         self.stop_words = {"的", "了", "是", "我", "这", "和", "在"}
-        self.synonyms = {
-            "智能手机": ["智能机", "智慧手机"],
-            "笔记本电脑": ["笔电", "手提电脑"]
+        # (关键词自动机, {同义词小写: 标准词}, 词典指纹)，整体替换保证原子性；首次使用时从数据库加载
+        self._dictionary = None
+
+    @property
+    def vectorizer(self):
+        return self._model[0] if self._model else None
+
+    def _set_model(self, vectorizer, version):
+        """预先缓存特征名和长度过滤掩码，推理时无需再调用get_feature_names_out()"""
+        names = np.asarray(vectorizer.get_feature_names_out(), dtype=object)
+        eligible = np.fromiter((len(word) >= 2 for word in names), dtype=bool, count=len(names))
+        self._model = (vectorizer, names, eligible)
+        self.model_version = version
+
+    def model_config(self):
+        """影响训练结果的全部配置，用于计算模型配置哈希"""
+        return {
+            'tokenizer': 'jieba',
+            'jieba_version': jieba.__version__,
+            'max_features': 500,
+            'stop_words': sorted(self.stop_words),
         }
 
-    def init_model(self, corpus):
+    def config_hash(self):
+        """当前配置的哈希值，加载模型时据此拒绝不兼容的旧模型"""
+        payload = json.dumps(self.model_config(), sort_keys=True, ensure_ascii=False)
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:12]
+
+    def _new_vectorizer(self, **kwargs):
+        config = self.model_config()
+        return TfidfVectorizer(
+            tokenizer=tokenizer.cut,
+            token_pattern=None,
+            stop_words=config['stop_words'],
+            **kwargs
+        )
+
+    def init_model(self, corpus, processes=None):
         """
-        初始化TF-IDF模型
+        初始化TF-IDF模型（在当前进程内训练，仅供离线命令使用）
         :param corpus: List[str] 商品描述语料库
+        :param processes: 大于1时先用多个进程并行分词，再以分词结果训练（结果与单进程相同）
         """
-        self.vectorizer = TfidfVectorizer(
-            tokenizer=jieba.cut,
-            token_pattern=None,
-            max_features=500,
-            stop_words=list(self.stop_words)
+        max_features = self.model_config()['max_features']
+        if processes and processes > 1:
+            # 与默认的预处理一致：先转小写再分词；训练时跳过预处理和分词，训练后恢复推理用的分词器
+            tokens = tokenizer.cut_many([text.lower() for text in corpus], processes)
+            vectorizer = self._new_vectorizer(max_features=max_features)
+            vectorizer.set_params(preprocessor=_identity, tokenizer=_identity)
+            vectorizer.fit(tokens)
+            vectorizer.set_params(preprocessor=None, tokenizer=tokenizer.cut)
+        else:
+            vectorizer = self._new_vectorizer(max_features=max_features)
+            vectorizer.fit(corpus)
+        self._set_model(vectorizer, None)
+
+    @staticmethod
+    def model_dir():
+        """模型文件根目录"""
+        return Path(getattr(settings, 'TAG_MODEL_DIR', Path(settings.BASE_DIR) / 'tag_models'))
+
+    def export_model(self, version=None, activate=True):
+        """
+        将当前进程内训练好的模型写入版本化目录
+        目录结构: <TAG_MODEL_DIR>/<version>/{vocabulary.json, idf.npy, meta.json}
+        :param version: 版本号，默认使用当前时间
+        :param activate: 是否立即切换 CURRENT 指针到该版本
+        :return: 版本号
+        """
+        if not self.vectorizer:
+            raise RuntimeError("必须先调用init_model()训练TF-IDF模型")
+
+        version = version or timezone.now().strftime('%Y%m%d%H%M%S')
+        target = self.model_dir() / version
+        if target.exists():
+            raise FileExistsError(f"模型版本已存在: {version}")
+
+        # 先写入临时目录再整体改名，避免其他进程读到写了一半的模型
+        tmp = self.model_dir() / f'.{version}.tmp'
+        tmp.mkdir(parents=True)
+        vocabulary = self.vectorizer.get_feature_names_out().tolist()
+        with open(tmp / 'vocabulary.json', 'w', encoding='utf-8') as f:
+            json.dump(vocabulary, f, ensure_ascii=False)
+        np.save(tmp / 'idf.npy', np.asarray(self.vectorizer.idf_, dtype=np.float64))
+        with open(tmp / 'meta.json', 'w', encoding='utf-8') as f:
+            json.dump({
+                'version': version,
+                'config_hash': self.config_hash(),
+                'config': self.model_config(),
+                'n_features': len(vocabulary),
+                'created_at': timezone.now().isoformat(),
+            }, f, ensure_ascii=False, indent=2)
+        os.rename(tmp, target)
+
+        if activate:
+            self.activate_model(version)
+        return version
+
+    def activate_model(self, version):
+        """原子地切换 CURRENT 指针，各工作进程在下次检查时热加载新版本"""
+        if not (self.model_dir() / version / 'meta.json').exists():
+            raise FileNotFoundError(f"模型版本不存在: {version}")
+        pointer = self.model_dir() / MODEL_POINTER
+        tmp = pointer.with_name(f'.{MODEL_POINTER}.{os.getpid()}')
+        tmp.write_text(version, encoding='utf-8')
+        os.replace(tmp, pointer)
+
+    def current_model_version(self):
+        """读取 CURRENT 指针指向的模型版本，没有发布过模型时返回None"""
+        try:
+            return (self.model_dir() / MODEL_POINTER).read_text(encoding='utf-8').strip() or None
+        except FileNotFoundError:
+            return None
+
+    def load_model(self, version=None):
+        """
+        加载已发布的模型（idf以内存映射方式加载，多个工作进程共享同一份物理页）
+        :param version: 指定版本，默认加载 CURRENT 指向的版本
+        :return: 是否成功加载
+        """
+        version = version or self.current_model_version()
+        self._last_reload_check = time.monotonic()
+        if not version:
+            return False
+
+        path = self.model_dir() / version
+        with open(path / 'meta.json', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('config_hash') != self.config_hash():
+            raise RuntimeError(f"模型 {version} 的配置与当前代码不一致，请重新执行 build_tag_model")
+
+        with open(path / 'vocabulary.json', encoding='utf-8') as f:
+            vocabulary = json.load(f)
+        vectorizer = self._new_vectorizer(vocabulary={term: i for i, term in enumerate(vocabulary)})
+        vectorizer.idf_ = np.load(path / 'idf.npy', mmap_mode='r')
+
+        # 整体替换引用，正在使用旧模型的调用不受影响
+        self._set_model(vectorizer, version)
+        return True
+
+    def maybe_reload(self):
+        """按 TAG_MODEL_RELOAD_INTERVAL 节流检查 CURRENT 指针和词典指纹，变化时热加载"""
+        if self._reload_pinned:
+            return
+        interval = getattr(settings, 'TAG_MODEL_RELOAD_INTERVAL', 30)
+        now = time.monotonic()
+        if now - self._last_reload_check >= interval:
+            self._last_reload_check = now
+            version = self.current_model_version()
+            if version and version != self.model_version:
+                self.load_model(version)
+        # 词典刚加载过（包括首次使用时的加载）则不必再查指纹
+        if self._dictionary is not None and now - self._last_dictionary_check >= interval:
+            self._last_dictionary_check = now
+            if self._safe_fingerprint() != self._dictionary[2]:
+                self.load_dictionary()
+
+    def pin_model(self, version=None):
+        """
+        加载并固定模型版本和词典（离线批量任务使用）：之后不再热加载，整批商品使用同一套规则
+        :param version: 指定版本，默认 CURRENT 指向的版本
+        :return: 使用的模型版本（没有发布过模型时为None）
+        """
+        self.load_model(version)
+        self.load_dictionary()
+        self._reload_pinned = True
+        return self.model_version
+
+    # ---- 关键词/同义词词典 ----
+
+    @staticmethod
+    def compile_dictionary(keywords, synonyms):
+        """
+        编译词典：关键词构建为Aho–Corasick自动机（按小写匹配，匹配结果为原关键词），
+        同义词构建为 {同义词小写: 标准词} 反向哈希表
+        :param keywords: 关键词列表
+        :param synonyms: {同义词: 标准词}
+        """
+        automaton = Automaton()
+        for keyword in keywords:
+            automaton.add(keyword.lower(), keyword)
+        reverse = {variant.lower(): canonical for variant, canonical in synonyms.items()}
+        return automaton.build(), reverse
+
+    def dictionary_fingerprint(self):
+        """词典表的 (行数, 最后修改时间)，任一表增删改都会改变指纹"""
+        from ..models import TagKeyword, TagSynonym
+        return tuple(
+            tuple(model.objects.aggregate(count=Count('pk'), updated=Max('updated_at')).values())
+            for model in (TagKeyword, TagSynonym)
         )
-        self.vectorizer.fit(corpus)
 
+    def _safe_fingerprint(self):
+        """查询词典指纹；词典表不可用时返回None（在保存点内查询，出错不会破坏调用方的外层事务）"""
+        try:
+            with transaction.atomic():
+                return self.dictionary_fingerprint()
+        except DatabaseError:
+            return None
+
+    def load_dictionary(self):
+        """从 TagKeyword/TagSynonym 表加载并编译词典，编译完成后一次性替换（其他线程始终看到完整的旧词典或新词典）"""
+        from ..models import TagKeyword, TagSynonym
+        self._last_dictionary_check = time.monotonic()
+        try:
+            # 保存点：在调用方的 atomic() 中查询失败时只回滚到这里，外层事务仍可继续使用
+            with transaction.atomic():
+                fingerprint = self.dictionary_fingerprint()
+                keywords = list(TagKeyword.objects.values_list('keyword', flat=True).iterator(chunk_size=5000))
+                synonyms = dict(TagSynonym.objects.values_list('variant', 'canonical').iterator(chunk_size=5000))
+        except DatabaseError:
+            # 词典表尚未创建（迁移前）：使用内置词典，下次检查时再尝试数据库
+            fingerprint = None
+            keywords = [word for category, subs in DEFAULT_CATEGORY_KEYWORDS.items() for word in [category, *subs]]
+            synonyms = {variant: std for std, variants in DEFAULT_SYNONYMS.items() for variant in variants}
+        automaton, reverse = self.compile_dictionary(keywords, synonyms)
+        self._dictionary = (automaton, reverse, fingerprint)
+
+    def _get_dictionary(self):
+        if self._dictionary is None:
+            self.load_dictionary()
+        return self._dictionary
+
+    @timed('TagGenerator.tokenize')
+    def tokenize(self, text):
+        """
+        jieba分词（与TF-IDF相同的分词器，转小写，去掉停用词、空白和纯标点）
+        搜索索引的建立与查询都使用该方法，保证两边切分一致
+        """
+        return self._filter_tokens(tokenizer.cut(text.lower()))
+
+    def tokenize_many(self, texts, processes=None):
+        """批量分词（离线任务使用），processes 大于1时多进程并行，见 tokenizer.cut_many"""
+        return [self._filter_tokens(tokens)
+                for tokens in tokenizer.cut_many([text.lower() for text in texts], processes)]
+
+    def _filter_tokens(self, tokens):
+        return [word for word in tokens
+                if word.strip() and word not in self.stop_words and WORD_PATTERN.search(word)]
+
+    @timed('TagGenerator.extract_with_dict')
     def extract_with_dict(self, text):
-        """基于词典的关键词提取"""
-        text_lower = text.lower()
-        tags = set()
-
-        for category, subcats in self.category_keywords.items():
-            if category in text_lower:
-                tags.add(category)
-            for sub in subcats:
-                if sub in text_lower:
-                    tags.add(sub)
-        return tags
+        """基于词典的关键词提取（自动机一次扫描文本，与词典大小无关）"""
+        return self._get_dictionary()[0].find(text.lower())
 
     def extract_with_tfidf(self, text):
         """基于TF-IDF的关键词提取"""
-        if not self.vectorizer:
+        return self.extract_with_tfidf_many([text])[0]
+
+    @timed('TagGenerator.extract_with_tfidf_many')
+    def extract_with_tfidf_many(self, texts, top_k=MAX_TAGS):
+        """
+        批量TF-IDF关键词提取：一次稀疏变换，直接在CSR数据上按行选出得分最高的top_k个词
+        :param texts: List[str] 商品描述
+        :return: List[List[str]] 与输入顺序一致，每行按得分降序
+        """
+        model = self._model
+        if not model:
             raise RuntimeError("必须先调用init_model()初始化TF-IDF模型")
+        vectorizer, names, eligible = model
 
-        features = self.vectorizer.get_feature_names_out()
-        scores = self.vectorizer.transform([text]).toarray()[0]
+        matrix = vectorizer.transform(texts)
+        rows, cols, scores = csr_entries(matrix)
+        keep = (scores > self.TFIDF_MIN_SCORE) & eligible[cols]
 
-        return [
-                   word for word, score in zip(features, scores)
-                   if score > 0.2 and len(word) >= 2
-               ][:5]  # 返回TOP5关键词
+        # 行号升序、得分降序（同分按特征序号），截取每行的前top_k个
+        rows, cols, _ = top_k_per_row(rows[keep], cols[keep], scores[keep], top_k)
+        return split_rows(rows, names[cols], matrix.shape[0])
 
     def normalize_tags(self, tags):
-        """标签标准化（同义词合并）"""
-        normalized = set()
-        for tag in tags:
-            replaced = False
-            for std, variants in self.synonyms.items():
-                if tag in variants:
-                    normalized.add(std)
-                    replaced = True
-                    break
-            if not replaced:
-                normalized.add(tag)
-        return list(normalized)
+        """标签标准化（同义词合并，保持原有顺序并去重）"""
+        reverse = self._get_dictionary()[1]
+        return list(dict.fromkeys(reverse.get(tag.lower(), tag) for tag in tags))
 
     def generate_tags(self, text):
         """
@@ -94,9 +345,21 @@ class TagGenerator:
         :param text: 商品描述文本
         :return: List[str] 标准化后的标签列表
         """
-        dict_tags = self.extract_with_dict(text)
-        tfidf_tags = self.extract_with_tfidf(text)
-        return self.normalize_tags(dict_tags + tfidf_tags)[:5]  # 最多返回5个标签
+        return self.generate_tags_many([text])[0]
+
+    @timed('TagGenerator.generate_tags_many')
+    def generate_tags_many(self, texts):
+        """
+        批量生成商品标签（批量导入、重新打标签等任务使用）
+        :param texts: List[str] 商品描述文本
+        :return: List[List[str]] 与输入顺序一致的标签列表
+        """
+        self.maybe_reload()
+        tfidf_tags = self.extract_with_tfidf_many(texts)
+        return [
+            self.normalize_tags(sorted(self.extract_with_dict(text)) + keywords)[:self.MAX_TAGS]
+            for text, keywords in zip(texts, tfidf_tags)
+        ]
 
 
 # 导出单例对象（推荐使用此对象）
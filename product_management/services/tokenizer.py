@@ -0,0 +1,105 @@
+# product_management/services/tokenizer.py
+"""
+jieba分词的进程级封装：启动时从缓存文件预热词典、按文本哈希缓存分词结果（有界LRU）、
+离线批量任务可选多进程分词
+"""
+import hashlib
+import logging
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
+
+import jieba
+from django.conf import settings
+
+from .metrics import CacheStats
+
+logger = logging.getLogger(__name__)
+
+PARALLEL_MIN_TEXTS = 1000  # 少于该数量时直接在本进程分词（进程池的启动开销更大）
+
+stats = CacheStats('tokenize')
+
+
+def warm_up():
+    """
+    加载jieba前缀词典（首次 jieba.cut 时才会构建，约1秒）
+    设置 JIEBA_CACHE_FILE 时从该文件读取已序列化的词典，文件不存在时构建后写入，供下次启动使用
+    """
+    cache_file = getattr(settings, 'JIEBA_CACHE_FILE', None)
+    if cache_file and not jieba.dt.initialized:
+        os.makedirs(os.path.dirname(os.path.abspath(cache_file)), exist_ok=True)
+        jieba.dt.cache_file = str(cache_file)
+    jieba.initialize()
+
+
+class TokenCache:
+    """分词结果的有界LRU，键为文本的 blake2b 摘要（不长期持有原文），值为词元组"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def key(text):
+        return hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+
+    def get(self, key):
+        with self._lock:
+            tokens = self._entries.get(key)
+            if tokens is not None:
+                self._entries.move_to_end(key)
+            return tokens
+
+    def put(self, key, tokens):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = tokens
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+lru = TokenCache(getattr(settings, 'TOKEN_CACHE_SIZE', 10000))
+
+
+def cut(text):
+    """
+    jieba精确模式分词（结果与 jieba.cut 相同，返回元组）
+    同一文本（商品变体、重复保存、热门搜索词）只切分一次
+    """
+    key = lru.key(text)
+    tokens = lru.get(key)
+    stats.record(tokens is not None)
+    if tokens is None:
+        tokens = tuple(jieba.cut(text))
+        lru.put(key, tokens)
+    return tokens
+
+
+def _cut_uncached(text):
+    return tuple(jieba.cut(text))
+
+
+def cut_many(texts, processes=None, chunksize=200):
+    """
+    批量分词，与输入顺序一致
+    :param processes: 大于1且文本数不少于 PARALLEL_MIN_TEXTS 时使用fork进程池并行切分（仅供离线命令使用：
+                      子进程继承已预热的词典；结果不写入LRU，避免一次离线批量冲掉在线请求的热点）
+    """
+    texts = list(texts)
+    if not processes or processes <= 1 or len(texts) < PARALLEL_MIN_TEXTS:
+        return [cut(text) for text in texts]
+    warm_up()
+    with multiprocessing.get_context('fork').Pool(processes) as pool:
+        return pool.map(_cut_uncached, texts, chunksize=chunksize)
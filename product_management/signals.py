@@ -1,12 +1,96 @@
 # product_management/signals.py
-from django.db.models.signals import post_save
-from django.dispatch import receiver
-from .models import Order
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import Signal, receiver
+from .models import ChangeMarker, Order, Product, ProductTag, Sale
+from .services import item_cf, popularity, recommendation_cache, search_index
+from .services.scoring_engine import scoring_engine
+
+SEARCH_FIELDS = {'name', 'description', 'tags'}
+
+# 批量写入商品（bulk_create/bulk_update 不触发 post_save）后发送，参数: product_ids
+products_bulk_saved = Signal()
+
 
 @receiver(post_save, sender=Order)
-def update_preferences_on_order(sender, instance, created, **kwargs):
+def on_order_paid(sender, instance, **kwargs):
     """
-    当订单创建且状态为已支付时，更新用户偏好
+    订单进入已支付状态时（新建即已支付，或由待支付改为已支付），
+    在事务提交、订单项写入之后更新用户偏好、商品相似度和销量
     """
-    if created and instance.status == 'paid':
-        instance.update_user_preferences()
\ No newline at end of file
+    if instance.became_paid:
+        order_id = instance.id
+        transaction.on_commit(instance.update_user_preferences)
+        transaction.on_commit(lambda: item_cf.update_for_order(order_id))
+        transaction.on_commit(lambda: popularity.record_order(order_id))
+    instance._loaded_status = instance.status
+
+
+@receiver(post_save, sender=Sale)
+def record_sale(sender, instance, created, **kwargs):
+    """线下销售记录计入商品销量"""
+    if created:
+        quantities = {instance.product_id: instance.quantity}
+        transaction.on_commit(lambda: popularity.record_sales(quantities, instance.date))
+
+
+@receiver(post_save, sender=Product)
+def sync_product_tags(sender, instance, update_fields=None, **kwargs):
+    """Product.tags 变化时同步 ProductTag 关系表（只更新库存等字段时跳过）"""
+    if update_fields is None or 'tags' in update_fields:
+        ProductTag.sync(instance)
+
+
+@receiver(post_save, sender=Product)
+def create_popularity_row(sender, instance, created, **kwargs):
+    """新商品建立热度行（销量为0），按销量排序的列表内连接热度表"""
+    if created:
+        popularity.ensure_rows([instance.id])
+
+
+@receiver(products_bulk_saved)
+def create_bulk_popularity_rows(sender, product_ids, **kwargs):
+    popularity.ensure_rows(product_ids)
+
+
+@receiver(products_bulk_saved)
+def rebuild_bulk_product_tags(sender, product_ids, **kwargs):
+    """批量写入后重建这些商品的 ProductTag 行"""
+    ProductTag.rebuild(product_ids)
+
+
+@receiver(post_save, sender=Product)
+def update_search_index(sender, instance, update_fields=None, **kwargs):
+    """商品名称/描述/标签变化时增量更新搜索索引"""
+    if update_fields is None or SEARCH_FIELDS & set(update_fields):
+        search_index.index_product(instance)
+
+
+@receiver(pre_delete, sender=Product)
+def remove_from_search_index(sender, instance, **kwargs):
+    search_index.remove_product(instance.id)
+
+
+@receiver(post_delete, sender=Product)
+def remove_from_scoring_engine(sender, instance, **kwargs):
+    """删除的商品立即从本进程的评分矩阵中去掉（修改由引擎按 updated_at 增量刷新）"""
+    scoring_engine.remove([instance.id])
+
+
+@receiver(post_delete, sender=Product)
+def mark_product_deleted(sender, **kwargs):
+    """删除商品不会改变其余商品的 updated_at，推进删除标记让JSON接口的 ETag 随之变化"""
+    ChangeMarker.bump(ChangeMarker.PRODUCTS_DELETED)
+
+
+@receiver(products_bulk_saved)
+def update_bulk_search_index(sender, product_ids, **kwargs):
+    search_index.index_products(product_ids)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(products_bulk_saved)
+def invalidate_recommendations(sender, **kwargs):
+    """商品目录变化后推进目录版本，所有用户的推荐结果缓存随之失效"""
+    recommendation_cache.bump_catalog_version()
@@ -1,3 +1,716 @@
-from django.test import TestCase
+import glob
+import json
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
\ No newline at end of file
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Case, Count, FloatField, Value, When
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from django.contrib.auth.models import AnonymousUser, User
+from django.contrib.sessions.backends.db import SessionStore
+
+from .models import (BehaviorEvent, Order, OrderItem, Product, ProductBuyerCount, ProductPopularity, ProductSimilarity,
+                     TagKeyword, UserPreference)
+from .services import (behavior_events, exporter, item_cf, metrics, popularity, preference_rebuild,
+                       recommendation_cache, search_index, stock_service)
+from .services.cart_store import CacheCartStore, SessionCartStore
+from .services.pagination import KeysetPaginator
+from .services.tag_service import tag_service
+from .services.scoring_engine import ScoringEngine
+from .services.sparse_utils import top_k
+from .signals import products_bulk_saved
+
+
+class StockReservationConcurrencyTest(TransactionTestCase):
+    """高并发下的库存预留：成功次数必须恰好等于初始库存，库存不会被扣成负数"""
+    WORKERS = 32
+    ATTEMPTS = 300
+    STOCK = 50
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('内存SQLite测试库不支持多连接并发写入，请使用 test_shop.test_settings（文件SQLite）或MySQL运行')
+
+    @staticmethod
+    def _in_thread(func, *args):
+        # 每个线程使用自己的数据库连接，结束后关闭
+        try:
+            return func(*args)
+        finally:
+            connection.close()
+
+    def test_reserve_never_oversells(self):
+        product = Product.objects.create(name='秒杀商品', stock=self.STOCK, price=1)
+
+        with ThreadPoolExecutor(max_workers=self.WORKERS) as pool:
+            results = list(pool.map(
+                lambda _: self._in_thread(stock_service.reserve, product.id), range(self.ATTEMPTS)
+            ))
+
+        product.refresh_from_db()
+        self.assertEqual(sum(results), self.STOCK)
+        self.assertEqual(product.stock, 0)
+
+    def test_reserve_many_is_all_or_nothing(self):
+        first = Product.objects.create(name='商品A', stock=self.STOCK, price=1)
+        second = Product.objects.create(name='商品B', stock=self.STOCK // 2, price=1)
+        order = {first.id: 1, second.id: 1}
+
+        with ThreadPoolExecutor(max_workers=self.WORKERS) as pool:
+            results = list(pool.map(
+                lambda _: self._in_thread(stock_service.reserve_many, order), range(self.STOCK)
+            ))
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(sum(results), self.STOCK // 2)
+        self.assertEqual(second.stock, 0)
+        self.assertEqual(first.stock, self.STOCK - self.STOCK // 2)
+
+
+class SearchIndexRebuildTest(TransactionTestCase):
+    """全量重建期间，其他连接的搜索仍然读到完整的旧索引，商品保存不必等待重建"""
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('内存SQLite测试库不支持多连接，请使用 test_shop.test_settings（文件SQLite）或MySQL运行')
+
+    def test_readers_keep_old_index_until_commit(self):
+        products = [Product.objects.create(name=f'蓝牙耳机 {i}', description='无线降噪', price=1, stock=1)
+                    for i in range(3)]
+        seen = []
+
+        def search_elsewhere():
+            try:
+                return len(search_index.search('耳机'))
+            finally:
+                connection.close()
+
+        def progress(processed):
+            with ThreadPoolExecutor(max_workers=1) as pool:
+                seen.append(pool.submit(search_elsewhere).result())
+
+        search_index.rebuild(chunk_size=1, progress=progress)
+        self.assertEqual(seen, [len(products)] * len(products))
+        self.assertEqual(len(search_index.search('耳机')), len(products))
+
+    def test_product_saves_do_not_wait_and_are_caught_up(self):
+        products = [Product.objects.create(name=f'蓝牙耳机 {i}', description='无线降噪', price=1, stock=1)
+                    for i in range(3)]
+        renamed = []
+
+        def rename_elsewhere(product_id):
+            try:
+                product = Product.objects.get(id=product_id)
+                product.name = '机械键盘'
+                product.save()
+            finally:
+                connection.close()
+
+        def progress(processed):
+            if processed == len(products):  # 最后一个商品已写入新的一套表，此后的修改要靠切换后补索引
+                with ThreadPoolExecutor(max_workers=1) as pool:
+                    pool.submit(rename_elsewhere, products[0].id).result(timeout=10)
+                renamed.append(products[0].id)
+
+        search_index.rebuild(chunk_size=1, progress=progress)
+        self.assertEqual(renamed, [products[0].id])
+        self.assertEqual([p.id for p in search_index.search('键盘')], [products[0].id])
+        self.assertEqual(len(search_index.search('耳机')), len(products) - 1)
+
+        search_index.rebuild(chunk_size=10)  # 再次重建写回第一套表
+        self.assertEqual([p.id for p in search_index.search('键盘')], [products[0].id])
+
+
+class ItemCFIncrementalTest(TestCase):
+    def _paid_order(self, user, products):
+        order = Order.objects.create(user=user, order_number=f'T{Order.objects.count()}', total_amount=1,
+                                     payment_method='cash', status='paid', receiver_name='a',
+                                     receiver_phone='1', receiver_address='x')
+        OrderItem.objects.bulk_create([OrderItem(order=order, product=product, quantity=1, price=1)
+                                       for product in products])
+        return order
+
+    def test_update_without_prior_build_scores_history_products(self):
+        user = User.objects.create(username='buyer')
+        first, second = (Product.objects.create(name=f'商品{i}', price=1, stock=1) for i in range(2))
+        self._paid_order(user, [first])  # build_item_similarity 从未运行，first 没有购买者数行
+        order = self._paid_order(user, [second])
+        ProductBuyerCount.objects.all().delete()
+
+        item_cf.update_for_order(order.id)
+
+        self.assertEqual(dict(ProductBuyerCount.objects.values_list('product_id', 'buyers')),
+                         {first.id: 1, second.id: 1})
+        scores = dict(ProductSimilarity.objects.values_list('product_id', 'score'))
+        self.assertEqual(scores, {first.id: 1.0, second.id: 1.0})
+
+    def _order_queries(self, history_size):
+        user = User.objects.create(username=f'buyer{history_size}')
+        products = [Product.objects.create(name=f'商品{i}', price=1, stock=1) for i in range(history_size + 1)]
+        self._paid_order(user, products[:-1])
+        item_cf.build()
+        order = self._paid_order(user, products[-1:])
+        with CaptureQueriesContext(connection) as queries:
+            item_cf.update_for_order(order.id, top_n=3)
+        return len(queries), products
+
+    def test_queries_do_not_grow_with_purchase_history(self):
+        small, _ = self._order_queries(5)
+        large, products = self._order_queries(30)
+        self.assertEqual(small, large)
+
+        neighbors = ProductSimilarity.objects.filter(product_id__in=[product.id for product in products])
+        counts = neighbors.values('product_id').annotate(n=Count('id')).values_list('n', flat=True)
+        self.assertEqual(set(counts), {3})
+        self.assertFalse(neighbors.filter(score__isnull=True).exists())
+
+
+class CheckoutPriceChangeTest(TestCase):
+    DELIVERY = {'name': '张三', 'phone': '13800000000', 'address': '北京', 'payment_method': 'cash'}
+
+    def test_price_change_after_add_to_cart_requires_reconfirmation(self):
+        user = User.objects.create_user(username='buyer', password='pw')
+        self.client.force_login(user)
+        product = Product.objects.create(name='商品', price=10, stock=5)
+        self.client.get(reverse('product_management:add_to_cart', args=[product.id]))
+
+        product.price = 12
+        product.save(update_fields=['price'])
+
+        self.client.post(reverse('product_management:process_checkout'), self.DELIVERY)
+        self.assertFalse(Order.objects.exists())
+        # 购物车已改为新价格，再次提交即按用户看到的新价格下单
+        self.assertEqual(self.client.session['cart']['total'], '12.00')
+
+        self.client.post(reverse('product_management:process_checkout'), self.DELIVERY)
+        order = Order.objects.get()
+        self.assertEqual(order.total_amount, 12)
+        self.assertEqual(order.items.get().price, 12)
+
+
+class CartStoreTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.headphones = Product.objects.create(name='耳机', price=Decimal('19.90'), stock=10)
+        self.keyboard = Product.objects.create(name='键盘', price=Decimal('5.00'), stock=10)
+
+    @staticmethod
+    def _request(user=None, session_key=None):
+        request = RequestFactory().get('/')
+        request.session = SessionStore(session_key)
+        request.user = user or AnonymousUser()
+        return request
+
+    def _assert_total_matches_lines(self, store):
+        self.assertEqual(store.total, sum((line['total_item_price'] for line in store.lines()), Decimal('0')))
+
+    def test_legacy_session_cart_is_upgraded(self):
+        request = self._request()
+        request.session['cart'] = {str(self.headphones.id): 2, str(self.keyboard.id): 1, '999999': 3}
+        store = SessionCartStore(request)
+
+        self.assertEqual(store.quantities(), {str(self.headphones.id): 2, str(self.keyboard.id): 1})
+        self.assertEqual(store.total, Decimal('44.80'))
+        self.assertEqual(store.prices(), {self.headphones.id: Decimal('19.90'), self.keyboard.id: Decimal('5.00')})
+        self.assertTrue(store.save())  # 升级后的新格式写回会话
+        self.assertEqual(request.session['cart']['total'], '44.80')
+        self.assertEqual(request.session['cart']['lines'][str(self.keyboard.id)]['name'], '键盘')
+
+    def test_running_total_through_add_remove_and_reprice(self):
+        store = SessionCartStore(self._request())
+        store.add(self.headphones, 2)
+        store.add(self.keyboard)
+        self.assertEqual(store.total, Decimal('44.80'))
+        self._assert_total_matches_lines(store)
+
+        self.assertEqual(store.remove(self.headphones.id), 1)
+        self.assertEqual(store.remove(self.keyboard.id, 5), 1)  # 最多减到0，该行移除
+        self.assertEqual(store.total, Decimal('19.90'))
+        self.assertEqual(len(store), 1)
+        self._assert_total_matches_lines(store)
+
+        store.add(self.keyboard, 3)
+        store.reprice({self.headphones.id: Decimal('17.50')})
+        self.assertEqual(store.total, Decimal('32.50'))
+        self._assert_total_matches_lines(store)
+
+        store.remove(self.headphones.id)
+        store.remove(self.keyboard.id, 3)
+        self.assertEqual(store.total, Decimal('0'))
+        self.assertFalse(store)
+
+    def test_save_without_changes_writes_nothing(self):
+        request = self._request()
+        request.session['cart'] = {'lines': {}, 'total': '0'}
+        request.session.save()
+        request = self._request(session_key=request.session.session_key)
+
+        store = SessionCartStore(request)
+        store.quantity(self.headphones.id)
+        store.remove(self.headphones.id)  # 不在购物车中，没有变化
+        self.assertFalse(store.save())
+        self.assertFalse(request.session.modified)
+
+        with mock.patch('product_management.services.cart_store.cache.set') as cache_set:
+            store = CacheCartStore(self._request())
+            store.add(self.headphones)
+            self.assertTrue(store.save())
+            self.assertFalse(store.save())
+        self.assertEqual(cache_set.call_count, 1)
+
+    def test_cache_store_keys_by_user_and_by_session(self):
+        user = User.objects.create(username='buyer')
+        store = CacheCartStore(self._request(user))
+        store.add(self.headphones)
+        store.save()
+        self.assertIsNotNone(cache.get(f'cart:user:{user.pk}'))
+        self.assertEqual(CacheCartStore(self._request(user)).quantity(self.headphones.id), 1)
+
+        anonymous = self._request()
+        self.assertFalse(CacheCartStore(anonymous))
+        self.assertIsNone(anonymous.session.session_key)  # 只读取时不创建会话
+        store = CacheCartStore(anonymous)
+        store.add(self.keyboard, 2)
+        store.save()
+        session_key = anonymous.session.session_key
+        self.assertIsNotNone(cache.get(f'cart:session:{session_key}'))
+        self.assertEqual(CacheCartStore(self._request(session_key=session_key)).quantity(self.keyboard.id), 2)
+        self.assertEqual(CacheCartStore(self._request(user)).quantity(self.keyboard.id), 0)
+
+
+class PreferenceRebuildTest(TestCase):
+    def test_events_applied_during_rebuild_are_not_lost(self):
+        user = User.objects.create(username='shopper')
+        behavior_events.record(user.id, 'cart', ['耳机'])
+        behavior_events.process_batch()
+        behavior_events.record(user.id, 'cart', ['键盘'])  # 重算开始时尚未处理
+
+        mark = preference_rebuild.high_water_mark()
+        history = preference_rebuild.load_history(mark=mark)
+        preferences = preference_rebuild.aggregate(history)
+
+        # 重算期间 worker 处理了新到达的事件
+        behavior_events.record(user.id, 'cart', ['鼠标'])
+        behavior_events.process_batch()
+        version = recommendation_cache.preference_version(user.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            preference_rebuild.write(preferences, history.creators, mark)
+
+        weights = dict(UserPreference.objects.get(user=user).get_top_preferences(n=None))
+        increment = UserPreference.EVENT_INCREMENTS['cart']
+        self.assertEqual(set(weights), {'耳机', '键盘', '鼠标'})
+        for weight in weights.values():
+            self.assertAlmostEqual(weight, increment, places=3)
+        self.assertFalse(BehaviorEvent.objects.filter(processed_at__isnull=True).exists())
+        self.assertNotEqual(recommendation_cache.preference_version(user.id), version)
+
+    def test_order_paid_during_rebuild_is_counted_once(self):
+        user = User.objects.create(username='shopper')
+        product = Product.objects.create(name='耳机', price=1, stock=1, tags=['耳机'])
+        mark = preference_rebuild.high_water_mark()
+        cutoff = timezone.now()
+
+        # 取得高水位之后、扫描订单之前付款的订单：其下单事件ID大于高水位
+        order = Order.objects.create(user=user, order_number='R1', total_amount=1, payment_method='cash',
+                                     status='paid', receiver_name='a', receiver_phone='1', receiver_address='x')
+        OrderItem.objects.create(order=order, product=product, quantity=1, price=1)
+        behavior_events.record(user.id, 'order', ['耳机'])
+
+        history = preference_rebuild.load_history(mark=mark, cutoff=cutoff)
+        preferences = preference_rebuild.aggregate(history)
+        behavior_events.process_batch()
+        with self.captureOnCommitCallbacks(execute=True):
+            preference_rebuild.write(preferences, history.creators | {user.id}, mark, cutoff=cutoff)
+
+        weights = dict(UserPreference.objects.get(user=user).get_top_preferences(n=None))
+        self.assertAlmostEqual(weights['耳机'], UserPreference.EVENT_INCREMENTS['order'], places=3)
+
+
+class UserPreferenceDecayTest(SimpleTestCase):
+    """偏好权重按 DECAY_PERIOD 半衰：存储 last_updated 时刻的权重，读取时计算衰减"""
+
+    def setUp(self):
+        self.now = timezone.now()
+        self.preference = UserPreference(user_id=1, preferred_tags={})
+
+    def _ago(self, periods):
+        return self.now - timedelta(days=UserPreference.DECAY_PERIOD * periods)
+
+    def _stored(self, weight, periods_ago):
+        return {'weight': weight, 'last_updated': self._ago(periods_ago).isoformat()}
+
+    def _weights(self):
+        return dict(self.preference._current_weights(self.now))
+
+    def test_weight_halves_every_decay_period(self):
+        self.preference.preferred_tags = {'耳机': self._stored(8.0, 3), '键盘': self._stored(8.0, 0.5)}
+        weights = self._weights()
+        self.assertAlmostEqual(weights['耳机'], 1.0)
+        self.assertAlmostEqual(weights['键盘'], 8.0 * 0.5 ** 0.5)
+
+    def test_late_event_is_decayed_to_newer_update(self):
+        self.preference.apply_events([(['耳机'], 1.0, self.now)], commit=False)
+        self.preference.apply_events([(['耳机'], 1.0, self._ago(1))], commit=False)  # 早一个周期的事件后到达
+
+        in_order = UserPreference(user_id=2, preferred_tags={})
+        in_order.apply_events([(['耳机'], 1.0, self._ago(1)), (['耳机'], 1.0, self.now)], commit=False)
+
+        self.assertAlmostEqual(self._weights()['耳机'], 1.5)
+        self.assertEqual(self.preference.preferred_tags['耳机']['last_updated'], self.now.isoformat())
+        self.assertAlmostEqual(self._weights()['耳机'], dict(in_order._current_weights(self.now))['耳机'])
+
+    def test_tags_below_min_weight_are_pruned(self):
+        # 1.0 衰减 3 个周期为 0.125（保留），4 个周期为 0.0625（低于 MIN_WEIGHT=0.1，清理）
+        self.preference.preferred_tags = {'耳机': self._stored(1.0, 3), '键盘': self._stored(1.0, 4)}
+        self.preference._apply_decay(self.now)
+        self.assertEqual(set(self.preference.preferred_tags), {'耳机'})
+
+    def test_limit_keeps_highest_decayed_weights(self):
+        # 旧标签存储的权重更高，但衰减后（4.0 -> 0.5）低于新标签
+        fresh = {f'新{i}': self._stored(1.0, 0) for i in range(UserPreference.MAX_TAGS)}
+        stale = {f'旧{i}': self._stored(4.0, 3) for i in range(2)}
+        self.preference.preferred_tags = {**stale, **fresh}
+        self.preference._limit_tags(self.now)
+        self.assertEqual(set(self.preference.preferred_tags), set(fresh))
+
+
+class MetricsSnapshotTest(SimpleTestCase):
+    @staticmethod
+    def _snapshot(value, buckets=(1, 2)):
+        return {'counters': [['jobs_total', [], value]],
+                'histograms': [['job_seconds', [], list(buckets), [value, 0, 0], float(value)]]}
+
+    def test_dead_worker_snapshot_is_folded_into_archive(self):
+        with tempfile.TemporaryDirectory() as directory:
+            for token, value in (('100-1', 3), ('100-2', 4), ('200-1', 5)):  # PID 100 被复用过一次
+                with open(os.path.join(directory, f'{token}.json'), 'w') as f:
+                    json.dump(self._snapshot(value), f)
+
+            self.assertEqual(metrics.mark_process_dead(100, directory), 2)
+            self.assertEqual(sorted(map(os.path.basename, glob.glob(os.path.join(directory, '*.json')))),
+                             ['200-1.json', metrics.ARCHIVE_FILE])
+            with override_settings(METRICS_DIR=directory):
+                counters, histograms = metrics.merge(metrics.collect())
+            # 总和不回退：已退出 worker 的计数仍然计入
+            self.assertEqual(counters[('jobs_total', ())], 12)
+            self.assertEqual(histograms[('job_seconds', ())]['counts'], [12, 0, 0])
+
+    def test_merge_rejects_mismatched_buckets(self):
+        with self.assertRaises(ValueError):
+            metrics.merge([self._snapshot(1), self._snapshot(1, buckets=(1, 5))])
+
+
+class PopularityRowsTest(TestCase):
+    def test_every_product_is_in_the_sales_ordered_list(self):
+        created = Product.objects.create(name='新商品', price=1, stock=1)
+        imported = Product.objects.bulk_create([Product(name='导入商品', price=1, stock=1)])[0]
+        products_bulk_saved.send(sender=Product, product_ids=[imported.id])
+        popularity.record_sales({imported.id: 2})
+
+        self.assertEqual(ProductPopularity.objects.count(), 2)
+        ranked = popularity.with_sales(Product.objects.all()).order_by(*popularity.SALES_ORDERING)
+        self.assertEqual(list(ranked.values_list('id', 'sales')), [(imported.id, 2), (created.id, 0)])
+
+
+class TagDictionaryReloadTest(TestCase):
+    def setUp(self):
+        self.addCleanup(setattr, tag_service, '_dictionary', None)
+        tag_service.load_dictionary()
+
+    def test_fingerprint_is_checked_once_per_interval(self):
+        TagKeyword.objects.create(keyword='露营')
+        with CaptureQueriesContext(connection) as queries:
+            tag_service.maybe_reload()
+        self.assertEqual(len(queries), 0)
+        self.assertNotIn('露营', tag_service.extract_with_dict('露营装备'))
+
+        tag_service._last_dictionary_check = 0.0
+        tag_service.maybe_reload()
+        self.assertIn('露营', tag_service.extract_with_dict('露营装备'))
+
+    def test_missing_tables_do_not_break_outer_transaction(self):
+        def fail_dictionary_queries(execute, sql, params, many, context):
+            if 'tagkeyword' in sql.lower():
+                raise DatabaseError('no such table')
+            return execute(sql, params, many, context)
+
+        # SQLite 出错后事务仍可用，这里检查失败的查询回滚到了保存点（PostgreSQL 等数据库否则会中止整个外层事务）
+        with transaction.atomic(), CaptureQueriesContext(connection) as queries:
+            with connection.execute_wrapper(fail_dictionary_queries):
+                tag_service.load_dictionary()
+            self.assertIsNone(tag_service._dictionary[2])
+            self.assertTrue(Product.objects.create(name='商品', price=1, stock=1).pk)
+        self.assertTrue(any(query['sql'].startswith('ROLLBACK TO SAVEPOINT') for query in queries))
+
+
+class RetagProductsTest(TestCase):
+    def test_products_edited_during_retag_are_skipped(self):
+        from .management.commands.retag_products import Command
+        edited = Product.objects.create(name='商品A', price=1, stock=1, tags=['旧'])
+        untouched = Product.objects.create(name='商品B', price=1, stock=1, tags=['旧'])
+        changes = [(edited.id, edited.version, ['旧'], ['新']), (untouched.id, untouched.version, ['旧'], ['新'])]
+        edited.tags = ['人工']
+        edited.save(update_fields=['tags'])
+
+        command = Command()
+        command.processed = command.changed = command.skipped = 0
+        command.verbosity = 0
+        command._apply(2, changes, dry_run=False, started=0)
+
+        self.assertEqual((command.changed, command.skipped), (1, 1))
+        self.assertEqual(Product.objects.get(id=edited.id).tags, ['人工'])
+        self.assertEqual(Product.objects.get(id=untouched.id).tags, ['新'])
+
+
+class ProductVersionTest(TestCase):
+    def test_post_save_receivers_see_the_saved_version(self):
+        from django.db.models.signals import post_save
+        product = Product.objects.create(name='商品', price=1, stock=2)
+        stock_service.reserve(product.id)
+        seen = []
+
+        def receiver(instance, **kwargs):
+            seen.append(instance.version)
+        post_save.connect(receiver, sender=Product)
+        self.addCleanup(post_save.disconnect, receiver, sender=Product)
+
+        updated_at = product.updated_at
+        product.save(update_fields=['price'])
+
+        stored = Product.objects.values_list('version', 'updated_at').get(id=product.id)
+        self.assertEqual(seen, [stored[0]])
+        self.assertEqual(stored[0], 3)
+        self.assertGreater(stored[1], updated_at)
+
+
+class ApiETagTest(TestCase):
+    OTHER_PROCESS = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                 'LOCATION': 'other-process'}}
+
+    def setUp(self):
+        self.product = Product.objects.create(name='商品', price=1, stock=5)
+
+    def _get(self, etag=None):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        return self.client.get(reverse('product_management:api_products'), **headers)
+
+    def test_write_in_another_process_invalidates_etag(self):
+        etag = self._get()['ETag']
+        self.assertEqual(self._get(etag).status_code, 304)
+
+        # 另一个进程（独立的本地内存缓存）扣减库存并推进它自己的版本计数，本进程的计数不变
+        with override_settings(CACHES=self.OTHER_PROCESS), self.captureOnCommitCallbacks(execute=True):
+            stock_service.reserve(self.product.id)
+
+        response = self._get(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['stock'], 4)
+
+    def test_delete_in_another_process_invalidates_etag(self):
+        Product.objects.create(name='新商品', price=1, stock=1)
+        etag = self._get()['ETag']
+        # 删除的不是最后修改的商品：MAX(updated_at) 不变，由删除标记发现
+        with override_settings(CACHES=self.OTHER_PROCESS), self.captureOnCommitCallbacks(execute=True):
+            self.product.delete()
+        self.assertEqual(self._get(etag).status_code, 200)
+
+    def test_not_modified_does_not_scan_products(self):
+        etag = self._get()['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self._get(etag).status_code, 304)
+        self.assertFalse(any('COUNT(' in query['sql'].upper() for query in queries))
+
+    def test_sales_in_another_process_invalidate_etag(self):
+        etag = self._get()['ETag']
+        with override_settings(CACHES=self.OTHER_PROCESS), self.captureOnCommitCallbacks(execute=True):
+            popularity.record_sales({self.product.id: 1})
+        self.assertEqual(self._get(etag).status_code, 200)
+
+
+class ExporterTest(TestCase):
+    def _rows(self, export):
+        return [json.loads(line) for line in b''.join(export).decode('utf-8').splitlines()]
+
+    def test_rows_are_read_in_keyset_pages(self):
+        ids = [Product.objects.create(name=f'商品{i}', price=1, stock=1).id for i in range(5)]
+        export = exporter.Export('products', 'jsonl', since_id=ids[0], chunk_size=2)
+        with CaptureQueriesContext(connection) as queries:
+            rows = self._rows(export)
+
+        self.assertEqual([row['id'] for row in rows], ids[1:])
+        self.assertEqual(len(queries), 3)  # 两页数据 + 一次空页
+        self.assertTrue(all('LIMIT 2' in query['sql'] for query in queries))
+        self.assertEqual(export.watermark()['since_id'], ids[-1])
+
+    def test_rows_edited_during_export_are_exported_next_time(self):
+        first, second = (Product.objects.create(name=name, price=1, stock=1, tags=['x']) for name in ('A', 'B'))
+        export = exporter.Export('products', 'jsonl', chunk_size=1)
+        rows = export._tracked_rows()
+        next(rows)
+        # 已读过的 A 先被修改，尚未读到的 B 随后被修改（修改时间更大）
+        first.name = 'A2'
+        first.save()
+        second.name = 'B2'
+        second.save()
+        list(rows)
+
+        since = timezone.datetime.fromisoformat(export.watermark()['since'])
+        rows = self._rows(exporter.Export('products', 'jsonl', since=since))
+        self.assertEqual({row['name'] for row in rows}, {'A2', 'B2'})
+
+    def test_time_watermark_picks_up_order_status_changes(self):
+        user = User.objects.create_user('buyer')
+        order = Order.objects.create(user=user, order_number='A1', total_amount=1, payment_method='cash',
+                                     receiver_name='张三', receiver_phone='1', receiver_address='地址')
+        first = exporter.Export('orders', 'jsonl')
+        self._rows(first)
+        since = timezone.datetime.fromisoformat(first.watermark()['since'])
+
+        order.status = 'shipped'
+        order.save()
+        rows = self._rows(exporter.Export('orders', 'jsonl', since=since))
+        self.assertEqual([(row['id'], row['status']) for row in rows], [(order.id, 'shipped')])
+
+
+class KeysetPaginatorTest(TestCase):
+    PAGE_SIZE = 3
+
+    def _products(self, count, name='蓝牙耳机'):
+        return [Product.objects.create(name=name, description='无线降噪', price=1, stock=1) for _ in range(count)]
+
+    def _assert_pages_continue(self, ordering, queryset):
+        """逐页翻完：拼接起来与整体排序完全一致，没有重复和遗漏"""
+        expected = [row['id'] if isinstance(row, dict) else row.id for row in queryset.order_by(*ordering)]
+        paginator = KeysetPaginator(ordering, self.PAGE_SIZE)
+        seen, cursor = [], None
+        while True:
+            page = paginator.paginate(queryset, cursor)
+            seen.extend(row['id'] if isinstance(row, dict) else row.id for row in page)
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+        self.assertGreater(len(expected), self.PAGE_SIZE * 2)
+        self.assertEqual(seen, expected)
+
+    def test_ties_in_match_score(self):
+        products = self._products(7)
+        high = [product.id for product in products[1:5]]  # 第一页末尾和第二页开头是同分商品
+        queryset = Product.objects.annotate(match_score=Case(
+            When(id__in=high, then=Value(0.5)), default=Value(0.25), output_field=FloatField(),
+        ))
+        self._assert_pages_continue(['-match_score', '-id'], queryset)
+
+    def test_ties_in_relevance(self):
+        self._products(5)
+        self._products(2, name='蓝牙耳机 耳机')
+        queryset = search_index.search('耳机').values('id', 'relevance')
+        self.assertEqual(len({round(row['relevance'], 9) for row in queryset}), 2)
+        self._assert_pages_continue(['-relevance', '-id'], queryset)
+
+    def test_ties_in_sales(self):
+        products = self._products(7)
+        popularity.record_sales({product.id: 2 for product in products[:4]})
+        queryset = popularity.with_sales(Product.objects.all(), '30d').values('id', 'sales', 'popularity_pk')
+        self._assert_pages_continue(popularity.SALES_ORDERING, queryset)
+
+    def test_tampered_cursor_restarts_from_first_page(self):
+        self._products(7)
+        paginator = KeysetPaginator(['-id'], self.PAGE_SIZE)
+        first = paginator.paginate(Product.objects.all())
+        cursor = first.next_cursor
+        tampered = cursor[:-1] + ('A' if cursor[-1] != 'A' else 'B')
+        wrong_length = paginator.encode([1, 2])
+
+        for bad in (tampered, 'not-a-cursor', wrong_length):
+            page = paginator.paginate(Product.objects.all(), bad)
+            self.assertEqual([p.id for p in page], [p.id for p in first])
+
+    def test_datetime_and_decimal_values_round_trip(self):
+        paginator = KeysetPaginator(['-updated_at', '-price', '-id'], self.PAGE_SIZE)
+        values = [timezone.now(), Decimal('19.90'), 7]
+        decoded = paginator.decode(paginator.encode(values))
+        self.assertEqual(decoded, values)
+        self.assertIsInstance(decoded[0], datetime)
+        self.assertIsInstance(decoded[1], Decimal)
+
+        for index, product in enumerate(self._products(7)):
+            Product.objects.filter(id=product.id).update(price=Decimal('9.90') if index % 2 else Decimal('19.90'))
+        self._assert_pages_continue(['-price', '-updated_at', '-id'], Product.objects.all())
+
+
+class TopKTest(SimpleTestCase):
+    def test_ties_are_broken_by_larger_id(self):
+        import numpy as np
+        scores = np.array([1.0, 2.0, 2.0, 2.0, 0.0, 2.0])
+        ids = np.array([10, 11, 15, 13, 14, 12])
+        self.assertEqual(ids[top_k(scores, ids, 2)].tolist(), [15, 13])
+        self.assertEqual(ids[top_k(scores, ids, 5)].tolist(), [15, 13, 12, 11, 10])
+        self.assertEqual(ids[top_k(scores, ids, 10)].tolist(), [15, 13, 12, 11, 10, 14])
+
+
+@override_settings(SCORING_REFRESH_INTERVAL=3600)
+class ScoringEngineTest(TestCase):
+    def setUp(self):
+        self.coffee = Product.objects.create(name='咖啡豆', price=1, stock=1, tags={'咖啡': 2.0})
+        self.mixed = Product.objects.create(name='茶咖组合', price=1, stock=1, tags={'咖啡': 1.0, '茶': 1.0})
+        self.tea = Product.objects.create(name='绿茶', price=1, stock=1, tags={'茶': 3.0})
+        self.engine = ScoringEngine()
+
+    def test_rank_matches_database_order_with_ties(self):
+        twin = Product.objects.create(name='咖啡豆2', price=1, stock=1, tags={'咖啡': 2.0})
+        self.assertEqual(self.engine.rank([('咖啡', 1.0)], 10),
+                         [(twin.id, 2.0), (self.coffee.id, 2.0), (self.mixed.id, 1.0), (self.tea.id, 0.0)])
+        self.assertEqual(self.engine.rank([('咖啡', 1.0)], 2, after=(2.0, twin.id)),
+                         [(self.coffee.id, 2.0), (self.mixed.id, 1.0)])
+
+    def test_catalog_version_change_forces_refresh(self):
+        self.engine.rank([('咖啡', 1.0)], 10)
+        self.mixed.tags = {'咖啡': 5.0}
+        self.mixed.save()  # 推进目录版本；刷新间隔（1小时）未到也要立即刷新
+        self.assertEqual(self.engine.rank([('咖啡', 1.0)], 1), [(self.mixed.id, 5.0)])
+        self.assertEqual(self.engine.rank([('茶', 1.0)], 2), [(self.tea.id, 3.0), (self.mixed.id, 0.0)])
+
+    def test_deleted_products_are_dropped_from_main_and_delta_rows(self):
+        self.engine.rank([('茶', 1.0)], 10)
+        self.mixed.tags = {'茶': 4.0}
+        self.mixed.save()
+        self.assertEqual(self.engine.rank([('茶', 1.0)], 1), [(self.mixed.id, 4.0)])
+
+        self.engine.remove([self.mixed.id, self.tea.id])
+        self.assertEqual(self.engine.rank([('茶', 1.0)], 10), [(self.coffee.id, 0.0)])
+
+
+class StockServiceTest(TestCase):
+    def test_release_returns_stock(self):
+        product = Product.objects.create(name='商品', stock=1, price=1)
+        self.assertTrue(stock_service.reserve(product.id))
+        self.assertFalse(stock_service.reserve(product.id))
+        self.assertTrue(stock_service.release(product.id))
+        product.refresh_from_db()
+        self.assertEqual(product.stock, 1)
+
+
+class SharedCacheCheckTest(SimpleTestCase):
+    LOCMEM = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+    REDIS = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://127.0.0.1'}}
+
+    @override_settings(CACHES=LOCMEM, REQUIRE_SHARED_CACHE=True)
+    def test_process_local_cache_is_rejected(self):
+        with self.assertRaises(ImproperlyConfigured):
+            recommendation_cache.check_shared_cache()
+
+    @override_settings(CACHES=REDIS, REQUIRE_SHARED_CACHE=True)
+    def test_shared_cache_is_accepted(self):
+        recommendation_cache.check_shared_cache()
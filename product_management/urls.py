@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import api_views, views
 
 app_name = 'product_management'
 
@@ -19,4 +19,9 @@ urlpatterns = [
     path('profile/', views.profile_view, name='profile'),
     path('change_password/', views.change_password, name='change_password'),
     path('search/', views.search_products, name='search'),
+    # 只读JSON接口（ETag/条件GET，游标分页）
+    path('api/products/', api_views.api_products, name='api_products'),
+    path('api/search/', api_views.api_search, name='api_search'),
+    path('api/recommendations/', api_views.api_recommendations, name='api_recommendations'),
+    path('export/<str:dataset>/', views.export_view, name='export'),  # 员工账号流式导出
 ]
\ No newline at end of file
@@ -1,100 +1,68 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import HttpResponse, JsonResponse
+from django.http import HttpResponse, StreamingHttpResponse
+from django.conf import settings
 from django.contrib import messages
 from .models import Product
-from .models import Order, OrderItem
-from .models import UserPreference  # 添加这行导入语句
+from .models import Order
+from .services import (behavior_events, checkout_service, exporter, fragment_cache, item_cf, metrics, popularity,
+                       search_index, stock_service)
+from .services.cart_store import get_cart_store
+from .services.pagination import KeysetPaginator, page_size_from
+from .services.ranking import recommend_page
 
-from django.db.models import Case, When, Value, IntegerField
-from django.db.models.functions import Coalesce
+from django.contrib.admin.views.decorators import staff_member_required
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 
 
 def product_list(request):
-    # 初始化购物车session
-    if 'cart' not in request.session:
-        request.session['cart'] = {}
-
-    # 获取基础查询集
-    products = Product.objects.all()
-
     # 判断用户是否登录
     user_logged_in = request.user.is_authenticated
+    page_size = page_size_from(request)
+    cursor = request.GET.get('cursor')
 
-    # 如果用户已登录，按偏好排序
-    if user_logged_in:
-        try:
-            # 获取用户偏好
-            pref = UserPreference.objects.get(user=request.user)
-
-            # 获取用户最喜爱的标签（按权重排序）
-            top_tags = [tag for tag, _ in pref.get_top_preferences()]
-
-            # 创建排序条件：匹配度越高分数越大
-            when_clauses = []
-            for i, tag in enumerate(top_tags):
-                # 改为倒序赋值：最重要的标签得最高分
-                when_clauses.append(When(tags__contains=[tag], then=Value(len(top_tags) - i)))
-
-            # 添加排序注解
-            products = products.annotate(
-                match_score=Case(
-                    *when_clauses,
-                    default=Value(0),  # 不匹配的得0分
-                    output_field=IntegerField()
-                )
-            ).order_by('-match_score', '-id')  # 按匹配度降序排列
-
-        except UserPreference.DoesNotExist:
-            # 如果没有偏好记录，保持默认排序
-            pass
+    # 如果用户已登录，按偏好排序（排名来自推荐结果缓存，只加载当前页的商品）
+    page = recommend_page(request.user, page_size, cursor) if user_logged_in else None
+
+    if page is None:
+        # 未登录或没有偏好记录，按近7天销量排序（热度表的索引列）；游标分页，不做 OFFSET/COUNT(*)
+        page = KeysetPaginator(popularity.SALES_ORDERING, page_size).paginate(
+            popularity.with_sales(Product.objects.all()), cursor
+        )
 
+    # 商品卡片来自片段缓存（按商品行版本失效），只渲染未命中的卡片
+    fragment_cache.attach_cards(page.object_list, 'product_management/cards/product_list_card.html')
     return render(request, 'product_management/product_list.html', {
-        'products': products,
+        'products': page.object_list,
+        'next_cursor': page.next_cursor,
         'user_logged_in': user_logged_in,
     })
 
 def add_to_cart(request, product_id):
     product = get_object_or_404(Product, id=product_id)
 
-    if product.stock <= 0:
+    # 条件UPDATE原子扣减库存，库存不足时不会超卖
+    if not stock_service.reserve(product.id):
         messages.error(request, "该商品已售罄")
-        return redirect('product_list')  # 或者你想重定向的页面
-
-    if product.stock < 1:
-        # 修改为使用存在的模板路径
-        return render(request, 'product_management/error.html', {'message': '库存不足'})
-
-    cart = request.session.get('cart', {})
-    product_id_str = str(product_id)
-    cart[product_id_str] = cart.get(product_id_str, 0) + 1
+        return redirect('product_management:product_list')
 
-    product.stock -= 1
-    product.save()
+    cart = get_cart_store(request)
+    cart.add(product)
+    cart.save()
 
     if request.user.is_authenticated:
-        pref, _ = UserPreference.objects.get_or_create(user=request.user)
-        pref.add_cart_activity(product)
+        # 只追加行为事件，偏好由 process_behavior_events 异步更新
+        behavior_events.record_cart(request.user, product)
 
-    request.session['cart'] = cart
     return redirect('product_management:view_cart')
 
 def remove_from_cart(request, product_id):
     product = get_object_or_404(Product, id=product_id)
-    cart = request.session.get('cart', {})
-    product_id_str = str(product_id)
-
-    if product_id_str in cart:
-        remove_quantity = 1
-        product.stock += remove_quantity
-        product.save()
+    cart = get_cart_store(request)
 
-        if cart[product_id_str] > remove_quantity:
-            cart[product_id_str] -= remove_quantity
-        else:
-            del cart[product_id_str]
-
-        request.session['cart'] = cart
-        request.session.modified = True
+    if cart.quantity(product.id):
+        stock_service.release(product.id, cart.remove(product.id))
+        cart.save()
         messages.success(request, f"已从购物车移除 {product.name}")
     else:
         messages.error(request, "该商品不在购物车中")
@@ -105,117 +73,55 @@ def remove_from_cart(request, product_id):
 # product_management/views.py
 def update_cart(request, product_id):
     product = get_object_or_404(Product, id=product_id)
-    cart = request.session.get('cart', {})
-    product_id_str = str(product_id)
+    cart = get_cart_store(request)
 
     if request.method == 'POST':
         action = request.POST.get('action')
-        quantity = int(request.POST.get('quantity', 1))
 
-        if action == 'increase' and product.stock > 0:
-            cart[product_id_str] = cart.get(product_id_str, 0) + 1
-            product.stock -= 1
-        elif action == 'decrease' and cart.get(product_id_str, 0) > 1:
-            cart[product_id_str] = cart.get(product_id_str, 0) - 1
-            product.stock += 1
+        if action == 'increase':
+            if not stock_service.reserve(product.id):
+                messages.error(request, "库存不足")
+                return redirect('product_management:view_cart')
+            cart.add(product)
+        elif action == 'decrease' and cart.quantity(product.id) > 1:
+            stock_service.release(product.id, cart.remove(product.id))
 
-        product.save()
-        request.session['cart'] = cart
+        cart.save()
         messages.success(request, "购物车已更新")
 
     return redirect('product_management:view_cart')
 
+def cart_context(request):
+    """购物车页与结算页共用：明细和总价都来自购物车中的快照，不查询商品表"""
+    cart = get_cart_store(request)
+    cart.save()  # 旧格式购物车升级后写回
+    return {
+        'cart_details': cart.lines(),
+        'total_price': cart.total,
+    }
+
+
 def view_cart(request):
-    cart = request.session.get('cart', {})
-    products_in_cart = Product.objects.filter(id__in=cart.keys())
-
-    cart_details = []
-    total_price = 0
-    for product in products_in_cart:
-        quantity = cart[str(product.id)]
-        total_item_price = product.price * quantity
-        cart_details.append({
-            'product': product,
-            'quantity': quantity,
-            'total_item_price': total_item_price
-        })
-        total_price += total_item_price
-
-    return render(request, 'product_management/cart.html', {
-        'cart_details': cart_details,
-        'total_price': total_price
-    })
+    return render(request, 'product_management/cart.html', cart_context(request))
 
 
 def checkout(request):
-    if not request.session.get('cart'):
+    if not get_cart_store(request):
         return redirect('product_management:product_list')
 
-    cart = request.session['cart']
-    products_in_cart = Product.objects.filter(id__in=cart.keys())
-
-    cart_details = []
-    total_price = 0
-    for product in products_in_cart:
-        quantity = cart[str(product.id)]
-        total_item_price = product.price * quantity
-        cart_details.append({
-            'product': product,
-            'quantity': quantity,
-            'total_item_price': total_item_price
-        })
-        total_price += total_item_price
-
-    return render(request, 'product_management/checkout.html', {
-        'cart_details': cart_details,
-        'total_price': total_price
-    })
-
+    return render(request, 'product_management/checkout.html', cart_context(request))
 
-import random
-import string
-from datetime import datetime
 
 def order_detail(request, order_id):
     order = get_object_or_404(Order, id=order_id)
+    # 订单项连同商品一次查询取出，模板中访问 item.product 不再逐条查询
+    order_items = list(order.items.select_related('product'))
     return render(request, 'product_management/order_detail.html', {
         'order': order,
-        'order_items': order.items.all()  # 获取关联的所有订单项
+        'order_items': order_items,
+        'related_products': item_cf.related_to({item.product_id for item in order_items}, n=6),
     })
 
-def create_order(user, cart_items, delivery_info):
-    # 生成订单号
-    order_number = datetime.now().strftime('%Y%m%d') + ''.join(random.choices(string.digits, k=6))
-
-    # 计算总金额
-    products = Product.objects.filter(id__in=cart_items.keys())
-    total_amount = sum(product.price * cart_items[str(product.id)] for product in products)
-
-    # 创建订单
-    order = Order.objects.create(
-        user=user,
-        order_number=order_number,
-        total_amount=total_amount,
-        payment_method=delivery_info['payment_method'],
-        receiver_name=delivery_info['name'],
-        receiver_phone=delivery_info['phone'],
-        receiver_address=delivery_info['address'],
-        notes=delivery_info.get('notes', '')
-    )
-
-    # 创建订单项
-    order_items = [
-        OrderItem(
-            order=order,
-            product=product,
-            quantity=cart_items[str(product.id)],
-            price=product.price
-        ) for product in products
-    ]
-    OrderItem.objects.bulk_create(order_items)
-
-    return order
-
 from django.contrib.auth.decorators import login_required
 
 @login_required
@@ -229,28 +135,37 @@ def process_checkout(request):
         notes = request.POST.get('notes', '')
 
         # 2. 创建订单 (需要先创建Order模型)
-        cart = request.session.get('cart', {})
+        cart = get_cart_store(request)
         if not cart:
             messages.error(request, "购物车为空")
             return redirect('product_management:product_list')
 
         try:
             # 这里需要创建Order模型和相关逻辑
-            order = create_order(request.user, cart, {
+            # 一个事务内下单（库存已在加入购物车时预留）
+            order = checkout_service.place_order(request.user, cart.quantities(), {
                 'name': name,
                 'phone': phone,
                 'address': address,
                 'payment_method': payment_method,
                 'notes': notes
-            })
+            }, expected_prices=cart.prices())
 
             # 3. 清空购物车
-            del request.session['cart']
+            cart.clear()
+            cart.save()
 
             # 4. 跳转到订单详情页
             messages.success(request, "订单创建成功！")
             return redirect('product_management:order_detail', order_id=order.id)
 
+        except checkout_service.PriceChangedError as e:
+            # 购物车改为当前价格，结算页展示新价格，由用户重新确认后再提交
+            cart.reprice(e.prices)
+            cart.save()
+            messages.warning(request, str(e))
+            return redirect('product_management:checkout')
+
         except Exception as e:
             messages.error(request, f"创建订单失败: {str(e)}")
             return redirect('product_management:checkout')
@@ -264,11 +179,14 @@ from django.contrib import messages
 
 @login_required
 def order_history(request):
-    # 获取当前用户的所有历史订单
-    orders = Order.objects.filter(user=request.user).order_by('-created_at')
+    # 当前用户的历史订单：按 (用户, 下单时间, id) 索引做游标分页，摘要来自订单表冗余字段
+    page = KeysetPaginator(['-created_at', '-id'], page_size_from(request)).paginate(
+        Order.objects.filter(user=request.user), request.GET.get('cursor')
+    )
 
     return render(request, 'product_management/order_history.html', {
-        'orders': orders
+        'orders': page.object_list,
+        'next_cursor': page.next_cursor,
     })
 
 
@@ -368,47 +286,70 @@ def change_password(request):
 
 
 # product_management/views.py
-from django.db.models import Q, Case, When, Value, IntegerField
-
-
 def search_products(request):
     query = request.GET.get('q', '').strip()
 
     if not query:
         return redirect('product_list')  # 空搜索跳回商品列表
 
-    # 基础查询
-    products = Product.objects.filter(
-        Q(name__icontains=query) |
-        Q(description__icontains=query) |
-        Q(tags__contains=[query])  # 搜索标签
-    ).distinct()
-
-    # 相关度排序逻辑
-    when_clauses = [
-        When(name__icontains=query, then=Value(3)),  # 名称匹配最高分
-        When(description__icontains=query, then=Value(2)),  # 描述匹配中等
-        When(tags__contains=[query], then=Value(1))  # 标签匹配最低分
-    ]
-
-    products = products.annotate(
-        relevance=Case(
-            *when_clauses,
-            default=Value(0),
-            output_field=IntegerField()
-        )
-    ).order_by('-relevance')  # 按相关度降序
+    # 倒排索引 + BM25 相关度（名称、标签、描述按字段加权），附带近30天销量
+    products = popularity.with_sales(search_index.search(query), '30d')
 
-    # 更新用户搜索偏好（已登录用户）
-    if request.user.is_authenticated:
-        try:
-            pref = UserPreference.objects.get(user=request.user)
-            pref.add_search_activity([query])  # 记录搜索关键词
-        except UserPreference.DoesNotExist:
-            pass
+    # 按相关度（默认）或销量降序的游标分页（id 作为同分时的稳定次序）
+    sort = 'sales' if request.GET.get('sort') == 'sales' else 'relevance'
+    cursor = request.GET.get('cursor')
+    page = KeysetPaginator([f'-{sort}', '-id'], page_size_from(request)).paginate(products, cursor)
 
+    # 更新用户搜索偏好（已登录用户，翻页不重复记录）
+    if request.user.is_authenticated and not cursor:
+        behavior_events.record_search(request.user, [query])  # 记录搜索关键词（异步应用）
+
+    fragment_cache.attach_cards(page.object_list, 'product_management/cards/search_card.html')
     return render(request, 'product_management/search.html', {
-        'products': products,
+        'products': page.object_list,
+        'next_cursor': page.next_cursor,
         'query': query,
+        'sort': sort,
         'user_logged_in': request.user.is_authenticated
-    })
\ No newline at end of file
+    })
+
+
+def metrics_view(request):
+    """Prometheus 抓取端点（只允许 METRICS_ALLOWED_IPS 中的地址访问）"""
+    allowed = getattr(settings, 'METRICS_ALLOWED_IPS', None)
+    if allowed is not None and request.META.get('REMOTE_ADDR') not in allowed:
+        return HttpResponse(status=403)
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@staff_member_required
+def export_view(request, dataset):
+    """
+    流式导出（仅限员工账号）：?format=csv|jsonl&gzip=1&since_id=<主键>&since=<ISO时间>
+    边查询边输出，内存占用与表大小无关
+    """
+    since = request.GET.get('since')
+    try:
+        since_id = int(request.GET['since_id']) if request.GET.get('since_id') else None
+        if since:
+            since = parse_datetime(since)
+            if since is None:
+                raise ValueError('since 不是有效的 ISO 8601 时间')
+        else:
+            since = None
+        if since is not None and timezone.is_naive(since):
+            since = timezone.make_aware(since)
+        export = exporter.Export(dataset, request.GET.get('format', 'csv'), request.GET.get('gzip') == '1',
+                                 since_id=since_id, since=since)
+    except ValueError as e:
+        return HttpResponse(str(e), status=400, content_type='text/plain; charset=utf-8')
+
+    if export.compress:
+        content_type = 'application/gzip'
+    elif export.fmt == 'csv':
+        content_type = 'text/csv; charset=utf-8'
+    else:
+        content_type = 'application/x-ndjson; charset=utf-8'
+    response = StreamingHttpResponse(export, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{export.filename}"'
+    return response
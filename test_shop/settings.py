@@ -41,6 +41,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'product_management.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -89,6 +90,18 @@ DATABASES = {
 }
 
 
+# 缓存：推荐结果缓存的版本计数、JSON接口ETag中的版本计数、CacheCartStore 购物车都存放在这里，
+# 必须是所有 web worker 和管理命令共享的后端（Redis/Memcached/数据库缓存）——
+# 进程内的 LocMemCache 中，一个进程推进的版本其他进程看不到，缓存的推荐结果和购物车只对写入它的进程可见
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',  # 需要安装 redis 包
+        'LOCATION': 'redis://127.0.0.1:6379/1',
+    }
+}
+# 为True时，默认缓存是进程内后端（LocMemCache/DummyCache）则拒绝启动；只在单进程的测试/基准配置中关闭
+REQUIRE_SHARED_CACHE = True
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -130,3 +143,46 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# 标签服务：build_tag_model 命令发布的TF-IDF模型目录，及工作进程检查新版本的间隔(秒)
+TAG_MODEL_DIR = BASE_DIR / 'tag_models'
+TAG_MODEL_RELOAD_INTERVAL = 30
+
+# 分词：启动时预热jieba词典及其序列化缓存文件（不存在时首次启动生成），分词结果LRU缓存的文本条数
+JIEBA_WARM_UP = True
+JIEBA_CACHE_FILE = BASE_DIR / 'tag_models' / 'jieba.cache'
+TOKEN_CACHE_SIZE = 10000
+
+# 商品列表/搜索的游标分页：默认每页条数，及 ?page_size= 允许的最大值
+PRODUCT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+# 个性化推荐结果缓存：每个用户缓存的排名商品数及缓存时间(秒)
+RECOMMENDATION_CACHE_SIZE = 500
+RECOMMENDATION_CACHE_TIMEOUT = 300
+
+# 偏好评分引擎（进程内稀疏矩阵）：增量刷新的最小间隔(秒)（目录版本变化时立即刷新），及全量重建的间隔(秒)（后台线程重建，期间沿用旧矩阵）
+SCORING_REFRESH_INTERVAL = 10
+SCORING_REBUILD_INTERVAL = 3600
+
+# 商品卡片片段缓存时间(秒)（键含商品行版本，商品变化后旧片段不再被读取，只是等待过期）
+PRODUCT_CARD_CACHE_TIMEOUT = 3600
+
+# JSON接口响应的 Cache-Control max-age(秒)；为0时缓存方每次用 If-None-Match 回源验证（命中时返回304）
+API_CACHE_MAX_AGE = 0
+
+# 搜索索引：文档总数/平均长度统计的缓存时间(秒)
+SEARCH_STATS_TIMEOUT = 300
+
+# 物品协同过滤：每个商品保留的相似商品数
+ITEM_CF_NEIGHBORS = 20
+
+# 购物车存储后端：SessionCartStore（会话，默认）或 CacheCartStore（Django缓存），及缓存购物车保留时间(秒)
+CART_STORE = 'product_management.services.cart_store.SessionCartStore'
+CART_CACHE_TIMEOUT = 7 * 86400
+
+# 请求指标（/metrics，Prometheus文本格式）：允许抓取的来源地址；
+# 多进程部署时设置 METRICS_DIR（各worker共享的目录），各进程每 METRICS_FLUSH_INTERVAL 秒写一次快照
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+METRICS_DIR = None
+METRICS_FLUSH_INTERVAL = 5
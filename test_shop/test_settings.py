@@ -0,0 +1,34 @@
+# test_shop/test_settings.py
+# 单元测试专用配置：文件SQLite测试库（多个连接可并发读写，库存并发测试得以运行）+ 本地内存缓存，不依赖MySQL
+# 运行: python manage.py test --settings=test_shop.test_settings
+import os
+import tempfile
+
+from test_shop.settings import *  # noqa: F401,F403
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(tempfile.gettempdir(), 'test_shop.sqlite3'),
+        'OPTIONS': {
+            # 写事务开始即加写锁，并发写入按顺序排队等待，而不是在升级锁时直接报 database is locked
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 30,
+        },
+        'TEST': {
+            # 指定文件名后测试库建在磁盘上（默认是每个连接各自独立的内存库）
+            'NAME': os.path.join(tempfile.gettempdir(), 'test_shop_tests.sqlite3'),
+        },
+    }
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tests',
+    }
+}
+REQUIRE_SHARED_CACHE = False  # 单进程运行，进程内缓存即可
+
+JIEBA_WARM_UP = False
+TAG_MODEL_DIR = os.path.join(tempfile.gettempdir(), 'test_shop_tag_models')